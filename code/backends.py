@@ -0,0 +1,329 @@
+import importlib.util
+import json
+import os
+import sys
+import time
+import colorful as cf
+import numpy as np
+from structs.zipcode import Zipcodes
+from conflicts import ConflictIndex
+from params import resolve_params
+
+cf.use_style('monokai')
+
+COST_GROUPS = ("expansion", "facility", "equip")
+
+
+class LinearModel:
+    '''
+    Solver-independent mixed-integer model in matrix form: column bounds,
+    integrality and objective coefficients plus sparse rows lo <= A x <= hi.
+    Variables are added in named families keyed like optimize.build_model, and
+    the objective is kept split into the expansion/facility/equip cost groups.
+    '''
+    def __init__(self, name="childcare_deserts"):
+        self.name = name
+        self.n_vars = 0
+        self.lb, self.ub, self.integer = [], [], []
+        self.families = {}
+        self.costs = {g: np.zeros(0) for g in COST_GROUPS}
+        self.n_rows = 0
+        self._rows, self._cols, self._vals = [], [], []
+        self.row_lo, self.row_hi = [], []
+
+    def add_vars(self, family, keys, lb=0.0, ub=np.inf, integer=True):
+        n = len(keys)
+        index = np.arange(self.n_vars, self.n_vars + n)
+        self.lb.append(np.broadcast_to(np.asarray(lb, dtype=float), (n,)))
+        self.ub.append(np.broadcast_to(np.asarray(ub, dtype=float), (n,)))
+        self.integer.append(np.full(n, integer))
+        self.families[family] = (index, list(keys))
+        self.n_vars += n
+        return index
+
+    def set_cost(self, group, index, coef):
+        cost = np.zeros(self.n_vars)
+        cost[:len(self.costs[group])] = self.costs[group]
+        cost[index] += coef
+        self.costs[group] = cost
+
+    def add_rows(self, rows, cols, vals, lo=-np.inf, hi=np.inf, n_rows=None):
+        '''
+        Append rows given as (local row, variable index, coefficient) triplets
+        '''
+        rows = np.asarray(rows, dtype=np.int64)
+        n_rows = int(rows.max()) + 1 if n_rows is None else n_rows
+        if n_rows == 0:
+            return
+        self._rows.append(rows + self.n_rows)
+        self._cols.append(np.asarray(cols, dtype=np.int64))
+        self._vals.append(np.broadcast_to(np.asarray(vals, dtype=float), rows.shape))
+        self.row_lo.append(np.broadcast_to(np.asarray(lo, dtype=float), (n_rows,)))
+        self.row_hi.append(np.broadcast_to(np.asarray(hi, dtype=float), (n_rows,)))
+        self.n_rows += n_rows
+
+    def arrays(self):
+        '''
+        Column bounds, integrality, objective, constraint matrix and row bounds
+        '''
+        import scipy.sparse as sp
+        cat = lambda parts: np.concatenate(parts) if parts else np.zeros(0)
+        A = sp.csr_matrix((cat(self._vals), (cat(self._rows).astype(np.int64), cat(self._cols).astype(np.int64))),
+                          shape=(self.n_rows, self.n_vars))
+        cost = sum(self._cost_vector(g) for g in COST_GROUPS)
+        return cat(self.lb), cat(self.ub), cat(self.integer).astype(bool), cost, A, cat(self.row_lo), cat(self.row_hi)
+
+    def _cost_vector(self, group):
+        cost = np.zeros(self.n_vars)
+        cost[:len(self.costs[group])] = self.costs[group]
+        return cost
+
+    def cost_breakdown(self, x):
+        return [float(self._cost_vector(g) @ x) for g in COST_GROUPS]
+
+    def values(self, x, family):
+        index, keys = self.families[family]
+        return dict(zip(keys, x[index].tolist()))
+
+    def stats(self):
+        integer = np.concatenate(self.integer) if self.integer else np.zeros(0, dtype=bool)
+        return {
+            "variables": self.n_vars,
+            "integer_variables": int(integer.sum()),
+            "constraints": self.n_rows,
+            "nonzeros": int(sum(len(r) for r in self._rows)),
+        }
+
+
+'''
+Part 1 or Part 2 model as a LinearModel. Same formulation as
+optimize.build_model_matrix with the big-M trigger, since indicator
+constraints are not available on every backend.
+'''
+def build_linear_model(zipcodes: Zipcodes, part2=False, zips=None, params=None, conflict_index=None,
+                       conflicts="pairwise"):
+    FACILITY_TYPES, ALPHA, BETA, DELTA, DIST_LIMIT = resolve_params(params)
+    # ---------- Index maps ----------
+    I = list(zipcodes.get_complete_data() if zips is None else zips)
+    arrays = zipcodes.get_arrays()
+    sizes = list(FACILITY_TYPES)
+    n_zip, n_size = len(I), len(sizes)
+    zip_idx = np.array([arrays["index"][i] for i in I], dtype=np.int64)
+    starts, stops = arrays["facility_offsets"][zip_idx], arrays["facility_offsets"][zip_idx + 1]
+    fac_pos = np.concatenate([np.arange(a, b) for a, b in zip(starts, stops)] + [np.zeros(0, dtype=np.int64)])
+    fac_ids = [arrays["facility_keys"][p] for p in fac_pos.tolist()]
+    fac_zip = np.repeat(np.arange(n_zip), stops - starts)
+    cap = np.asarray(arrays["facility_children_cap"], dtype=float)[fac_pos]
+    n_fac = len(fac_ids)
+
+    child_rhs = arrays["theta"][zip_idx] * arrays["population0_12"][zip_idx] - arrays["children_cap"][zip_idx]
+    infant_rhs = (2/3) * arrays["population0_5"][zip_idx] - arrays["infant_cap"][zip_idx]
+    size_cap = np.array([FACILITY_TYPES[s]["Cap"] for s in sizes], dtype=float)
+    size_cap05 = np.array([FACILITY_TYPES[s]["Cap05"] for s in sizes], dtype=float)
+    size_cost = np.array([FACILITY_TYPES[s]["Cost"] for s in sizes], dtype=float)
+
+    model = LinearModel()
+    limit = np.maximum(np.minimum((1.2 if part2 else 2.2) * cap, 500.0), cap)
+    fac = np.arange(n_fac)
+
+    # ---------- Decision variables ----------
+    # Expansion limits are column bounds
+    x = model.add_vars("x", fac_ids, ub=limit - cap)
+    u = model.add_vars("u", fac_ids)
+    if part2:
+        t = [model.add_vars(f"t{k + 1}", fac_ids, ub=share * cap) for k, share in enumerate((0.10, 0.05, 0.05))]
+        site_counts = np.diff(arrays["site_offsets"])[zip_idx]
+        site_offset = np.concatenate([[0], np.cumsum(site_counts)]).astype(np.int64)
+        n_site = int(site_offset[-1])
+        site_keys = [(i, l, s) for i, n in zip(I, site_counts.tolist()) for l in range(n) for s in sizes]
+        y = model.add_vars("y_site", site_keys, ub=1.0).reshape(n_site, n_size)
+        v = model.add_vars("v_site", site_keys).reshape(n_site, n_size)
+        # owning zipcode of each build variable
+        build_zip = np.repeat(np.repeat(np.arange(n_zip), np.diff(site_offset)), n_size)
+    else:
+        # off-branch x <= cap - 1e-3 has no integer solution when x >= cap is the only option
+        on, off, ub = np.ceil(cap), np.floor(cap - 1e-3), np.floor(limit - cap + 1e-9)
+        z = model.add_vars("z", fac_ids, ub=np.where(on > ub, 0.0, 1.0))
+        zip_keys = [(i, s) for i in I for s in sizes]
+        y = model.add_vars("y", zip_keys).reshape(n_zip, n_size)
+        v = model.add_vars("v", zip_keys).reshape(n_zip, n_size)
+        build_zip = np.repeat(np.arange(n_zip), n_size)
+
+    # ---------- Constraints ----------
+    if part2:
+        # x == t1 + t2 + t3
+        model.add_rows(np.tile(fac, 4), np.concatenate([x, *t]),
+                       np.concatenate([np.ones(n_fac), -np.ones(3 * n_fac)]), lo=0.0, hi=0.0, n_rows=n_fac)
+
+    # Coverage and 0–5 coverage
+    size_of = np.tile(np.arange(n_size), len(build_zip) // n_size if n_size else 0)
+    model.add_rows(np.concatenate([fac_zip, build_zip]), np.concatenate([x, y.ravel()]),
+                   np.concatenate([np.ones(n_fac), size_cap[size_of]]), lo=child_rhs, n_rows=n_zip)
+    model.add_rows(np.concatenate([fac_zip, build_zip]), np.concatenate([u, v.ravel()]),
+                   1.0, lo=infant_rhs, n_rows=n_zip)
+
+    # Consistency
+    model.add_rows(np.tile(fac, 2), np.concatenate([u, x]),
+                   np.concatenate([np.ones(n_fac), -np.ones(n_fac)]), hi=0.0, n_rows=n_fac)
+    rows = build_zip * n_size + size_of
+    model.add_rows(np.concatenate([rows, rows]), np.concatenate([v.ravel(), y.ravel()]),
+                   np.concatenate([np.ones(len(rows)), -size_cap05[size_of]]), hi=0.0, n_rows=n_zip * n_size)
+
+    if part2:
+        # site constraints
+        model.add_rows(np.repeat(np.arange(n_site), n_size), y.ravel(), 1.0, hi=1.0, n_rows=n_site)
+        # conflict rows: one per site pair and one per site/facility pair, or with
+        # conflicts="clique" one per maximal clique of conflicting sites
+        conflict_rows = []
+        conflict_index = conflict_index or ConflictIndex(zipcodes)
+        for k, i in enumerate(I):
+            base = site_offset[k]
+            rows = conflict_index.conflict_rows(i, DIST_LIMIT, conflicts)
+            conflict_rows += [tuple(base + l for l in row) for row in rows]
+        if conflict_rows:
+            r = np.repeat(np.arange(len(conflict_rows)), [len(row) for row in conflict_rows])
+            g = np.fromiter((g for row in conflict_rows for g in row), dtype=np.int64, count=len(r))
+            model.add_rows(np.repeat(r, n_size), y[g].ravel(), 1.0, hi=1.0, n_rows=len(conflict_rows))
+    else:
+        # Binary trigger (big-M)
+        model.add_rows(np.tile(fac, 2), np.concatenate([x, z]),
+                       np.concatenate([np.ones(n_fac), -on]), lo=0.0, n_rows=n_fac)
+        model.add_rows(np.tile(fac, 2), np.concatenate([x, z]),
+                       np.concatenate([np.ones(n_fac), -(ub - off)]), hi=off, n_rows=n_fac)
+
+    # ---------- Objective Function ----------
+    model.set_cost("facility", y.ravel(), size_cost[size_of])
+    model.set_cost("equip", np.concatenate([u, v.ravel()]), float(BETA))
+    if part2:
+        coef_base = 20000.0 / cap
+        model.set_cost("expansion", np.concatenate(t), np.concatenate([200.0 + coef_base, 400.0 + coef_base, 1000.0 + coef_base]))
+    else:
+        model.set_cost("expansion", np.concatenate([z, x]), np.concatenate([DELTA + 200.0 * cap, np.full(n_fac, float(ALPHA))]))
+    return model
+
+
+def _result(backend, status, objective, bound, gap, nodes, runtime, x, model):
+    return {
+        "backend": backend,
+        "status": status,
+        "objective": objective,
+        "bound": bound,
+        "gap": gap,
+        "nodes": nodes,
+        "runtime": runtime,
+        "costs": model.cost_breakdown(x) if x is not None else None,
+        "x": x,
+        **model.stats(),
+    }
+
+
+def solve_gurobi(model: LinearModel, threads=0, time_limit=None, mip_gap=None):
+    from gurobipy import Model, GRB
+    lb, ub, integer, cost, A, lo, hi = model.arrays()
+    m = Model(model.name)
+    m.Params.OutputFlag = 0
+    m.Params.Threads = threads
+    if time_limit is not None:
+        m.Params.TimeLimit = time_limit
+    if mip_gap is not None:
+        m.Params.MIPGap = mip_gap
+    x = m.addMVar(model.n_vars, lb=lb, ub=ub, obj=cost, vtype=np.where(integer, GRB.INTEGER, GRB.CONTINUOUS))
+    eq = lo == hi
+    for mask, sense, rhs in ((eq, "=", hi), (~eq & np.isfinite(hi), "<", hi), (~eq & np.isfinite(lo), ">", lo)):
+        if mask.any():
+            m.addMConstr(A[mask], x, sense, rhs[mask])
+    m.ModelSense = GRB.MINIMIZE
+    m.optimize()
+
+    status = {GRB.OPTIMAL: "optimal", GRB.INFEASIBLE: "infeasible", GRB.INF_OR_UNBD: "infeasible",
+              GRB.TIME_LIMIT: "time_limit"}.get(m.Status, str(m.Status))
+    has_sol = m.SolCount > 0
+    return _result("gurobi", status, m.ObjVal if has_sol else None, m.ObjBound if has_sol else None,
+                   m.MIPGap if has_sol else None, m.NodeCount, m.Runtime, x.X if has_sol else None, model)
+
+
+def solve_highs(model: LinearModel, threads=0, time_limit=None, mip_gap=None):
+    import highspy
+    lb, ub, integer, cost, A, lo, hi = model.arrays()
+    h = highspy.Highs()
+    h.setOptionValue("output_flag", False)
+    if threads:
+        h.setOptionValue("threads", threads)
+    if time_limit is not None:
+        h.setOptionValue("time_limit", float(time_limit))
+    if mip_gap is not None:
+        h.setOptionValue("mip_rel_gap", float(mip_gap))
+
+    lp = highspy.HighsLp()
+    lp.num_col_, lp.num_row_ = model.n_vars, model.n_rows
+    lp.col_cost_, lp.col_lower_, lp.col_upper_ = cost, lb, ub
+    lp.row_lower_, lp.row_upper_ = lo, hi
+    csc = A.tocsc()
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+    lp.a_matrix_.start_, lp.a_matrix_.index_, lp.a_matrix_.value_ = csc.indptr, csc.indices, csc.data
+    lp.integrality_ = [highspy.HighsVarType.kInteger if i else highspy.HighsVarType.kContinuous for i in integer]
+    h.passModel(lp)
+    h.run()
+
+    ms = h.getModelStatus()
+    status = {highspy.HighsModelStatus.kOptimal: "optimal", highspy.HighsModelStatus.kInfeasible: "infeasible",
+              highspy.HighsModelStatus.kTimeLimit: "time_limit"}.get(ms, h.modelStatusToString(ms))
+    info = h.getInfo()
+    has_sol = info.primal_solution_status == 2
+    x = np.array(h.getSolution().col_value) if has_sol else None
+    return _result("highs", status, info.objective_function_value if has_sol else None,
+                   info.mip_dual_bound if has_sol else None, info.mip_gap if has_sol else None,
+                   info.mip_node_count, h.getRunTime(), x, model)
+
+
+BACKENDS = {"gurobi": ("gurobipy", solve_gurobi), "highs": ("highspy", solve_highs)}
+
+
+def available_backends():
+    return [name for name, (module, _) in BACKENDS.items() if importlib.util.find_spec(module) is not None]
+
+
+'''
+Solve a LinearModel on the named backend
+'''
+def solve(model: LinearModel, backend="gurobi", threads=0, time_limit=None, mip_gap=None):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {list(BACKENDS)}")
+    return BACKENDS[backend][1](model, threads=threads, time_limit=time_limit, mip_gap=mip_gap)
+
+
+'''
+Build both parts once and solve them on each backend, collecting the solve
+statistics side by side
+'''
+def compare_backends(zipcodes: Zipcodes, backends=None, threads=0, time_limit=None):
+    results = []
+    for part2 in (False, True):
+        start = time.perf_counter()
+        model = build_linear_model(zipcodes, part2)
+        build_time = time.perf_counter() - start
+        for backend in backends or available_backends():
+            try:
+                r = solve(model, backend, threads=threads, time_limit=time_limit)
+                r.pop("x")
+            except Exception as e:
+                r = {"backend": backend, "status": "error", "objective": None, "runtime": 0.0, "nodes": 0,
+                     "error": repr(e), **model.stats()}
+            r.update({"part": 2 if part2 else 1, "build_time": build_time})
+            results.append(r)
+            objective = "n/a" if r["objective"] is None else f"${r['objective']:,.0f}"
+            print(cf.seaGreen(f"Part {r['part']} [{backend}] {r['status']}: ") + cf.bold(cf.yellow(objective))
+                  + cf.seaGreen(f" ({r['runtime']:.2f}s, {r['nodes']:.0f} nodes)"))
+    return results
+
+
+if __name__ == "__main__":
+    in_path = sys.argv[1]
+    backends = sys.argv[2].split(",") if len(sys.argv) > 2 else None
+
+    print(cf.bold(cf.seaGreen(f"Got zipcode data from: {cf.yellow(in_path)}")))
+    zipcodes = Zipcodes.load(in_path)
+    results = compare_backends(zipcodes, backends)
+    os.makedirs("./outputs", exist_ok=True)
+    with open(os.path.join("./outputs", "backend_stats.json"), "w") as f:
+        json.dump(results, f, indent=2)
@@ -0,0 +1,218 @@
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import colorful as cf
+from report import peak_rss_mb, reset_peak_rss, window_rss_mb
+
+cf.use_style('monokai')
+
+DEFAULT_BASELINE = "./benchmarks/baseline.json"
+REPEAT = 3                # each stage is timed best of this many runs
+TIME_TOLERANCE = 0.5      # flag stages more than 50% slower than the baseline...
+MIN_SECONDS = 0.1         # ...and slower by at least this much, to ignore timer noise
+MEMORY_TOLERANCE = 0.25   # flag peak RSS more than 25% above the baseline
+
+
+def case_key(n_zips, states):
+    return f"{'+'.join(states)}:{n_zips}"
+
+
+'''
+Run every pipeline stage on a fresh synthetic dataset and record wall time
+and peak RSS of each stage. Each stage runs repeat times and keeps its best
+time, as cli.py startup does for imports; memory is taken from the first
+run, before the allocator has been warmed by the stage itself. Meant to run
+in its own process so the peak RSS belongs to this size alone. Where the
+kernel lets the peak be reset (Linux), each stage's peak_rss_mb is its own
+and rss_growth_mb is how far it rose above the RSS at the stage start;
+elsewhere peak_rss_mb is the process peak so far and peak_rss_scope says so.
+'''
+def run_case(n_zips, states, seed=0, solve_backend=None, time_limit=None, repeat=REPEAT):
+    from synthetic import generate
+    from create_zipcodes import find_zipcode_union, build_filled_zip_dict_indexed
+    from structs.zipcode import Zipcodes
+    from conflicts import ConflictIndex
+    from params import DIST_LIMIT
+    from backends import build_linear_model, solve
+    import heuristic
+
+    stages = {}
+    per_stage = reset_peak_rss()
+
+    def measure(name, fn):
+        result = None
+        for run in range(repeat):
+            # drop the previous run's result so it does not count toward this run's peak
+            result = None
+            gc.collect()
+            if per_stage:
+                reset_peak_rss()
+                start_rss = window_rss_mb()["current"]
+            start = time.perf_counter()
+            result = fn()
+            seconds = time.perf_counter() - start
+            if run > 0:
+                stages[name]["seconds"] = min(stages[name]["seconds"], seconds)
+                continue
+            stages[name] = {"seconds": seconds}
+            if per_stage:
+                peak = window_rss_mb()["peak"]
+                stages[name].update({"peak_rss_mb": peak, "rss_growth_mb": peak - start_rss})
+            else:
+                stages[name]["peak_rss_mb"] = peak_rss_mb()["self"]
+        return result
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = os.path.join(tmp, "data")
+        counts = measure("generate", lambda: generate(data_dir, n_zips, states=tuple(states), seed=seed))
+        file_map = {
+            os.path.join(data_dir, "avg_individual_income.csv"): "ZIP code",
+            os.path.join(data_dir, "child_care_regulated.csv"): "zip_code",
+            os.path.join(data_dir, "employment_rate.csv"): "zipcode",
+            os.path.join(data_dir, "population.csv"): "zipcode",
+            os.path.join(data_dir, "potential_locations.csv"): "zipcode",
+        }
+        _, all_zips = measure("union", lambda: find_zipcode_union(file_map))
+        zipcodes = measure("assemble", lambda: build_filled_zip_dict_indexed(all_zips, data_dir))
+        json_path, columnar_path = os.path.join(tmp, "zipcodes.json"), os.path.join(tmp, "zipcodes.columnar")
+        measure("save_json", lambda: zipcodes.save(json_path))
+        measure("save_columnar", lambda: zipcodes.save(columnar_path))
+        # loading is lazy, so each format is timed up to a built Part 1 model
+        for fmt, path in (("json", json_path), ("columnar", columnar_path)):
+            measure(f"load_build_{fmt}", lambda: build_linear_model(Zipcodes.load(path)))
+        # arrays and conflicts are cached once found, so every run starts from a fresh object
+        zipcodes = Zipcodes.load(columnar_path)
+        measure("arrays", lambda: Zipcodes.load(columnar_path).get_arrays())
+        keys = zipcodes.get_complete_data()
+
+        def find_conflicts():
+            conflict_index = ConflictIndex(zipcodes)
+            conflict_index.precompute(keys, DIST_LIMIT)
+            return conflict_index
+
+        conflict_index = measure("conflicts", find_conflicts)
+        models = {}
+        for part in (1, 2):
+            models[part] = measure(f"build_part{part}", lambda: build_linear_model(
+                zipcodes, part2=(part == 2), conflict_index=conflict_index))
+            measure(f"heuristic_part{part}", lambda: heuristic.solve(zipcodes, part2=(part == 2)))
+        if solve_backend:
+            for part in (1, 2):
+                r = measure(f"solve_part{part}", lambda: solve(models[part], solve_backend, time_limit=time_limit))
+                stages[f"solve_part{part}"].update({"status": r["status"], "objective": r["objective"]})
+
+        counts.update({f"part{part}_{k}": v for part in (1, 2) for k, v in models[part].stats().items()})
+    return {"counts": counts, "peak_rss_scope": "stage" if per_stage else "process", "stages": stages}
+
+
+'''
+Run each case in a fresh worker process, one at a time so timings do not compete
+'''
+def run_benchmarks(sizes, states, seed=0, solve_backend=None, time_limit=None, repeat=REPEAT):
+    results = {}
+    for n_zips in sizes:
+        key = case_key(n_zips, states)
+        print(cf.bold(cf.seaGreen(f"Benchmarking {cf.yellow(key)}")))
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results[key] = pool.submit(run_case, n_zips, states, seed, solve_backend, time_limit, repeat).result()
+    return {
+        "meta": {"python": platform.python_version(), "machine": platform.machine(), "platform": platform.platform(),
+                 "cpus": os.cpu_count(), "seed": seed, "solve_backend": solve_backend, "repeat": repeat,
+                 "date": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": results,
+    }
+
+
+'''
+Stages slower or heavier than the baseline beyond the tolerances
+'''
+def find_regressions(current, baseline, time_tolerance=TIME_TOLERANCE, memory_tolerance=MEMORY_TOLERANCE,
+                     min_seconds=MIN_SECONDS):
+    regressions = []
+    for key, case in current["results"].items():
+        base_case = baseline.get("results", {}).get(key)
+        if base_case is None:
+            continue
+        # process-wide peaks only ever rise, so they say nothing about later stages
+        compare_memory = case.get("peak_rss_scope") == base_case.get("peak_rss_scope") == "stage"
+        for stage, now in case["stages"].items():
+            base = base_case["stages"].get(stage)
+            if base is None:
+                continue
+            if now["seconds"] > base["seconds"] * (1 + time_tolerance) and now["seconds"] - base["seconds"] > min_seconds:
+                regressions.append({"case": key, "stage": stage, "metric": "seconds",
+                                    "baseline": base["seconds"], "current": now["seconds"]})
+            if compare_memory and now["peak_rss_mb"] > base["peak_rss_mb"] * (1 + memory_tolerance):
+                regressions.append({"case": key, "stage": stage, "metric": "peak_rss_mb",
+                                    "baseline": base["peak_rss_mb"], "current": now["peak_rss_mb"]})
+    return regressions
+
+
+def print_results(current, baseline=None):
+    for key, case in current["results"].items():
+        base_case = (baseline or {}).get("results", {}).get(key, {}).get("stages", {})
+        counts = case["counts"]
+        print(cf.bold(cf.seaGreen(f"===== {key}: {counts['facilities']} facilities, {counts['sites']} sites =====")))
+        for stage, now in case["stages"].items():
+            line = cf.yellow(f"  {stage:<20}") + cf.bold(f"{now['seconds']:>8.3f}s") + f"  {now['peak_rss_mb']:>8.1f} MB"
+            if "rss_growth_mb" in now:
+                line += f" (+{now['rss_growth_mb']:.1f})"
+            if stage in base_case:
+                ratio = now["seconds"] / max(base_case[stage]["seconds"], 1e-9)
+                line += f"   x{ratio:.2f} vs baseline"
+            print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time each pipeline stage on synthetic datasets of several sizes")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[250, 1000, 2000], help="Number of ZIPs per case")
+    parser.add_argument("--states", nargs="+", default=["NY"], help="States the ZIPs are spread over")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--solve", default=None, choices=["gurobi", "highs"], help="Also solve both parts on this backend")
+    parser.add_argument("--time-limit", type=float, default=None)
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="Time each stage best of this many runs")
+    parser.add_argument("--out", default="./outputs/benchmark.json")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    current = run_benchmarks(args.sizes, args.states, args.seed, args.solve, args.time_limit, args.repeat)
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_results(current, baseline)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(current, f, indent=2)
+    print(cf.bold(cf.seaGreen(f"Saved results to: {cf.yellow(args.out)}")))
+
+    if args.save_baseline:
+        if baseline is not None:
+            # keep baseline cases that were not rerun
+            baseline["results"].update(current["results"])
+            baseline["meta"] = current["meta"]
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline or current, f, indent=2)
+        print(cf.bold(cf.seaGreen(f"Saved baseline to: {cf.yellow(args.baseline)}")))
+    elif baseline is not None:
+        if baseline["meta"].get("repeat", 1) != args.repeat:
+            print(cf.orange(f"Baseline stages were timed best of {baseline['meta'].get('repeat', 1)}, "
+                            f"these best of {args.repeat}"))
+        regressions = find_regressions(current, baseline)
+        for r in regressions:
+            print(cf.orange(f"REGRESSION {r['case']} {r['stage']} {r['metric']}: "
+                            f"{r['baseline']:.3f} -> {r['current']:.3f}"))
+        if regressions:
+            sys.exit(1)
+        print(cf.bold(cf.seaGreen("No regressions against the baseline")))
@@ -0,0 +1,119 @@
+import json
+import os
+import sqlite3
+import time
+
+DEFAULT_CACHE_PATH = "./outputs/cache/census.sqlite"
+DEFAULT_TTL_DAYS = 365
+DEFAULT_MAX_ENTRIES = 200000
+
+
+class CacheMiss(RuntimeError):
+    pass
+
+
+class ResponseCache:
+    '''
+    Persistent SQLite store of Census API rows keyed by endpoint, variables and
+    ZCTA. An empty row records that the API had no data for that ZCTA. Entries
+    expire after ttl_seconds; once max_entries is exceeded the least recently
+    used rows are evicted. In offline mode a miss raises CacheMiss instead of
+    letting the caller go to the network.
+    '''
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=DEFAULT_TTL_DAYS * 86400,
+                 max_entries=DEFAULT_MAX_ENTRIES, offline=False):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, row TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self.conn.commit()
+
+    @classmethod
+    def from_env(cls):
+        '''
+        CENSUS_CACHE=off disables caching; CENSUS_CACHE_PATH, CENSUS_CACHE_TTL_DAYS,
+        CENSUS_CACHE_MAX_ENTRIES and CENSUS_OFFLINE=1 configure it
+        '''
+        if os.getenv("CENSUS_CACHE", "on").lower() in ("off", "0", "false"):
+            return None
+        return cls(
+            path=os.getenv("CENSUS_CACHE_PATH", DEFAULT_CACHE_PATH),
+            ttl_seconds=float(os.getenv("CENSUS_CACHE_TTL_DAYS", DEFAULT_TTL_DAYS)) * 86400,
+            max_entries=int(os.getenv("CENSUS_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+            offline=os.getenv("CENSUS_OFFLINE", "0").lower() in ("1", "true", "yes"),
+        )
+
+    @staticmethod
+    def make_key(endpoint, variables, zcta):
+        return json.dumps([endpoint, list(variables), zcta])
+
+    def get_many(self, endpoint, variables, zctas):
+        '''
+        Cached rows for the given ZCTAs and the list of ZCTAs that missed
+        '''
+        now = time.time()
+        found, missing = {}, []
+        for zcta in zctas:
+            key = self.make_key(endpoint, variables, zcta)
+            record = self.conn.execute("SELECT row, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if record is not None and now - record[1] <= self.ttl_seconds:
+                self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                found[zcta] = json.loads(record[0])
+                self.hits += 1
+            else:
+                if record is not None:
+                    self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                missing.append(zcta)
+                self.misses += 1
+        self.conn.commit()
+        if missing and self.offline:
+            raise CacheMiss(f"{len(missing)} Census lookups not cached for {endpoint} (offline mode), e.g. {missing[:5]}")
+        return found, missing
+
+    def get(self, endpoint, variables, zcta):
+        found, _ = self.get_many(endpoint, variables, [zcta])
+        return found.get(zcta)
+
+    def put_many(self, endpoint, variables, rows):
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO responses (key, row, created, accessed) VALUES (?, ?, ?, ?)",
+            [(self.make_key(endpoint, variables, zcta), json.dumps(row), now, now) for zcta, row in rows.items()],
+        )
+        self._evict()
+        self.conn.commit()
+
+    def put(self, endpoint, variables, zcta, row):
+        self.put_many(endpoint, variables, {zcta: row})
+
+    def _evict(self):
+        count = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self.conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed LIMIT ?)",
+                (excess,),
+            )
+            self.evictions += excess
+
+    def clear(self):
+        self.conn.execute("DELETE FROM responses")
+        self.conn.commit()
+
+    def stats(self):
+        entries = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "entries": entries}
+
+    def close(self):
+        self.conn.close()
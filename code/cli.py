@@ -0,0 +1,140 @@
+import argparse
+import os
+import subprocess
+import sys
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODES = ["monolithic", "matrix", "decomposed", "compare", "session", "bigm", "trigger-bench", "conflict-bench",
+         "heuristic", "anytime"]
+
+# Import time budget per subcommand in ms, measured with `python ./code/cli.py startup`.
+# Each subcommand only imports its own module; solver, plotting, pandas and map
+# libraries load on the code paths that use them.
+STARTUP_BUDGET_MS = {
+    "cli": 25,
+    "build": 200,
+    "fetch": 250,
+    "optimize": 200,
+    "map": 150,
+    "zcta": 50,
+}
+STARTUP_MODULES = {
+    "cli": "cli",
+    "build": "create_zipcodes",
+    "fetch": "fetch_data_api",
+    "optimize": "optimize",
+    "map": "map.create_map",
+    "zcta": "map.zcta_cache",
+}
+
+
+def run_build(args):
+    import create_zipcodes
+    create_zipcodes.main([args.out_path] + (["--compare"] if args.compare else []) +
+                         (["--stream"] if args.stream else []) + [f"--chunk-rows={args.chunk_rows}"] +
+                         ([f"--processes={args.processes}"] if args.processes else []))
+
+
+def run_fetch(args):
+    import fetch_data_api
+    fetch_data_api.main([args.in_path] + args.out_paths)
+
+
+def run_optimize(args):
+    import optimize
+    optimize.main([args.data_path, str(args.bin_size), args.plot, args.mode,
+                   "" if args.time_limit is None else str(args.time_limit),
+                   "" if args.mip_gap is None else str(args.mip_gap)])
+
+
+def run_map(args):
+    from map import create_map
+    create_map.main([args.data_path, args.zcta_path, str(args.max_zoom)])
+
+
+def run_zcta(args):
+    from map import zcta_cache
+    zcta_cache.main([args.zcta_path, args.out or "", str(args.max_zoom)])
+
+
+'''
+Cumulative import time in ms of a module in a fresh interpreter, from -X importtime
+'''
+def import_time_ms(module):
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=CODE_DIR, capture_output=True, text=True, check=True)
+    for line in reversed(proc.stderr.splitlines()):
+        _, _, cumulative, name = (part.strip() for part in line.replace("|", ":", 2).split(":", 3))
+        if name == module:
+            return int(cumulative) / 1000
+    raise RuntimeError(f"No import time reported for {module}")
+
+
+def run_startup(args):
+    over = []
+    for command, module in STARTUP_MODULES.items():
+        # best of a few runs, the first one also pays for cold file caches
+        ms = min(import_time_ms(module) for _ in range(args.repeat))
+        budget = STARTUP_BUDGET_MS[command]
+        print(f"{command:<10}{module:<18}{ms:>8.1f} ms   budget {budget} ms" + ("   OVER" if ms > budget else ""))
+        if ms > budget:
+            over.append(command)
+    if over:
+        sys.exit(1)
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Childcare desert pipeline")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("build", help="Assemble the zipcode dataset from ./data")
+    p.add_argument("out_path")
+    p.add_argument("--compare", action="store_true",
+                   help="Check the indexed and streaming (--chunk-rows) builders against the per-ZIP one")
+    p.add_argument("--stream", action="store_true", help="Read the facility and site files in chunks")
+    p.add_argument("--chunk-rows", type=int, default=50000)
+    p.add_argument("--processes", type=int, default=None, help="Assemble the ZIPs in this many worker processes")
+    p.set_defaults(run=run_build)
+
+    p = sub.add_parser("fetch", help="Fill missing values from the Census API")
+    p.add_argument("in_path")
+    p.add_argument("out_paths", nargs="+", help=".json paths are written as JSON, others as columnar directories")
+    p.set_defaults(run=run_fetch)
+
+    p = sub.add_parser("optimize", help="Solve Part 1 and Part 2")
+    p.add_argument("data_path")
+    p.add_argument("--bin-size", type=int, default=20)
+    p.add_argument("--plot", default="false", choices=["true", "preview", "false"])
+    p.add_argument("--mode", default="monolithic", choices=MODES)
+    p.add_argument("--time-limit", type=float, default=None,
+                   help="Wall-clock budget in seconds for both parts, builds included (anytime default 600; "
+                        "not in decomposed or benchmark modes)")
+    p.add_argument("--mip-gap", type=float, default=None,
+                   help="Target relative MIP gap (anytime default 0.01; not in decomposed or benchmark modes)")
+    p.set_defaults(run=run_optimize)
+
+    p = sub.add_parser("map", help="Draw the ZIP coverage map")
+    p.add_argument("data_path")
+    p.add_argument("zcta_path", help="ZCTA shapefile, or a cache written by the zcta subcommand")
+    p.add_argument("--max-zoom", type=int, default=10, help="Zoom level the simplified outlines are exact at")
+    p.set_defaults(run=run_map)
+
+    p = sub.add_parser("zcta", help="Clip and simplify the ZCTA shapefile into a cache for the map")
+    p.add_argument("zcta_path")
+    p.add_argument("--out", default=None, help="Cache path, .parquet or .geojson")
+    p.add_argument("--max-zoom", type=int, default=10, help="Zoom level the simplified outlines are exact at")
+    p.set_defaults(run=run_zcta)
+
+    p = sub.add_parser("startup", help="Check each subcommand's import time against its budget")
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(run=run_startup)
+    return parser
+
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+import hashlib
+import json
+import os
+from collections import defaultdict
+import numpy as np
+from structs.zipcode import Zipcodes
+
+EARTH_RADIUS_MILES = 3958.8
+CONFLICT_CACHE_DIR = "./outputs/cache/conflicts"
+
+
+'''
+Vectorized version of Zipcodes._haversine_miles over NumPy arrays
+'''
+def haversine_miles(lat1, lon1, lat2, lon2):
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = np.radians(np.subtract(lat2, lat1))
+    dlambda = np.radians(np.subtract(lon2, lon1))
+    a = np.sin(dphi / 2.0) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2.0) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return EARTH_RADIUS_MILES * c
+
+
+'''
+Project latitude/longitude onto the unit sphere so Euclidean KD-tree queries
+can stand in for great-circle ones
+'''
+def _unit_vectors(lat, lon):
+    phi, lam = np.radians(lat), np.radians(lon)
+    return np.column_stack([np.cos(phi) * np.cos(lam), np.cos(phi) * np.sin(lam), np.sin(phi)])
+
+
+'''
+Chord length on the unit sphere for a great-circle distance in miles, padded so
+the tree query returns a superset of the exact haversine matches
+'''
+def _chord_radius(dist_limit):
+    return 2.0 * np.sin(dist_limit / (2.0 * EARTH_RADIUS_MILES)) * (1.0 + 1e-9) + 1e-12
+
+
+'''
+Hash of everything the conflicts depend on: the zipcodes, and the site and
+facility coordinates and facility ids of each, in order
+'''
+def coordinates_hash(zipcodes: Zipcodes, keys):
+    h = hashlib.sha256()
+    for key in sorted(keys):
+        site_lat, site_lon = zipcodes.get_site_coordinates(key)
+        fac_lat, fac_lon = zipcodes.get_facility_coordinates(key)
+        h.update(json.dumps([key, len(site_lat), [str(f) for f in zipcodes.get_facility_ids(key)]]).encode())
+        h.update(np.column_stack([site_lat, site_lon]).astype(float).tobytes())
+        h.update(np.column_stack([fac_lat, fac_lon]).astype(float).tobytes())
+    return h.hexdigest()
+
+
+'''
+Maximal cliques with at least two sites of the graph given by its edge list
+(Bron–Kerbosch with pivoting), as sorted tuples in sorted order. Every edge
+lies in at least one of them, so one row per clique replaces the pair rows.
+'''
+def maximal_cliques(pairs):
+    adj = defaultdict(set)
+    for a, b in pairs:
+        adj[a].add(b)
+        adj[b].add(a)
+    cliques = []
+
+    def expand(clique, candidates, excluded):
+        if not candidates and not excluded:
+            if len(clique) > 1:
+                cliques.append(tuple(sorted(clique)))
+            return
+        pivot = max(candidates | excluded, key=lambda v: len(adj[v] & candidates))
+        for v in sorted(candidates - adj[pivot]):
+            expand(clique + [v], candidates & adj[v], excluded & adj[v])
+            candidates = candidates - {v}
+            excluded = excluded | {v}
+
+    expand([], set(adj), set())
+    return sorted(cliques)
+
+
+class ConflictIndex:
+    '''
+    Per-zipcode KD-trees over potential sites and existing facilities. Trees are
+    built once per zipcode, so re-querying with a different radius is cheap, and
+    the pairs found for each (zipcode, radius) are kept for later calls.
+    '''
+    def __init__(self, zipcodes: Zipcodes):
+        self.zipcodes = zipcodes
+        self._cache = {}
+        self._pairs = {}
+        self._cliques = {}
+
+    def _zip_index(self, key):
+        if key not in self._cache:
+            from scipy.spatial import cKDTree
+            site_lat, site_lon = (np.asarray(c, dtype=float) for c in self.zipcodes.get_site_coordinates(key))
+            fac_lat, fac_lon = (np.asarray(c, dtype=float) for c in self.zipcodes.get_facility_coordinates(key))
+            fac_ids = self.zipcodes.get_facility_ids(key)
+            site_tree = cKDTree(_unit_vectors(site_lat, site_lon)) if len(site_lat) else None
+            fac_tree = cKDTree(_unit_vectors(fac_lat, fac_lon)) if len(fac_ids) else None
+            self._cache[key] = (site_lat, site_lon, site_tree, fac_ids, fac_lat, fac_lon, fac_tree)
+        return self._cache[key]
+
+    def conflicts(self, key, dist_limit):
+        '''
+        Site pairs (a, b) with a < b and site/facility pairs (l, f) closer than
+        dist_limit, in the same order as the nested-loop search
+        '''
+        if (key, dist_limit) in self._pairs:
+            return self._pairs[key, dist_limit]
+        site_lat, site_lon, site_tree, fac_ids, fac_lat, fac_lon, fac_tree = self._zip_index(key)
+        radius = _chord_radius(dist_limit)
+
+        site_pairs = []
+        if site_tree is not None and len(site_lat) > 1:
+            pairs = site_tree.query_pairs(radius, output_type="ndarray")
+            if len(pairs):
+                a, b = pairs[:, 0], pairs[:, 1]
+                keep = haversine_miles(site_lat[a], site_lon[a], site_lat[b], site_lon[b]) < dist_limit
+                pairs = pairs[keep]
+                pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+                site_pairs = [(int(a), int(b)) for a, b in pairs]
+
+        facility_pairs = []
+        if site_tree is not None and fac_tree is not None:
+            near = site_tree.sparse_distance_matrix(fac_tree, radius, output_type="ndarray")
+            if len(near):
+                l, f = near["i"], near["j"]
+                keep = haversine_miles(site_lat[l], site_lon[l], fac_lat[f], fac_lon[f]) < dist_limit
+                l, f = l[keep], f[keep]
+                order = np.lexsort((f, l))
+                facility_pairs = [(int(l[k]), fac_ids[f[k]]) for k in order]
+
+        self._pairs[key, dist_limit] = (site_pairs, facility_pairs)
+        return site_pairs, facility_pairs
+
+    def cliques(self, key, dist_limit):
+        '''
+        Maximal cliques of the zipcode's site conflict graph
+        '''
+        if (key, dist_limit) not in self._cliques:
+            self._cliques[key, dist_limit] = maximal_cliques(self.conflicts(key, dist_limit)[0])
+        return self._cliques[key, dist_limit]
+
+    def conflict_rows(self, key, dist_limit, mode="pairwise"):
+        '''
+        Groups of sites of which at most one may get a new build. "pairwise" is one
+        group per site pair plus one single-site group per site/facility pair.
+        "clique" is one group per maximal clique; the single-site groups are left
+        out because one_size already allows at most one build per site.
+        '''
+        if mode == "clique":
+            return self.cliques(key, dist_limit)
+        site_pairs, facility_pairs = self.conflicts(key, dist_limit)
+        return list(site_pairs) + [(l,) for l, _ in facility_pairs]
+
+    def precompute(self, keys, dist_limit):
+        '''
+        Find the conflicts of every zipcode up front; returns the number of
+        site pairs and site/facility pairs
+        '''
+        n_site = n_facility = 0
+        for key in keys:
+            site_pairs, facility_pairs = self.conflicts(key, dist_limit)
+            n_site += len(site_pairs)
+            n_facility += len(facility_pairs)
+        return n_site, n_facility
+
+    def artifact_path(self, keys, dist_limit, cache_dir=CONFLICT_CACHE_DIR):
+        return os.path.join(cache_dir, f"conflicts_{coordinates_hash(self.zipcodes, keys)[:20]}_{dist_limit!r}.npz")
+
+    def save(self, path, keys, dist_limit):
+        '''
+        Store the conflicts of keys as two CSR adjacencies over all sites, numbered
+        zipcode by zipcode: site -> later conflicting sites, and site -> positions
+        of conflicting facilities in the zipcode's childcare_dict
+        '''
+        keys = sorted(keys)
+        site_counts = np.array([self.zipcodes.get_site_count(key) for key in keys], dtype=np.int64)
+        site_start = np.concatenate([[0], np.cumsum(site_counts)]).astype(np.int64)
+        site_rows, site_cols, fac_rows, fac_cols = [], [], [], []
+        for k, key in enumerate(keys):
+            site_pairs, facility_pairs = self.conflicts(key, dist_limit)
+            position = {f: n for n, f in enumerate(self.zipcodes.get_facility_ids(key))}
+            site_rows += [site_start[k] + a for a, _ in site_pairs]
+            site_cols += [b for _, b in site_pairs]
+            fac_rows += [site_start[k] + l for l, _ in facility_pairs]
+            fac_cols += [position[f] for _, f in facility_pairs]
+
+        def indptr(rows):
+            return np.concatenate([[0], np.cumsum(np.bincount(np.array(rows, dtype=np.int64),
+                                                              minlength=site_start[-1]))]).astype(np.int64)
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # write to a temporary name first so concurrent runs never read half a file
+        tmp = f"{path[:-len('.npz')]}.{os.getpid()}.tmp.npz"
+        np.savez(tmp, keys=np.array(keys, dtype=str), dist_limit=dist_limit, site_start=site_start,
+                 site_indptr=indptr(site_rows), site_indices=np.array(site_cols, dtype=np.int32),
+                 facility_indptr=indptr(fac_rows), facility_indices=np.array(fac_cols, dtype=np.int32))
+        os.replace(tmp, path)
+        return path
+
+    def load(self, path):
+        '''
+        Fill the pair cache from an artifact written by save(); returns the
+        number of site pairs and site/facility pairs
+        '''
+        with np.load(path) as artifact:
+            keys = artifact["keys"].tolist()
+            dist_limit = artifact["dist_limit"].item()
+            site_start = artifact["site_start"]
+            site_indptr, site_indices = artifact["site_indptr"], artifact["site_indices"]
+            fac_indptr, fac_indices = artifact["facility_indptr"], artifact["facility_indices"]
+
+        def rows(indptr, lo, hi):
+            return (np.repeat(np.arange(lo, hi), np.diff(indptr[lo:hi + 1])) - lo).tolist()
+
+        for k, key in enumerate(keys):
+            lo, hi = site_start[k], site_start[k + 1]
+            fac_ids = self.zipcodes.get_facility_ids(key)
+            site_pairs = list(zip(rows(site_indptr, lo, hi), site_indices[site_indptr[lo]:site_indptr[hi]].tolist()))
+            facility_pairs = list(zip(rows(fac_indptr, lo, hi),
+                                      [fac_ids[n] for n in fac_indices[fac_indptr[lo]:fac_indptr[hi]]]))
+            self._pairs[key, dist_limit] = (site_pairs, facility_pairs)
+        return len(site_indices), len(fac_indices)
+
+    def precompute_cached(self, keys, dist_limit, cache_dir=CONFLICT_CACHE_DIR):
+        '''
+        precompute() backed by an artifact keyed by the coordinates hash and the
+        radius, so any change to the inputs picks a new file. Returns the pair
+        counts, the artifact path and whether it was loaded from disk.
+        '''
+        path = self.artifact_path(keys, dist_limit, cache_dir)
+        if os.path.exists(path):
+            return (*self.load(path), path, True)
+        n_site, n_facility = self.precompute(keys, dist_limit)
+        self.save(path, keys, dist_limit)
+        return n_site, n_facility, path, False
+
+
+'''
+Reference nested-loop search using the scalar Zipcodes distance helpers
+'''
+def site_conflicts_bruteforce(zipcodes: Zipcodes, key, dist_limit):
+    locs = zipcodes.data[key]["potential_locations"]
+    site_pairs = []
+    for a in range(len(locs)):
+        for b in range(a + 1, len(locs)):
+            if zipcodes.get_site_distance(key, a, b) < dist_limit:
+                site_pairs.append((a, b))
+    facility_pairs = []
+    for l in range(len(locs)):
+        for f in zipcodes.data[key]["childcare_dict"]:
+            if zipcodes.get_distance_to_facility(key, l, f) < dist_limit:
+                facility_pairs.append((l, f))
+    return site_pairs, facility_pairs
+
+
+'''
+Zipcodes whose spatial-index conflicts differ from the nested-loop search
+'''
+def check_conflicts(zipcodes: Zipcodes, dist_limit, zips=None):
+    index = ConflictIndex(zipcodes)
+    keys = zipcodes.get_complete_data() if zips is None else zips
+    return [key for key in keys
+            if index.conflicts(key, dist_limit) != site_conflicts_bruteforce(zipcodes, key, dist_limit)]
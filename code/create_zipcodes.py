@@ -1,22 +1,30 @@
 import colorful as cf
 from tqdm import tqdm
 import numpy as np
-from utils import load_csv, normalize_zip
+from utils import infer_csv_dtypes, iter_csv, load_csv
 from structs.zipcode import Zipcodes
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
 import sys
+import time
 cf.use_style('monokai')
 
+# Rows per chunk when streaming the facility and site files
+CHUNK_ROWS = 50000
+
 
 '''
-Finds all NY zipcodes
+Finds all NY zipcodes, reading chunk_rows rows at a time when given
 '''
-def find_zipcode_union(map):
-    all_zips = set()
-    for fname, zcol in map.items():
-        df = load_csv(fname, zcol)
-        for v in df[zcol].dropna().astype(str):
-            nz = normalize_zip(v)
-            all_zips.add(nz)
+def find_zipcode_union(map, chunk_rows=None):
+    if chunk_rows is None:
+        zip_arrays = [load_csv(fname, zcol, usecols=[zcol])[zcol].unique() for fname, zcol in map.items()]
+    else:
+        zip_arrays = [chunk[zcol].unique() for fname, zcol in map.items()
+                      for chunk in iter_csv(fname, zcol, chunk_rows, usecols=[zcol])]
+    all_zips = set(np.unique(np.concatenate(zip_arrays)).tolist()) if zip_arrays else set()
     return len(all_zips), all_zips
 
 
@@ -122,7 +130,248 @@ def build_filled_zip_dict(valid_zips):
     return zipcodes
 
 
-if __name__ == "__main__":
+'''
+Loads the facility and site files whole, indexed by normalized zipcode
+'''
+def load_grouped_frames(data_dir="./data"):
+    child_care_df = load_csv(os.path.join(data_dir, "child_care_regulated.csv"), "zip_code")
+    potent_care_df = load_csv(os.path.join(data_dir, "potential_locations.csv"), "zipcode")
+    return child_care_df.set_index("zip_code"), potent_care_df.set_index("zipcode")
+
+
+'''
+Loads the one-row-per-zipcode sources whole. They are small even for many
+states; the facility and site files are streamed instead.
+'''
+def load_zip_tables(data_dir="./data"):
+    return {
+        "income": load_csv(os.path.join(data_dir, "avg_individual_income.csv"), "ZIP code",
+                           usecols=["average income"]).set_index("ZIP code"),
+        "employment": load_csv(os.path.join(data_dir, "employment_rate.csv"), "zipcode",
+                               usecols=["employment rate"]).set_index("zipcode"),
+        "population": load_csv(os.path.join(data_dir, "population.csv"), "zipcode",
+                               usecols=["-5", "5-9", "10-14"]).set_index("zipcode"),
+    }
+
+
+'''
+Loads every source file once and indexes it by normalized zipcode
+'''
+def load_sources(data_dir="./data"):
+    child_care_df, potent_care_df = load_grouped_frames(data_dir)
+    return index_sources(load_zip_tables(data_dir), child_care_df, potent_care_df)
+
+
+'''
+One groupby pass per multi-row source; each group keeps the frame's dtypes
+'''
+def index_sources(tables, child_care_df, potent_care_df):
+    return {
+        **tables,
+        "childcare": {zip_id: rows for zip_id, rows in child_care_df.groupby(level=0, sort=False)},
+        "potential": {zip_id: rows for zip_id, rows in potent_care_df.groupby(level=0, sort=False)},
+    }
+
+
+'''
+Converts one zipcode's existing childcare rows into the facility dictionary
+'''
+def childcare_rows_to_dict(child_care_rows):
+    child_care_rows = child_care_rows.copy()
+    num_cols = child_care_rows.select_dtypes(include=[np.number]).columns
+    child_care_rows[num_cols] = child_care_rows[num_cols].fillna(0)
+    obj_cols = child_care_rows.select_dtypes(include=["object"]).columns
+    child_care_rows[obj_cols] = child_care_rows[obj_cols].fillna("")
+    child_care_list = child_care_rows.to_dict(orient="records")
+    return {entry["facility_id"]: entry for entry in child_care_list}
+
+
+'''
+Converts one zipcode's potential location rows into a list of records
+'''
+def potential_rows_to_list(potent_care_rows):
+    return potent_care_rows.fillna("").to_dict(orient="records")
+
+
+'''
+Income, employment and population of one zipcode, -1 where missing
+'''
+def zip_scalars(sources, zipcode_id):
+    avg_inc_df = sources["income"]
+    emp_rate_df = sources["employment"]
+    pop_df = sources["population"]
+
+    average_income = avg_inc_df.at[zipcode_id, "average income"] if zipcode_id in avg_inc_df.index else -1
+    employment_rate = emp_rate_df.at[zipcode_id, "employment rate"] if zipcode_id in emp_rate_df.index else -1
+    if zipcode_id in pop_df.index:
+        population0_5 = int(pop_df.loc[zipcode_id, "-5"])
+        population0_12 = int(pop_df.loc[zipcode_id, "-5"] + pop_df.loc[zipcode_id, "5-9"] + 3/5*(pop_df.loc[zipcode_id, "10-14"]))
+    else:
+        population0_5, population0_12 = -1, -1
+    return average_income, employment_rate, population0_5, population0_12
+
+
+'''
+Builds the data entry for one zipcode from the indexed sources
+'''
+def build_zip_entry(sources, zipcode_id):
+    average_income, employment_rate, population0_5, population0_12 = zip_scalars(sources, zipcode_id)
+    child_care_rows = sources["childcare"].get(zipcode_id)
+    child_care_dict = {} if child_care_rows is None else childcare_rows_to_dict(child_care_rows)
+    potent_care_rows = sources["potential"].get(zipcode_id)
+    potent_care_list = [] if potent_care_rows is None else potential_rows_to_list(potent_care_rows)
+
+    return {
+        "avg_individual_income": average_income,
+        "employment_rate": employment_rate,
+        "population0_5": population0_5,
+        "population0_12": population0_12,
+        "childcare_dict": child_care_dict,
+        "potential_locations": potent_care_list,
+    }
+
+
+'''
+Build dictionary with keys as zipcode values, reading each source file only once
+'''
+def build_filled_zip_dict_indexed(valid_zips, data_dir="./data"):
+    sources = load_sources(data_dir)
+    zipcodes = Zipcodes()
+    for id in tqdm(valid_zips):
+        zipcodes.add_zipcode(id, build_zip_entry(sources, id))
+    return zipcodes
+
+
+'''
+Streams a multi-row source into per-zipcode accumulators. The first pass fixes
+the column dtypes of a whole-file read, the second converts each chunk's rows
+per zipcode and merges them in file order, so only one chunk of rows is held
+as a frame at a time.
+'''
+def stream_grouped(path, zip_col, chunk_rows, convert, merge, zips=None):
+    dtypes = infer_csv_dtypes(path, zip_col, chunk_rows)
+    groups = {}
+    for chunk in iter_csv(path, zip_col, chunk_rows, dtype=dtypes):
+        for zip_id, rows in chunk.set_index(zip_col).groupby(level=0, sort=False):
+            if zips is not None and zip_id not in zips:
+                continue
+            converted = convert(rows)
+            if zip_id in groups:
+                merge(groups[zip_id], converted)
+            else:
+                groups[zip_id] = converted
+    return groups
+
+
+'''
+Same Zipcodes as build_filled_zip_dict_indexed, with peak memory bounded by the
+chunk size instead of the facility and site file sizes
+'''
+def build_filled_zip_dict_streaming(valid_zips, data_dir="./data", chunk_rows=CHUNK_ROWS):
+    valid_zips = list(valid_zips)
+    zips = set(valid_zips)
+    sources = load_zip_tables(data_dir)
+    childcare = stream_grouped(os.path.join(data_dir, "child_care_regulated.csv"), "zip_code", chunk_rows,
+                               childcare_rows_to_dict, dict.update, zips)
+    potential = stream_grouped(os.path.join(data_dir, "potential_locations.csv"), "zipcode", chunk_rows,
+                               potential_rows_to_list, list.extend, zips)
+    zipcodes = Zipcodes()
+    for id in tqdm(valid_zips):
+        average_income, employment_rate, population0_5, population0_12 = zip_scalars(sources, id)
+        zipcodes.add_zipcode(id, {
+            "avg_individual_income": average_income,
+            "employment_rate": employment_rate,
+            "population0_5": population0_5,
+            "population0_12": population0_12,
+            "childcare_dict": childcare.pop(id, {}),
+            "potential_locations": potential.pop(id, []),
+        })
+    return zipcodes
+
+
+'''
+Splits a zipcode-indexed frame into one frame per shard in a single groupby;
+rows of zipcodes outside every shard are dropped
+'''
+def split_by_shard(df, shard_of, n_shards):
+    shard_ids = np.array([shard_of.get(zip_id, -1) for zip_id in df.index], dtype=np.int64)
+    parts = {k: rows for k, rows in df.groupby(shard_ids, sort=False)}
+    return [parts.get(k, df.iloc[:0]) for k in range(n_shards)]
+
+
+def _build_shard(args):
+    shard, tables, child_care_rows, potent_care_rows = args
+    sources = index_sources(tables, child_care_rows, potent_care_rows)
+    return [(id, build_zip_entry(sources, id)) for id in shard]
+
+
+'''
+build_filled_zip_dict_indexed across a process pool. The zipcodes are cut into
+contiguous shards and every source table is partitioned by shard up front, so
+each worker is sent only its own rows. Entries are added back in valid_zips
+order, so the result does not depend on the number of workers.
+'''
+def build_filled_zip_dict_parallel(valid_zips, data_dir="./data", processes=None, shards_per_process=4):
+    valid_zips = list(valid_zips)
+    processes = processes or os.cpu_count() or 1
+    n_shards = max(1, min(len(valid_zips), processes * shards_per_process))
+    bounds = np.linspace(0, len(valid_zips), n_shards + 1).round().astype(int)
+    shards = [valid_zips[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+    shard_of = {id: k for k, shard in enumerate(shards) for id in shard}
+
+    tables = load_zip_tables(data_dir)
+    child_care_df, potent_care_df = load_grouped_frames(data_dir)
+    table_parts = {name: split_by_shard(df, shard_of, n_shards) for name, df in tables.items()}
+    tasks = list(zip(
+        shards,
+        [{name: parts[k] for name, parts in table_parts.items()} for k in range(n_shards)],
+        split_by_shard(child_care_df, shard_of, n_shards),
+        split_by_shard(potent_care_df, shard_of, n_shards),
+    ))
+    # the shards hold the only rows still needed
+    del tables, child_care_df, potent_care_df, table_parts
+
+    zipcodes = Zipcodes()
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+        for entries in tqdm(pool.map(_build_shard, tasks), total=n_shards):
+            for id, entry in entries:
+                zipcodes.add_zipcode(id, entry)
+    return zipcodes
+
+
+'''
+Times the per-zipcode builder against the indexed builder and checks the JSON matches
+'''
+def compare_builders(valid_zips, chunk_rows=CHUNK_ROWS):
+    valid_zips = list(valid_zips)
+    start = time.perf_counter()
+    reference = build_filled_zip_dict(valid_zips)
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indexed = build_filled_zip_dict_indexed(valid_zips)
+    indexed_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    streaming = build_filled_zip_dict_streaming(valid_zips, chunk_rows=chunk_rows)
+    streaming_time = time.perf_counter() - start
+
+    reference_json = json.dumps(reference.data, indent=2)
+    identical = reference_json == json.dumps(indexed.data, indent=2) == json.dumps(streaming.data, indent=2)
+    print(cf.bold(cf.seaGreen("===== BUILDER COMPARISON =====")))
+    print(cf.yellow(f"  {'per-zipcode':<20}") + cf.bold(f"{reference_time:.2f}s"))
+    print(cf.yellow(f"  {'indexed':<20}") + cf.bold(f"{indexed_time:.2f}s"))
+    print(cf.yellow(f"  {'streaming':<20}") + cf.bold(f"{streaming_time:.2f}s"))
+    print(cf.yellow(f"  {'speedup':<20}") + cf.bold(f"{reference_time / max(indexed_time, 1e-9):.1f}x"))
+    print(cf.yellow(f"  {'identical output':<20}") + cf.bold(str(identical)))
+    print(cf.bold(cf.seaGreen("==============================")))
+    return identical, reference_time, indexed_time
+
+
+'''
+Command line entry: OUT_PATH [--compare] [--stream] [--chunk-rows=N] [--processes=N]
+'''
+def main(argv):
     FILE_MAP= {
         "./data/avg_individual_income.csv": "ZIP code",
         "./data/child_care_regulated.csv": "zip_code",
@@ -130,12 +379,28 @@ if __name__ == "__main__":
         "./data/population.csv": "zipcode",
         "./data/potential_locations.csv": "zipcode",
     }
-    out_path = sys.argv[1] 
+    out_path = argv[0] 
+    # --stream reads the facility and site files in chunks to bound peak memory
+    stream = "--stream" in argv[1:]
+    chunk_rows = next((int(a.split("=", 1)[1]) for a in argv[1:] if a.startswith("--chunk-rows=")), CHUNK_ROWS)
+    # --processes=N assembles the zipcodes in N worker processes
+    processes = next((int(a.split("=", 1)[1]) for a in argv[1:] if a.startswith("--processes=")), None)
     print(cf.bold(cf.seaGreen('Creating zipcode data...')))
-    length_union, all_zips = find_zipcode_union(FILE_MAP)
+    length_union, all_zips = find_zipcode_union(FILE_MAP, chunk_rows if stream else None)
     print(cf.bold(cf.seaGreen(f'Found {cf.yellow(length_union)}/2158 zipcodes in total across all 5 files')))
-    zipcodes = build_filled_zip_dict(all_zips)
-    zipcodes.save_data_to_path(out_path)
+    if "--compare" in argv[1:]:
+        compare_builders(all_zips, chunk_rows)
+    if stream:
+        zipcodes = build_filled_zip_dict_streaming(all_zips, chunk_rows=chunk_rows)
+    elif processes:
+        zipcodes = build_filled_zip_dict_parallel(all_zips, processes=processes)
+    else:
+        zipcodes = build_filled_zip_dict_indexed(all_zips)
+    zipcodes.save(out_path)
     print(cf.bold(cf.seaGreen('Completed successfully')))
     print(cf.bold(cf.seaGreen(f"Saved data to: {cf.yellow(out_path)}")))
     zipcodes.print_summary()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
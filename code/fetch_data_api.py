@@ -1,8 +1,11 @@
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 import colorful as cf
 from structs.zipcode import Zipcodes
+from census_cache import CacheMiss, ResponseCache
 from utils import normalize_zip
 import sys
 import os
@@ -11,36 +14,136 @@ cf.use_style('monokai')
 load_dotenv()
 
 ACS_YEAR = "2023"
-BASE_DETAILED = f"https://api.census.gov/data/{ACS_YEAR}/acs/acs5"
-BASE_SUBJECT  = f"https://api.census.gov/data/{ACS_YEAR}/acs/acs5/subject"
-BASE_PROFILE = f"https://api.census.gov/data/{ACS_YEAR}/acs/acs5/profile"
+# Point at a local stub server for testing, e.g. CENSUS_API_BASE=http://127.0.0.1:8000/data
+CENSUS_API_BASE = os.getenv("CENSUS_API_BASE", "https://api.census.gov/data")
+BASE_DETAILED = f"{CENSUS_API_BASE}/{ACS_YEAR}/acs/acs5"
+BASE_SUBJECT  = f"{CENSUS_API_BASE}/{ACS_YEAR}/acs/acs5/subject"
+BASE_PROFILE = f"{CENSUS_API_BASE}/{ACS_YEAR}/acs/acs5/profile"
 VARS_DETAILED = ["NAME", "B01003_001E", "B19301_001E"]  
 VARS_SUBJECT  = ["S2301_C03_001E"]                     
+AGE_VARS = {
+    "age0_4": "DP05_0005E",
+    "age5_9": "DP05_0006E",
+    "age10_14": "DP05_0007E",
+}
+VARS_PROFILE = ["NAME"] + list(AGE_VARS.values())
+ZCTA_GEO = "zip code tabulation area"
+
+# Bulk fetching: ZCTAs per request, concurrent requests, and retry policy
+BATCH_SIZE = 200
+MAX_WORKERS = 8
+MAX_RETRIES = 5
+BACKOFF_FACTOR = 0.5
 
 
 '''
-Loads Income from zipcode 
+Pooled HTTP session that retries throttled and failed requests with exponential backoff
+'''
+def make_session(max_workers=MAX_WORKERS):
+    retry = Retry(
+        total=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+    )
+    adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+'''
+Query the Census API and return every result row as a dict keyed by header
 '''
-def _get_json(base_url, params):
+def _get_rows(base_url, params, session=None):
     api_key = os.getenv("API_KEY")
     q = {**params, "key": api_key} 
-    r = requests.get(base_url, params=q, timeout=20)
+    try:
+        r = (session or requests).get(base_url, params=q, timeout=20)
+    except requests.RequestException as e:
+        print(f"⚠️ Census API request failed: {e}")
+        return None
     if r.status_code == 204:
-        return {} 
+        return [] 
     if r.status_code != 200:
         print(f"⚠️ Census API error {r.status_code}: No results for URL={r.url}")
-        return {}
+        return None
     try:
         data = r.json()
     except Exception:
         print(f"⚠️ Non-JSON response from {r.url}")
-        return {}
+        return None
     if not isinstance(data, list) or len(data) < 2:
-        return {}
+        return []
 
     headers = data[0]
-    row = data[1]
-    return dict(zip(headers, row))
+    return [dict(zip(headers, row)) for row in data[1:]]
+
+
+'''
+Loads Income from zipcode 
+'''
+def _get_json(base_url, params, session=None, cache=None):
+    zcta = params["for"].split(":", 1)[1]
+    return lookup(base_url, params["get"].split(","), [zcta], session, cache, bulk=False).get(zcta, {})
+
+
+'''
+Fetch one table for many ZCTAs using comma-separated ZCTA lists, with batches
+sent concurrently. Batches the API rejects fall back to one request per ZCTA.
+Returns a row per answered ZCTA ({} when the API has no data for it); ZCTAs
+whose requests failed are left out.
+'''
+def get_table(base_url, variables, zctas, session=None, batch_size=BATCH_SIZE, max_workers=MAX_WORKERS):
+    session = session or make_session(max_workers)
+    zctas = sorted(set(zctas))
+    batches = [zctas[k:k + batch_size] for k in range(0, len(zctas), batch_size)]
+
+    def fetch_batch(batch):
+        rows = _get_rows(base_url, {"get": ",".join(variables), "for": f"{ZCTA_GEO}:{','.join(batch)}"}, session)
+        if rows is not None:
+            return batch, rows
+        answered, rows = [], []
+        if len(batch) > 1:
+            for z in batch:
+                zrows = _get_rows(base_url, {"get": ",".join(variables), "for": f"{ZCTA_GEO}:{z}"}, session)
+                if zrows is not None:
+                    answered.append(z)
+                    rows += zrows
+        return answered, rows
+
+    table = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for answered, rows in pool.map(fetch_batch, batches):
+            table.update({z: {} for z in answered})
+            for row in rows:
+                if row.get(ZCTA_GEO) in table:
+                    table[row.get(ZCTA_GEO)] = row
+    return table
+
+
+'''
+Rows for the given ZCTAs, served from the response cache where possible. Only
+cache misses go to the network: in bulk through get_table, otherwise one
+request per ZCTA.
+'''
+def lookup(base_url, variables, zctas, session=None, cache=None, bulk=True):
+    zctas = sorted(set(zctas))
+    found, missing = cache.get_many(base_url, variables, zctas) if cache else ({}, zctas)
+    if missing:
+        if bulk:
+            fetched = get_table(base_url, variables, missing, session)
+        else:
+            fetched = {}
+            for z in missing:
+                rows = _get_rows(base_url, {"get": ",".join(variables), "for": f"{ZCTA_GEO}:{z}"}, session)
+                if rows is not None:
+                    fetched[z] = rows[0] if rows else {}
+        if cache:
+            cache.put_many(base_url, variables, fetched)
+        found.update(fetched)
+    return found
 
 
 def _to_float_or_zero(x):
@@ -61,73 +164,132 @@ def safe_int(x):
         return 0
 
 
-def fetch_data(data):
-    zipcodes = Zipcodes(data)
-    missing_data = zipcodes.get_missing_data()
-    income_changed = 0
-    employment_changed = 0
-    population0_5_changed = 0
-    population0_12_changed = 0
+'''
+Convert one API row per variable group into zipcode fields (empty if unusable)
+'''
+def _income_fields(income):
+    average_income = _to_float_or_zero(income.get("B19301_001E"))
+    return {'avg_individual_income': average_income} if average_income != 0 else {}
+
+
+def _employment_fields(employment):
+    employment_rate = _to_float_or_zero(employment.get("S2301_C03_001E"))
+    return {'employment_rate': employment_rate} if employment_rate != 0 else {}
+
+
+def _population_fields(dp05):
+    pop0_5 = safe_int(dp05.get(AGE_VARS["age0_4"]))
+    pop5_9 = safe_int(dp05.get(AGE_VARS["age5_9"]))
+    pop10_14 = safe_int(dp05.get(AGE_VARS["age10_14"]))
+    pop0_12 = pop0_5 + pop5_9 + (2/3)*pop10_14
+    if pop0_5 != 0:
+        return {'population0_5': pop0_5, 'population0_12': pop0_12}
+    return {}
+
+
+'''
+Fetch the missing values of every zipcode, one request per zipcode and variable group
+'''
+def _fetch_serial(zipcodes, missing_data, session, cache):
+    updates = {}
     for key in tqdm(missing_data):
-        missing_values = zipcodes.get_missing_values(key)
         data = {}
-        for m in missing_values:
-            z = normalize_zip(key)
+        z = normalize_zip(key)
+        for m in zipcodes.get_missing_values(key):
             if m == 0:
-                income = _get_json(
-                    BASE_DETAILED,
-                    {"get": ",".join(VARS_DETAILED), "for": f"zip code tabulation area:{z}"},
-                )
-                average_income = _to_float_or_zero(income.get("B19301_001E"))
-                if average_income != 0:
-                    data['avg_individual_income'] = average_income
-                    income_changed += 1
+                income = _get_json(BASE_DETAILED, {"get": ",".join(VARS_DETAILED), "for": f"{ZCTA_GEO}:{z}"}, session, cache)
+                data.update(_income_fields(income))
             elif m == 1:
-                employment = _get_json(
-                    BASE_SUBJECT,
-                    {"get": ",".join(VARS_SUBJECT), "for": f"zip code tabulation area:{z}"},
-                )
-                employment_rate = _to_float_or_zero(employment.get("S2301_C03_001E"))
-                if employment_rate != 0:
-                    data['employment_rate'] = employment_rate
-                    employment_changed += 1
+                employment = _get_json(BASE_SUBJECT, {"get": ",".join(VARS_SUBJECT), "for": f"{ZCTA_GEO}:{z}"}, session, cache)
+                data.update(_employment_fields(employment))
             else:
-                age_vars = {
-                    "age0_4": "DP05_0005E",
-                    "age5_9": "DP05_0006E",
-                    "age10_14": "DP05_0007E",
-                }
-                dp05 = _get_json(
-                    BASE_PROFILE,
-                    {"get": ",".join(["NAME"] + list(age_vars.values())),
-                    "for": f"zip code tabulation area:{z}"}
-                )
-                pop0_5 = safe_int(dp05.get(age_vars["age0_4"]))
-                pop5_9 = safe_int(dp05.get(age_vars["age5_9"]))
-                pop10_14 = safe_int(dp05.get(age_vars["age10_14"]))
-                pop0_12 = pop0_5 + pop5_9 + (2/3)*pop10_14
-                if pop0_5 != 0:
-                    data['population0_5'] = pop0_5
-                    data['population0_12'] = pop0_12
-                    population0_5_changed += 1
-                    population0_12_changed += 1
+                dp05 = _get_json(BASE_PROFILE, {"get": ",".join(VARS_PROFILE), "for": f"{ZCTA_GEO}:{z}"}, session, cache)
+                data.update(_population_fields(dp05))
+        updates[key] = data
+    return updates
+
+
+'''
+Fetch the missing values of every zipcode with a few bulk requests per variable group
+'''
+def _fetch_bulk(zipcodes, missing_data, session, cache):
+    wanted = {0: set(), 1: set(), 2: set()}
+    for key in missing_data:
+        for m in zipcodes.get_missing_values(key):
+            wanted[m].add(normalize_zip(key))
+    groups = {
+        0: (BASE_DETAILED, VARS_DETAILED, _income_fields),
+        1: (BASE_SUBJECT, VARS_SUBJECT, _employment_fields),
+        2: (BASE_PROFILE, VARS_PROFILE, _population_fields),
+    }
+    tables = {}
+    for m, (base_url, variables, _) in tqdm(groups.items()):
+        tables[m] = lookup(base_url, variables, wanted[m], session, cache) if wanted[m] else {}
+
+    updates = {}
+    for key in missing_data:
+        data = {}
+        z = normalize_zip(key)
+        for m in zipcodes.get_missing_values(key):
+            data.update(groups[m][2](tables[m].get(z, {})))
+        updates[key] = data
+    return updates
+
+
+def fetch_data(data, mode="bulk", cache=None):
+    zipcodes = data if isinstance(data, Zipcodes) else Zipcodes(data)
+    missing_data = zipcodes.get_missing_data()
+    session = make_session()
+    if mode == "serial":
+        updates = _fetch_serial(zipcodes, missing_data, session, cache)
+    else:
+        updates = _fetch_bulk(zipcodes, missing_data, session, cache)
+
+    income_changed = 0
+    employment_changed = 0
+    population0_5_changed = 0
+    population0_12_changed = 0
+    for key in missing_data:
+        data = updates[key]
+        income_changed += 'avg_individual_income' in data
+        employment_changed += 'employment_rate' in data
+        population0_5_changed += 'population0_5' in data
+        population0_12_changed += 'population0_12' in data
         zipcodes.modify_zipcode_values(key, data)
     print(cf.bold(cf.seaGreen(f'Added {cf.yellow(income_changed)} missing <average income> values')))
     print(cf.bold(cf.seaGreen(f'Added {cf.yellow(employment_changed)} missing <employment rate> values')))
     print(cf.bold(cf.seaGreen(f'Added {cf.yellow(population0_5_changed)} missing <population 0 to 5> values')))
     print(cf.bold(cf.seaGreen(f'Added {cf.yellow(population0_12_changed)} missing <population 0 to 12> values')))
+    if cache:
+        stats = cache.stats()
+        print(cf.bold(cf.seaGreen(
+            f'Response cache: {cf.yellow(stats["hits"])} hits, {cf.yellow(stats["misses"])} misses, '
+            f'{cf.yellow(stats["evictions"])} evictions, {cf.yellow(stats["entries"])} entries')))
     return zipcodes
 
 
-if __name__ == "__main__":
-    in_path = sys.argv[1] 
-    out_path = sys.argv[2] 
+'''
+Command line entry: IN_PATH OUT_PATH...
+'''
+def main(argv):
+    in_path = argv[0] 
+    out_paths = argv[1:]
     print(cf.bold(cf.seaGreen(f"Got zipcode data from: {cf.yellow(in_path)}")))
     print(cf.bold(cf.seaGreen('Attempting to fetch zipcode data...')))
-    with open(in_path, "r") as f:
-        data = json.load(f)
-    zipcodes = fetch_data(data)
-    zipcodes.save_data_to_path(out_path)
+    # FETCH_MODE=serial issues one request per zipcode and variable group
+    cache = ResponseCache.from_env()
+    try:
+        zipcodes = fetch_data(Zipcodes.load(in_path), mode=os.getenv("FETCH_MODE", "bulk"), cache=cache)
+    except CacheMiss as e:
+        print(cf.orange(f"Offline fetch failed: {e}"))
+        sys.exit(1)
     print(cf.bold(cf.seaGreen('Completed successfully')))
-    print(cf.bold(cf.seaGreen(f"Saved data to: {cf.yellow(out_path)}")))
-    zipcodes.print_summary()
\ No newline at end of file
+    for out_path in out_paths:
+        # .json paths are written as JSON, anything else as a columnar dataset directory
+        zipcodes.save(out_path)
+        print(cf.bold(cf.seaGreen(f"Saved data to: {cf.yellow(out_path)}")))
+    zipcodes.print_summary()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
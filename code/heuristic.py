@@ -0,0 +1,331 @@
+import math
+import sys
+import time
+import colorful as cf
+from structs.zipcode import Zipcodes
+from conflicts import ConflictIndex
+from params import resolve_params
+
+cf.use_style('monokai')
+
+
+def _expansion_limit(cap, factor):
+    limit = min(factor * cap, 500.0)
+    if cap > limit:
+        limit = cap
+    return limit
+
+
+'''
+New-build mixes that can be optimal for any facility costs and capacities: the
+mixes of at most max_builds builds in which every build is needed, i.e. dropping
+any one of them leaves the children or the 0–5 need uncovered. A mix with a
+spare build covers the same need as the mix without it at no less cost, so some
+optimal plan uses one of these. Returned as (cost, mix) sorted by build cost, so
+callers can stop once the build cost alone is too high.
+'''
+def _build_mixes(facility_types, max_builds, need_children, need_infant):
+    sizes = [(s, spec["Cap"], spec["Cap05"], spec["Cost"]) for s, spec in facility_types.items()]
+    mixes = []
+
+    def extend(i, counts, cost, cap, cap05):
+        if i == len(sizes):
+            if not any(n and cap - c >= need_children and cap05 - c05 >= need_infant
+                       for n, (_, c, c05, _) in zip(counts, sizes)):
+                mixes.append((cost, {s: n for n, (s, _, _, _) in zip(counts, sizes) if n}))
+            return
+        _, c, c05, price = sizes[i]
+        n = 0
+        while True:
+            extend(i + 1, counts + [n], cost + n * price, cap + n * c, cap05 + n * c05)
+            # a further build that adds nothing towards an uncovered need is a spare one
+            if sum(counts) + n >= max_builds or ((c <= 0 or cap + n * c >= need_children) and
+                                                 (c05 <= 0 or cap05 + n * c05 >= need_infant)):
+                break
+            n += 1
+
+    extend(0, [], 0, 0, 0)
+    return sorted(mixes, key=lambda item: (item[0], sorted(item[1].items())))
+
+
+'''
+Cheapest way to add at least `need` expansion slots in Part 1. Slots below a
+facility's capacity cost ALPHA each; going past it triggers the fixed cost, so
+facilities are triggered in order of fixed cost per extra slot.
+'''
+def _part1_expansion(caps, need, ALPHA, DELTA):
+    x = [0] * len(caps)
+    z = [0] * len(caps)
+    below, ub = [], []
+    for k, cap in enumerate(caps):
+        ub.append(math.floor(_expansion_limit(cap, 2.2) - cap + 1e-9))
+        below.append(min(ub[-1], math.floor(cap - 1e-3)))
+        if below[-1] < 0:
+            # no slot count satisfies the off-branch, so the trigger is forced
+            z[k] = 1
+            below[-1] = 0
+    remaining = need - sum(below)
+    order = sorted(
+        (k for k in range(len(caps)) if not z[k] and ub[k] >= math.ceil(caps[k]) and ub[k] > below[k]),
+        key=lambda k: (DELTA + 200.0 * caps[k]) / (ub[k] - below[k]),
+    )
+    for k in order:
+        if remaining <= 0:
+            break
+        z[k] = 1
+        remaining -= ub[k] - below[k]
+    if remaining > 0:
+        return None
+    # triggered facilities need at least their capacity; fill the rest cheapest-first
+    for k in range(len(caps)):
+        x[k] = math.ceil(caps[k]) if z[k] and ub[k] >= math.ceil(caps[k]) else 0
+    left = need - sum(x)
+    for k in range(len(caps)):
+        if left <= 0:
+            break
+        hi = ub[k] if z[k] else below[k]
+        add = max(0, min(hi - x[k], left))
+        x[k] += add
+        left -= add
+    cost = sum(ALPHA * x[k] + (DELTA + 200.0 * caps[k]) * z[k] for k in range(len(caps)))
+    return cost, x, z
+
+
+'''
+Per-slot Part 2 expansion tiers as (rate, facility, tier, amount)
+'''
+def _part2_chunks(caps):
+    chunks = []
+    for k, cap in enumerate(caps):
+        base = 20000.0 / cap
+        for tier, (share, rate) in enumerate(((0.10, 200.0), (0.05, 400.0), (0.05, 1000.0))):
+            chunks.append((rate + base, k, tier, math.floor(share * cap + 1e-9)))
+    return sorted(chunks)
+
+
+'''
+Part 1 expansion as (rate, amount) slot chunks with each trigger's fixed cost
+spread over the slots it unlocks, plus the fixed cost of forced triggers
+'''
+def _part1_chunks(caps, ALPHA, DELTA):
+    chunks, forced = [], 0.0
+    for cap in caps:
+        ub = math.floor(_expansion_limit(cap, 2.2) - cap + 1e-9)
+        below = min(ub, math.floor(cap - 1e-3))
+        if below < 0:
+            forced += DELTA + 200.0 * cap
+            below = 0
+        chunks.append((float(ALPHA), below))
+        if ub > below:
+            chunks.append((ALPHA + (DELTA + 200.0 * cap) / (ub - below), ub - below))
+    return chunks, forced
+
+
+'''
+Minimum cost of `need` slots from (rate, amount) chunks when chunks may be
+used fractionally; infinite when they cannot cover it
+'''
+def _fractional_cover(chunks, need):
+    cost, left = 0.0, need
+    for rate, amount in sorted(chunks):
+        if left <= 0:
+            break
+        add = min(amount, left)
+        cost += rate * add
+        left -= add
+    return cost if left <= 0 else math.inf
+
+
+'''
+Cheapest way to add at least `need` expansion slots in Part 2: fill the
+tiers in order of per-slot cost, which is exact because each tier is linear
+'''
+def _part2_expansion(caps, need):
+    ub = [math.floor(_expansion_limit(cap, 1.2) - cap + 1e-9) for cap in caps]
+    t = [[0, 0, 0] for _ in caps]
+    left, cost = need, 0.0
+    for rate, k, tier, amount in _part2_chunks(caps):
+        if left <= 0:
+            break
+        add = max(0, min(amount, ub[k] - sum(t[k]), left))
+        t[k][tier] += add
+        left -= add
+        cost += rate * add
+    if left > 0:
+        return None
+    return cost, [sum(tk) for tk in t], t
+
+
+'''
+Greedy maximal set of mutually non-conflicting sites, lowest conflict degree first
+'''
+def _independent_sites(n_sites, site_pairs):
+    neighbours = {l: set() for l in range(n_sites)}
+    for a, b in site_pairs:
+        neighbours[a].add(b)
+        neighbours[b].add(a)
+    chosen, blocked = [], set()
+    for l in sorted(range(n_sites), key=lambda l: (len(neighbours[l]), l)):
+        if l not in blocked:
+            chosen.append(l)
+            blocked |= neighbours[l] | {l}
+    return chosen
+
+
+'''
+Heuristic plan for one zipcode: enumerate the new-build mixes that can be
+optimal and cover the remaining slots with the cheapest expansions
+'''
+def solve_zipcode(zipcodes: Zipcodes, key, part2=False, params=None, conflict_index=None):
+    FACILITY_TYPES, ALPHA, BETA, DELTA, DIST_LIMIT = resolve_params(params)
+    facilities = zipcodes.get_facility_ids(key)
+    caps = [zipcodes.get_children_cap_for_facility(key, f) for f in facilities]
+    need_children = zipcodes.get_theta_for_zipcode(key) * zipcodes.get_children_population_for_zipcode(key) \
+        - zipcodes.get_children_cap_for_zipcode(key)
+    need_infant = (2/3) * zipcodes.get_infant_population_for_zipcode(key) - zipcodes.get_infant_cap_for_zipcode(key)
+    need_children, need_infant = max(0, math.ceil(need_children - 1e-9)), max(0, math.ceil(need_infant - 1e-9))
+
+    if part2:
+        n_sites = zipcodes.get_site_count(key)
+        site_pairs, _ = (conflict_index or ConflictIndex(zipcodes)).conflicts(key, DIST_LIMIT)
+        sites = _independent_sites(n_sites, site_pairs)
+        max_builds = len(sites)
+    else:
+        n_sites = max_builds = math.inf
+    mixes = _build_mixes(FACILITY_TYPES, n_sites, need_children, need_infant)
+
+    def expansion_need(mix):
+        build_cap = sum(FACILITY_TYPES[s]["Cap"] * n for s, n in mix.items())
+        build_cap05 = sum(FACILITY_TYPES[s]["Cap05"] * n for s, n in mix.items())
+        return max(0, need_children - build_cap, need_infant - build_cap05)
+
+    best = None
+    for build_cost, mix in mixes:
+        if best is not None and build_cost >= best[0]:
+            break
+        if sum(mix.values()) > max_builds:
+            continue
+        need = expansion_need(mix)
+        expansion = _part2_expansion(caps, need) if part2 else _part1_expansion(caps, need, ALPHA, DELTA)
+        if expansion is None:
+            continue
+        cost = expansion[0] + build_cost
+        if best is None or cost < best[0]:
+            best = (cost, mix, expansion)
+
+    # lower bound: every mix that can be optimal, ignoring site conflicts, with
+    # expansions covered fractionally (trigger costs spread per slot)
+    if part2:
+        chunks, forced = [(rate, amount) for rate, _, _, amount in _part2_chunks(caps)], 0.0
+    else:
+        chunks, forced = _part1_chunks(caps, ALPHA, DELTA)
+    cheapest = math.inf
+    for build_cost, mix in mixes:
+        if build_cost >= cheapest:
+            break
+        cheapest = min(cheapest, build_cost + _fractional_cover(chunks, expansion_need(mix)))
+    bound = BETA * need_infant + forced + cheapest
+
+    plan = {"zipcode": key, "feasible": best is not None, "bound": bound}
+    if best is None:
+        return plan
+    _, mix, expansion = best
+    x = dict(zip(facilities, expansion[1]))
+
+    # 0–5 slots: fill new builds first, then expanded slots
+    left = need_infant
+    builds, v = [], []
+    for s in sorted(mix, key=lambda s: -FACILITY_TYPES[s]["Cap"]):
+        builds += [s] * mix[s]
+    for s in builds:
+        v.append(min(FACILITY_TYPES[s]["Cap05"], left))
+        left -= v[-1]
+    u = {}
+    for f in facilities:
+        u[f] = min(x[f], left)
+        left -= u[f]
+
+    plan.update({"x": x, "u": u})
+    if part2:
+        plan["t"] = dict(zip(facilities, expansion[2]))
+        plan["sites"] = [(l, s, vs) for l, s, vs in zip(sites, builds, v)]
+        expansion_cost = expansion[0]
+    else:
+        plan["z"] = dict(zip(facilities, expansion[2]))
+        plan["y"] = {s: mix.get(s, 0) for s in FACILITY_TYPES}
+        plan["v"] = {s: sum(vs for b, vs in zip(builds, v) if b == s) for s in FACILITY_TYPES}
+        expansion_cost = expansion[0]
+    facility_cost = sum(FACILITY_TYPES[s]["Cost"] for s in builds)
+    equip_cost = BETA * (sum(u.values()) + sum(v))
+    plan["costs"] = [expansion_cost, facility_cost, equip_cost]
+    plan["objective"] = expansion_cost + facility_cost + equip_cost
+    return plan
+
+
+'''
+Heuristic plan for every complete zipcode, with the summed lower bound and gap
+'''
+def solve(zipcodes: Zipcodes, part2=False, params=None, zips=None):
+    start = time.perf_counter()
+    conflict_index = ConflictIndex(zipcodes) if part2 else None
+    keys = sorted(zipcodes.get_complete_data() if zips is None else zips)
+    plans = {key: solve_zipcode(zipcodes, key, part2, params, conflict_index) for key in keys}
+    infeasible = [key for key, plan in plans.items() if not plan["feasible"]]
+    objective = sum(plan["objective"] for plan in plans.values() if plan["feasible"])
+    bound = sum(plan["bound"] for plan in plans.values() if plan["feasible"])
+    return {
+        "objective": None if infeasible else objective,
+        "bound": bound,
+        "gap": None if infeasible or objective == 0 else (objective - bound) / objective,
+        "costs": [sum(plan["costs"][k] for plan in plans.values() if plan["feasible"]) for k in range(3)],
+        "plans": plans,
+        "infeasible": infeasible,
+        "time": time.perf_counter() - start,
+    }
+
+
+'''
+Load a heuristic result as a MIP start into variables keyed like
+optimize.build_model. Only attributes are set, so this needs no solver import.
+'''
+def apply_mip_start(variables, result, part2=False):
+    for key, plan in result["plans"].items():
+        if not plan["feasible"]:
+            continue
+        for f, value in plan["x"].items():
+            variables["x"][f].Start = value
+            variables["u"][f].Start = plan["u"][f]
+        if part2:
+            for f, tiers in plan["t"].items():
+                for name, value in zip(("t1", "t2", "t3"), tiers):
+                    variables[name][f].Start = value
+            for (i, l, s), var in variables["y_site"].items():
+                if i == key:
+                    var.Start = 0
+                    variables["v_site"][i, l, s].Start = 0
+            for l, s, vs in plan["sites"]:
+                variables["y_site"][key, l, s].Start = 1
+                variables["v_site"][key, l, s].Start = vs
+        else:
+            for f, value in plan["z"].items():
+                variables["z"][f].Start = value
+            for s, value in plan["y"].items():
+                variables["y"][key, s].Start = value
+                variables["v"][key, s].Start = plan["v"][s]
+
+
+if __name__ == "__main__":
+    in_path = sys.argv[1]
+    print(cf.bold(cf.seaGreen(f"Got zipcode data from: {cf.yellow(in_path)}")))
+    zipcodes = Zipcodes.load(in_path)
+    for part2 in (False, True):
+        result = solve(zipcodes, part2)
+        print(cf.bold(cf.seaGreen(f"=== Part {2 if part2 else 1} Heuristic summary ===")))
+        if result["infeasible"]:
+            print(cf.orange(f"No feasible plan found for {len(result['infeasible'])} zipcodes."))
+        else:
+            print(cf.seaGreen("Objective value: " + cf.bold(cf.yellow(f"${result['objective']:,.0f}"))))
+            print(cf.seaGreen("Lower bound: " + cf.bold(cf.yellow(f"${result['bound']:,.0f}"))))
+            print(cf.seaGreen("Gap: " + cf.bold(cf.yellow(f"{100 * (result['gap'] or 0):.2f}%"))))
+        print(cf.seaGreen("Time: " + cf.bold(cf.yellow(f"{result['time']:.3f}s"))))
+        print("\n")
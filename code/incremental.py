@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import sys
+import colorful as cf
+from structs.zipcode import Zipcodes
+from optimize import FORMULATION_VERSION, optimize_decomposed, print_summary
+from params import resolve_params
+
+cf.use_style('monokai')
+
+
+'''
+Fingerprint of one zipcode's inputs together with the resolved model
+constants, so edits to params.py count as well as per-run overrides, and
+the formulation version
+'''
+def zipcode_hash(entry, params=None, theta=None):
+    payload = json.dumps({"entry": entry, "params": resolve_params(params), "theta": theta,
+                          "formulation": FORMULATION_VERSION},
+                         sort_keys=True, default=lambda o: o.item() if hasattr(o, "item") else str(o))
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def snapshot_path(snapshot_dir, part2):
+    return os.path.join(snapshot_dir, f"snapshot_part{2 if part2 else 1}.json")
+
+
+def load_snapshot(snapshot_dir, part2):
+    path = snapshot_path(snapshot_dir, part2)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_snapshot(snapshot_dir, part2, snapshot):
+    os.makedirs(snapshot_dir, exist_ok=True)
+    with open(snapshot_path(snapshot_dir, part2), "w") as f:
+        json.dump(snapshot, f)
+
+
+'''
+Zipcodes whose inputs changed since the snapshot (including new ones) and
+zipcodes that were in the snapshot but are no longer solved
+'''
+def diff_zipcodes(zipcodes: Zipcodes, snapshot, params=None):
+    theta = [zipcodes.EMPLOYMENT_THRESH, zipcodes.INCOME_THRESH]
+    hashes = {key: zipcode_hash(zipcodes.data[key], params, theta) for key in zipcodes.get_complete_data()}
+    changed = sorted(key for key, h in hashes.items() if snapshot.get(key, {}).get("hash") != h)
+    removed = sorted(set(snapshot) - set(hashes))
+    return hashes, changed, removed
+
+
+def _plan(solution):
+    return {name: round(value) for name, value in solution.items() if abs(value) > 1e-6}
+
+
+'''
+Re-solve only the zipcodes whose data changed since the last solved snapshot
+and reuse the cached per-zipcode solutions for the rest
+'''
+def reoptimize(zipcodes: Zipcodes, snapshot_dir, part2=False, params=None, processes=None):
+    snapshot = load_snapshot(snapshot_dir, part2)
+    hashes, changed, removed = diff_zipcodes(zipcodes, snapshot, params)
+
+    resolved = optimize_decomposed(zipcodes, part2, processes=processes, zips=changed, params=params)["per_zip"] if changed else {}
+    plan_changed = list(removed)
+    for key in changed:
+        r = resolved[key]
+        previous = snapshot.get(key)
+        if previous is None or r["objective"] is None or _plan(previous["solution"]) != _plan(r["solution"]):
+            plan_changed.append(key)
+        snapshot[key] = {"hash": hashes[key], "status": r["status"], "objective": r["objective"],
+                         "costs": r["costs"], "solution": r["solution"]}
+    for key in removed:
+        del snapshot[key]
+    save_snapshot(snapshot_dir, part2, snapshot)
+
+    infeasible = sorted(key for key, r in snapshot.items() if r["objective"] is None)
+    return {
+        "objective": None if infeasible else sum(r["objective"] for r in snapshot.values()),
+        "costs": None if infeasible else [sum(r["costs"][k] for r in snapshot.values()) for k in range(3)],
+        "resolved": changed,
+        "plan_changed": sorted(plan_changed),
+        "infeasible": infeasible,
+    }
+
+
+if __name__ == "__main__":
+    in_path = sys.argv[1]
+    snapshot_dir = sys.argv[2] if len(sys.argv) > 2 else "./outputs/snapshots"
+
+    print(cf.bold(cf.seaGreen(f"Got zipcode data from: {cf.yellow(in_path)}")))
+    zipcodes = Zipcodes.load(in_path)
+    for part2 in (False, True):
+        result = reoptimize(zipcodes, snapshot_dir, part2=part2)
+        print(cf.seaGreen(f"Re-solved {cf.bold(cf.yellow(len(result['resolved'])))} of "
+                          f"{zipcodes.get_complete_data_length()} zipcodes"))
+        if result["infeasible"]:
+            print(cf.orange(f"No feasible or optimal solution found for {len(result['infeasible'])} zipcodes."))
+        else:
+            print_summary(result["objective"], part2)
+        print(cf.seaGreen("Zipcodes whose plan changed: ") + cf.bold(cf.yellow(", ".join(result["plan_changed"]) or "none")))
+        with open(os.path.join(snapshot_dir, f"changes_part{2 if part2 else 1}.json"), "w") as f:
+            json.dump(result, f, indent=2)
@@ -1,21 +1,31 @@
 import json
 from pathlib import Path
-import pandas as pd
-import geopandas as gpd
-import folium
 import sys
 import colorful as cf
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from structs.columnar import load_columnar
+from map.zcta_cache import DEFAULT_MAX_ZOOM, ZCTA_COL, load_zctas
 
 def norm_zip(z):
     s = "".join(ch for ch in str(z) if ch.isdigit())
     return s[:5].zfill(5) if s else None
 
-if __name__ == "__main__":
-    json_path = Path(sys.argv[1])
-    zcta_path = Path(sys.argv[2])
+
+'''
+Command line entry: DATA_PATH ZCTA_PATH [MAX_ZOOM]
+ZCTA_PATH is the national shapefile, whose clipped and simplified cache is
+built on first use, or a cache file written by zcta_cache.py
+'''
+def main(argv):
+    # folium and geopandas take most of a second to import
+    import folium
+
+    json_path = Path(argv[0])
+    zcta_path = Path(argv[1])
+    max_zoom = int(argv[2]) if len(argv) > 2 else DEFAULT_MAX_ZOOM
 
     if not json_path.exists():
-        print(f"Error: JSON file '{json_path}' not found.")
+        print(f"Error: dataset '{json_path}' not found.")
         sys.exit(1)
     if not zcta_path.exists():
         print(f"Error: shapefile '{zcta_path}' not found.")
@@ -23,18 +33,16 @@ if __name__ == "__main__":
 
     output_name = json_path.stem + ".html"
     output_path = Path("./outputs") / output_name
-    geo = gpd.read_file(zcta_path)
-    geo["ZCTA5CE10"] = geo["ZCTA5CE10"].astype(str).str.zfill(5)
+    geo = load_zctas(zcta_path, max_zoom=max_zoom)
 
-    with json_path.open() as f:
-        obj = json.load(f)
+    if json_path.is_dir():
+        obj = load_columnar(str(json_path)).keys
+    else:
+        with json_path.open() as f:
+            obj = json.load(f)
     zip_list = sorted({z for z in obj if z})
-    covered = pd.DataFrame({"zip": zip_list})
-
 
-    in_ny = geo["ZCTA5CE10"].between("00501", "14925")
-    geo["in_dataset_extent"] = in_ny
-    geo["covered"] = geo["ZCTA5CE10"].isin(covered["zip"])
+    geo["covered"] = geo[ZCTA_COL].isin(zip_list)
 
     m = folium.Map(location=[42.9, -75.0], zoom_start=6, tiles="cartodbpositron")
     def style_fn(feat):
@@ -49,8 +57,8 @@ if __name__ == "__main__":
         name="NY ZIP coverage",
         style_function=style_fn,
         tooltip=folium.GeoJsonTooltip(
-            fields=["ZCTA5CE10", "in_dataset_extent", "covered"],
-            aliases=["ZIP", "In dataset extent", "Covered"],
+            fields=[ZCTA_COL, "covered"],
+            aliases=["ZIP", "Covered"],
             localize=True,
         ),
     ).add_to(m)
@@ -59,3 +67,7 @@ if __name__ == "__main__":
     output_path.parent.mkdir(parents=True, exist_ok=True)
     m.save(str(output_path))
     print(cf.seaGreen(f"Saved map → {cf.bold(cf.yellow(output_path))}"))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
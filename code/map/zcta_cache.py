@@ -0,0 +1,109 @@
+import hashlib
+import importlib.util
+import os
+import sys
+import time
+from pathlib import Path
+import colorful as cf
+
+cf.use_style('monokai')
+
+ZCTA_COL = "ZCTA5CE10"
+# NY ZCTA range used by the dataset, and a bounding box (minx, miny, maxx, maxy) around the state
+ZIP_RANGE = ("00501", "14925")
+NY_BOUNDS = (-79.8, 40.4, -71.8, 45.1)
+DEFAULT_MAX_ZOOM = 10
+CACHE_DIR = "./outputs/cache"
+
+
+def simplify_tolerance(max_zoom):
+    '''
+    Degrees covered by one 256px web map tile pixel at max_zoom; vertices closer
+    than this to the simplified outline cannot be seen at that zoom or below
+    '''
+    return 360 / (256 * 2 ** max_zoom)
+
+
+def cache_format():
+    return "parquet" if importlib.util.find_spec("pyarrow") is not None else "geojson"
+
+
+def default_cache_path(zcta_path, max_zoom=DEFAULT_MAX_ZOOM):
+    '''
+    Cache file for one shapefile: the name carries a hash of its resolved path
+    and size, so a different shapefile never picks up another one's cache
+    '''
+    source = os.path.realpath(zcta_path)
+    key = hashlib.sha1(f"{source}:{os.path.getsize(source)}".encode()).hexdigest()[:12]
+    return os.path.join(CACHE_DIR, f"zcta_ny_{key}_z{max_zoom}.{cache_format()}")
+
+
+'''
+Read the national ZCTA shapefile inside the NY bounding box, keep the NY ZCTA
+range, simplify to one pixel at max_zoom and write the result as GeoParquet
+(when pyarrow is installed) or GeoJSON
+'''
+def build_cache(zcta_path, cache_path=None, max_zoom=DEFAULT_MAX_ZOOM, zip_range=ZIP_RANGE, bounds=NY_BOUNDS):
+    import geopandas as gpd
+
+    cache_path = cache_path or default_cache_path(zcta_path, max_zoom)
+    tolerance = simplify_tolerance(max_zoom)
+    geo = gpd.read_file(zcta_path, columns=[ZCTA_COL], bbox=bounds)
+    geo[ZCTA_COL] = geo[ZCTA_COL].astype(str).str.zfill(5)
+    geo = geo[geo[ZCTA_COL].between(*zip_range)].to_crs(epsg=4326)
+    geo["geometry"] = geo.geometry.simplify(tolerance, preserve_topology=True).set_precision(tolerance / 10)
+    geo = geo[~geo.geometry.is_empty].sort_values(ZCTA_COL).reset_index(drop=True)
+
+    os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+    if cache_path.endswith(".parquet"):
+        geo.to_parquet(cache_path, index=False)
+    else:
+        geo.to_file(cache_path, driver="GeoJSON")
+    return geo
+
+
+def load_cache(cache_path):
+    import geopandas as gpd
+    if cache_path.endswith(".parquet"):
+        return gpd.read_parquet(cache_path)
+    return gpd.read_file(cache_path)
+
+
+'''
+Geometry for the map: load the cache for zcta_path, rebuilding it first when it
+is missing or older than the shapefile. A path that already is a cache file is
+loaded as is.
+'''
+def load_zctas(zcta_path, cache_path=None, max_zoom=DEFAULT_MAX_ZOOM):
+    zcta_path = str(zcta_path)
+    if zcta_path.endswith((".parquet", ".geojson")):
+        return load_cache(zcta_path)
+    cache_path = cache_path or default_cache_path(zcta_path, max_zoom)
+    if not os.path.exists(cache_path) or os.path.getmtime(cache_path) < os.path.getmtime(zcta_path):
+        print(cf.bold(cf.seaGreen(f"Building ZCTA cache: {cf.yellow(cache_path)}")))
+        return build_cache(zcta_path, cache_path, max_zoom)
+    return load_cache(cache_path)
+
+
+'''
+Command line entry: ZCTA_PATH [CACHE_PATH] [MAX_ZOOM]
+'''
+def main(argv):
+    zcta_path = Path(argv[0])
+    cache_path = argv[1] if len(argv) > 1 else None
+    max_zoom = int(argv[2]) if len(argv) > 2 else DEFAULT_MAX_ZOOM
+    if not zcta_path.exists():
+        print(f"Error: shapefile '{zcta_path}' not found.")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    cache_path = cache_path or default_cache_path(zcta_path, max_zoom)
+    geo = build_cache(str(zcta_path), cache_path, max_zoom)
+    print(cf.bold(cf.seaGreen(f"Cached {cf.yellow(len(geo))} ZCTAs simplified to "
+                              f"{cf.yellow(f'{simplify_tolerance(max_zoom):.5f}')} deg in "
+                              f"{cf.yellow(f'{time.perf_counter() - start:.1f}s')}")))
+    print(cf.bold(cf.seaGreen(f"Saved ZCTA cache to: {cf.yellow(cache_path)}")))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
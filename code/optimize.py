@@ -1,27 +1,39 @@
-import json
-from gurobipy import Model, GRB, quicksum
+import os
+from concurrent.futures import ProcessPoolExecutor
+from gurobipy import Model, GRB, LinExpr, quicksum
 import colorful as cf
+import numpy as np
+import json
+import math
 import sys
+import time
 from structs.zipcode import Zipcodes
+from conflicts import ConflictIndex
+from params import FACILITY_TYPES, ALPHA, BETA, DELTA, DIST_LIMIT, resolve_params
+from report import RunReport, model_counts, solve_stats, status_name, write_plan
 import utils
 
 cf.use_style('monokai')
 
-# ---------- Constants ----------
-FACILITY_TYPES = {
-    "S": {"Cap": 100, "Cap05": 50,  "Cost": 65000},
-    "M": {"Cap": 200, "Cap05": 100, "Cost": 95000},
-    "L": {"Cap": 400, "Cap05": 200, "Cost": 115000},
-}
-ALPHA = 200
-BETA  = 100
-DELTA = 20000
-DIST_LIMIT = 0.06
-
-def optimize(zipcodes: Zipcodes, bin_size, plot_on, part2=False):
+# Anytime mode: wall-clock budget in seconds for both parts, target MIP gap and incumbent directory
+ANYTIME_TIME_LIMIT = 600.0
+ANYTIME_MIP_GAP = 0.01
+INCUMBENT_DIR = "./outputs/incumbents"
+# Modes that solve many independent models or compare formulations, where one
+# budget and gap target have no single solve to apply to
+UNLIMITED_MODES = ("decomposed", "compare", "trigger-bench", "conflict-bench")
+# Bump whenever the builders change the model they write for the same inputs,
+# so cached per-zipcode solutions (incremental.py) are re-solved
+FORMULATION_VERSION = 2
+
+def build_model(zipcodes: Zipcodes, part2=False, zips=None, params=None, conflict_index=None,
+                trigger="indicator", conflicts="pairwise"):
+    FACILITY_TYPES, ALPHA, BETA, DELTA, DIST_LIMIT = resolve_params(params)
     # ---------- Sets ----------
-    I = zipcodes.get_complete_data()
+    I = zipcodes.get_complete_data() if zips is None else zips
     F = zipcodes.get_facilities()
+    arrays = zipcodes.get_arrays()
+    children_cap = dict(zip(arrays["facility_keys"], arrays["facility_children_cap"].tolist()))
 
     m = Model("childcare_deserts")
     m.Params.OutputFlag = 0
@@ -46,17 +58,16 @@ def optimize(zipcodes: Zipcodes, bin_size, plot_on, part2=False):
     y, v, y_site, v_site = {}, {}, {}, {}
     if part2:
         for i in I:
-            locs = zipcodes.data[i]["potential_locations"]
-            for l in range(len(locs)):
+            for l in range(zipcodes.get_site_count(i)):
                 for s in FACILITY_TYPES:
                     y_site[i, l, s] = m.addVar(vtype=GRB.BINARY, name=f"y_site[{i},{l},{s}]")
                     v_site[i, l, s] = m.addVar(lb=0.0, vtype=GRB.INTEGER, name=f"v_site[{i},{l},{s}]")
         # aggregate to zipcode level
         for i in I:
-            locs = zipcodes.data[i]["potential_locations"]
+            n_sites = zipcodes.get_site_count(i)
             for s in FACILITY_TYPES:
-                y[i, s] = quicksum(y_site[i, l, s] for l in range(len(locs)))
-                v[i, s] = quicksum(v_site[i, l, s] for l in range(len(locs)))
+                y[i, s] = quicksum(y_site[i, l, s] for l in range(n_sites))
+                v[i, s] = quicksum(v_site[i, l, s] for l in range(n_sites))
     else:
         for i in I:
             for s in FACILITY_TYPES:
@@ -70,21 +81,21 @@ def optimize(zipcodes: Zipcodes, bin_size, plot_on, part2=False):
     # Expansion limits
     for i in I:
         for f in F[i]:
-            cap = zipcodes.get_children_cap_for_facility(i, f)
+            cap = children_cap[f]
             if part2:
-                m.addConstr(x[f] == t1[f] + t2[f] + t3[f])
-                m.addConstr(t1[f] <= 0.10 * cap)
-                m.addConstr(t2[f] <= 0.05 * cap)
-                m.addConstr(t3[f] <= 0.05 * cap)
+                m.addConstr(x[f] == t1[f] + t2[f] + t3[f], name=f"tier_split[{f}]")
+                m.addConstr(t1[f] <= 0.10 * cap, name=f"tier1_limit[{f}]")
+                m.addConstr(t2[f] <= 0.05 * cap, name=f"tier2_limit[{f}]")
+                m.addConstr(t3[f] <= 0.05 * cap, name=f"tier3_limit[{f}]")
                 limit = min(1.2 * cap, 500)
                 if cap > limit:
                     limit = cap
-                m.addConstr(cap + x[f] <= limit)
+                m.addConstr(cap + x[f] <= limit, name=f"expansion_limit[{f}]")
             else:
                 limit = min(2.2 * cap, 500)
                 if cap > limit:
                     limit = cap
-                m.addConstr(cap + x[f] <= limit)
+                m.addConstr(cap + x[f] <= limit, name=f"expansion_limit[{f}]")
 
     # Coverage and 0–5 coverage
     for i in I:
@@ -92,59 +103,69 @@ def optimize(zipcodes: Zipcodes, bin_size, plot_on, part2=False):
             zipcodes.get_children_cap_for_zipcode(i) +
             quicksum(x[f] for f in F[i]) +
             quicksum(FACILITY_TYPES[s]["Cap"] * y[i, s] for s in FACILITY_TYPES)
-            >= zipcodes.get_theta_for_zipcode(i) * zipcodes.get_children_population_for_zipcode(i)
+            >= zipcodes.get_theta_for_zipcode(i) * zipcodes.get_children_population_for_zipcode(i),
+            name=f"coverage[{i}]"
         )
         m.addConstr(
             zipcodes.get_infant_cap_for_zipcode(i) +
             quicksum(u[f] for f in F[i]) +
             quicksum(v[i, s] for s in FACILITY_TYPES)
-            >= (2/3) * zipcodes.get_infant_population_for_zipcode(i)
+            >= (2/3) * zipcodes.get_infant_population_for_zipcode(i),
+            name=f"infant_coverage[{i}]"
         )
 
     # Consistency
     for i in I:
         for f in F[i]:
-            m.addConstr(u[f] <= x[f])
+            m.addConstr(u[f] <= x[f], name=f"infant_consistency[{f}]")
         for s in FACILITY_TYPES:
-            m.addConstr(v[i, s] <= FACILITY_TYPES[s]["Cap05"] * y[i, s])
+            m.addConstr(v[i, s] <= FACILITY_TYPES[s]["Cap05"] * y[i, s], name=f"build_consistency[{i},{s}]")
 
     # Binary trigger
     if not part2:
         for i in I:
             for f in F[i]:
-                cap = zipcodes.get_children_cap_for_facility(i, f)
+                cap = children_cap[f]
                 limit = min(2.2 * cap, 500.0)
                 if cap > limit:
                     limit = cap
-                m.addGenConstrIndicator(z[f], True,  x[f] >= cap,    name=f"trigger_on[{f}]")
-                m.addGenConstrIndicator(z[f], False, x[f] <= cap - 1e-3, name=f"trigger_off[{f}]")
+                if trigger == "bigm":
+                    # x is integer and bounded by the expansion limit, so the indicator
+                    # pair is exactly x >= ceil(cap) * z and x <= floor(cap - 1e-3) + (ub - floor(cap - 1e-3)) * z
+                    on, off, ub = math.ceil(cap), math.floor(cap - 1e-3), math.floor(limit - cap + 1e-9)
+                    if on > ub:
+                        z[f].UB = 0
+                    m.addConstr(x[f] >= on * z[f], name=f"trigger_on[{f}]")
+                    m.addConstr(x[f] <= off + (ub - off) * z[f], name=f"trigger_off[{f}]")
+                else:
+                    m.addGenConstrIndicator(z[f], True,  x[f] >= cap,    name=f"trigger_on[{f}]")
+                    m.addGenConstrIndicator(z[f], False, x[f] <= cap - 1e-3, name=f"trigger_off[{f}]")
     else:
         # site constraints
         for i in I:
-            locs = zipcodes.data[i]["potential_locations"]
-            for l in range(len(locs)):
-                m.addConstr(quicksum(y_site[i, l, s] for s in FACILITY_TYPES) <= 1)
+            for l in range(zipcodes.get_site_count(i)):
+                m.addConstr(quicksum(y_site[i, l, s] for s in FACILITY_TYPES) <= 1, name=f"one_size[{i},{l}]")
 
-        # distance between potential locations
+        conflict_index = conflict_index or ConflictIndex(zipcodes)
         for i in I:
-            locs = zipcodes.data[i]["potential_locations"]
-            for a in range(len(locs)):
-                for b in range(a + 1, len(locs)):
-                    d = zipcodes.get_site_distance(i, a, b)
-                    if d < DIST_LIMIT:
-                        m.addConstr(
-                            quicksum(y_site[i, a, s] for s in FACILITY_TYPES) +
-                            quicksum(y_site[i, b, s] for s in FACILITY_TYPES) <= 1
-                        )
-
-        # distance between potential locations and existing facilities
-        for i in I:
-            locs = zipcodes.data[i]["potential_locations"]
-            for l in range(len(locs)):
-                for f in F[i]:
-                    d = zipcodes.get_distance_to_facility(i, l, f)
-                    if d < DIST_LIMIT:
-                        m.addConstr(quicksum(y_site[i, l, s] for s in FACILITY_TYPES) <= 1)
+            if conflicts == "clique":
+                # one row per maximal clique of mutually close sites; the
+                # site/facility rows are implied by one_size
+                for k, clique in enumerate(conflict_index.cliques(i, DIST_LIMIT)):
+                    m.addConstr(quicksum(y_site[i, l, s] for l in clique for s in FACILITY_TYPES) <= 1,
+                                name=f"site_clique[{i},{k}]")
+                continue
+            site_pairs, facility_pairs = conflict_index.conflicts(i, DIST_LIMIT)
+            # distance between potential locations
+            for a, b in site_pairs:
+                m.addConstr(
+                    quicksum(y_site[i, a, s] for s in FACILITY_TYPES) +
+                    quicksum(y_site[i, b, s] for s in FACILITY_TYPES) <= 1,
+                    name=f"site_conflict[{i},{a},{b}]"
+                )
+            # distance between potential locations and existing facilities
+            for l, f in facility_pairs:
+                m.addConstr(quicksum(y_site[i, l, s] for s in FACILITY_TYPES) <= 1, name=f"facility_conflict[{i},{l},{f}]")
 
 
     # ---------- Objective Function ----------
@@ -157,7 +178,7 @@ def optimize(zipcodes: Zipcodes, bin_size, plot_on, part2=False):
         expansion_cost_terms = []
         for i in I:
             for f in F[i]:
-                cap = zipcodes.get_children_cap_for_facility(i, f)
+                cap = children_cap[f]
                 coef_base = 20000.0 / cap
                 expansion_cost_terms.append((200.0 + coef_base)  * t1[f])
                 expansion_cost_terms.append((400.0 + coef_base)  * t2[f])
@@ -165,43 +186,573 @@ def optimize(zipcodes: Zipcodes, bin_size, plot_on, part2=False):
         expansion_cost = quicksum(expansion_cost_terms)
     else:
         expansion_cost = quicksum(
-            (DELTA + 200.0 * zipcodes.get_children_cap_for_facility(i, f)) * z[f] + ALPHA * x[f]
+            (DELTA + 200.0 * children_cap[f]) * z[f] + ALPHA * x[f]
             for i in I for f in F[i]
         )
     m.setObjective(expansion_cost + facility_cost + equip_cost, GRB.MINIMIZE)
-    
+
+    variables = {"x": x, "u": u, "z": z, "t1": t1, "t2": t2, "t3": t3,
+                 "y": y, "v": v, "y_site": y_site, "v_site": v_site}
+    return m, variables, (expansion_cost, facility_cost, equip_cost)
+
+
+'''
+Same formulation as build_model, built in bulk from flat NumPy arrays with the
+matrix API instead of one addVar/addConstr call per facility and site
+'''
+def build_model_matrix(zipcodes: Zipcodes, part2=False, zips=None, params=None, conflict_index=None,
+                       trigger="indicator", conflicts="pairwise"):
+    import scipy.sparse as sp
+    FACILITY_TYPES, ALPHA, BETA, DELTA, DIST_LIMIT = resolve_params(params)
+    # ---------- Index maps ----------
+    I = list(zipcodes.get_complete_data() if zips is None else zips)
+    arrays = zipcodes.get_arrays()
+    sizes = list(FACILITY_TYPES)
+    zip_idx = np.array([arrays["index"][i] for i in I], dtype=np.int64)
+    starts, stops = arrays["facility_offsets"][zip_idx], arrays["facility_offsets"][zip_idx + 1]
+    fac_pos = np.concatenate([np.arange(a, b) for a, b in zip(starts, stops)] + [np.zeros(0, dtype=np.int64)])
+    fac_ids = [arrays["facility_keys"][p] for p in fac_pos.tolist()]
+    fac_zip = np.repeat(np.arange(len(I)), stops - starts)
+    cap = np.asarray(arrays["facility_children_cap"], dtype=float)[fac_pos]
+    n_zip, n_fac = len(I), len(fac_ids)
+    A = sp.csr_matrix((np.ones(n_fac), (fac_zip, np.arange(n_fac))), shape=(n_zip, n_fac))
+
+    child_rhs = arrays["theta"][zip_idx] * arrays["population0_12"][zip_idx] - arrays["children_cap"][zip_idx]
+    infant_rhs = (2/3) * arrays["population0_5"][zip_idx] - arrays["infant_cap"][zip_idx]
+    size_cap = np.array([FACILITY_TYPES[s]["Cap"] for s in sizes], dtype=float)
+    size_cap05 = np.array([FACILITY_TYPES[s]["Cap05"] for s in sizes], dtype=float)
+    size_cost = np.array([FACILITY_TYPES[s]["Cost"] for s in sizes], dtype=float)
+
+    m = Model("childcare_deserts")
+    m.Params.OutputFlag = 0
+
+    # ---------- Decision variables ----------
+    x = m.addMVar(n_fac, lb=0.0, vtype=GRB.INTEGER, name="x")
+    u = m.addMVar(n_fac, lb=0.0, vtype=GRB.INTEGER, name="u")
+    if part2:
+        t = [m.addMVar(n_fac, lb=0.0, vtype=GRB.INTEGER, name=f"t{k}") for k in (1, 2, 3)]
+        site_counts = np.diff(arrays["site_offsets"])[zip_idx]
+        site_offset = np.concatenate([[0], np.cumsum(site_counts)])
+        n_site = int(site_offset[-1])
+        site_zip = np.repeat(np.arange(n_zip), np.diff(site_offset))
+        B = sp.csr_matrix((np.ones(n_site), (site_zip, np.arange(n_site))), shape=(n_zip, n_site))
+        y_site = m.addMVar((n_site, len(sizes)), vtype=GRB.BINARY, name="y_site")
+        v_site = m.addMVar((n_site, len(sizes)), lb=0.0, vtype=GRB.INTEGER, name="v_site")
+        Y = [B @ y_site[:, k] for k in range(len(sizes))]
+        V = [B @ v_site[:, k] for k in range(len(sizes))]
+    else:
+        z = m.addMVar(n_fac, vtype=GRB.BINARY, name="z")
+        y_zip = m.addMVar((n_zip, len(sizes)), lb=0, vtype=GRB.INTEGER, name="y")
+        v_zip = m.addMVar((n_zip, len(sizes)), lb=0.0, vtype=GRB.INTEGER, name="v")
+        Y = [y_zip[:, k] for k in range(len(sizes))]
+        V = [v_zip[:, k] for k in range(len(sizes))]
+
+    # ---------- Constraints ----------
+    # Expansion limits
+    limit = np.minimum((1.2 if part2 else 2.2) * cap, 500.0)
+    limit = np.maximum(limit, cap)
+    if part2:
+        m.addConstr(x == t[0] + t[1] + t[2], name="tier_split")
+        m.addConstr(t[0] <= 0.10 * cap, name="tier1_limit")
+        m.addConstr(t[1] <= 0.05 * cap, name="tier2_limit")
+        m.addConstr(t[2] <= 0.05 * cap, name="tier3_limit")
+    m.addConstr(x <= limit - cap, name="expansion_limit")
+
+    # Coverage and 0–5 coverage
+    m.addConstr(A @ x + sum(size_cap[k] * Y[k] for k in range(len(sizes))) >= child_rhs, name="coverage")
+    m.addConstr(A @ u + sum(V[k] for k in range(len(sizes))) >= infant_rhs, name="infant_coverage")
+
+    # Consistency
+    m.addConstr(u <= x, name="infant_consistency")
+    for k in range(len(sizes)):
+        m.addConstr(V[k] - size_cap05[k] * Y[k] <= 0, name="build_consistency")
+
+    # Binary trigger
+    x_list, z_list = x.tolist(), None
+    if not part2:
+        z_list = z.tolist()
+        if trigger == "bigm":
+            on, off, ub = np.ceil(cap), np.floor(cap - 1e-3), np.floor(limit - cap + 1e-9)
+            z.UB = np.where(on > ub, 0.0, 1.0)
+            m.addConstr(x >= on * z, name="trigger_on")
+            m.addConstr(x <= off + (ub - off) * z, name="trigger_off")
+        else:
+            for k, f in enumerate(fac_ids):
+                m.addGenConstrIndicator(z_list[k], True,  x_list[k] >= cap[k],    name=f"trigger_on[{f}]")
+                m.addGenConstrIndicator(z_list[k], False, x_list[k] <= cap[k] - 1e-3, name=f"trigger_off[{f}]")
+    else:
+        # site constraints
+        m.addConstr(y_site.sum(axis=1) <= 1, name="one_size")
+        # conflict rows: one per site pair and one per site/facility pair, or with
+        # conflicts="clique" one per maximal clique of conflicting sites
+        site_rows, facility_rows, clique_rows = [], [], []
+        conflict_index = conflict_index or ConflictIndex(zipcodes)
+        for k, i in enumerate(I):
+            base = site_offset[k]
+            if conflicts == "clique":
+                clique_rows += [tuple(base + l for l in clique) for clique in conflict_index.cliques(i, DIST_LIMIT)]
+                continue
+            site_pairs, facility_pairs = conflict_index.conflicts(i, DIST_LIMIT)
+            site_rows += [(base + a, base + b) for a, b in site_pairs]
+            facility_rows += [(base + l,) for l, _ in facility_pairs]
+        for conflict_rows, name in ((site_rows, "site_conflict"), (facility_rows, "facility_conflict"),
+                                    (clique_rows, "site_clique")):
+            if not conflict_rows:
+                continue
+            r = np.repeat(np.arange(len(conflict_rows)), [len(row) for row in conflict_rows])
+            c = np.fromiter((g for row in conflict_rows for g in row), dtype=np.int64, count=len(r))
+            C = sp.csr_matrix((np.ones(len(r)), (r, c)), shape=(len(conflict_rows), n_site))
+            m.addConstr(sum(C @ y_site[:, k] for k in range(len(sizes))) <= 1, name=name)
+
+    # ---------- Objective Function ----------
+    if part2:
+        facility_cost = LinExpr(np.repeat(size_cost[None, :], n_site, axis=0).ravel().tolist(), y_site.reshape(-1).tolist())
+    else:
+        facility_cost = LinExpr(np.repeat(size_cost[None, :], n_zip, axis=0).ravel().tolist(), y_zip.reshape(-1).tolist())
+    v_all = (v_site if part2 else v_zip).reshape(-1).tolist()
+    equip_cost = BETA * (LinExpr([1.0] * n_fac, u.tolist()) + LinExpr([1.0] * len(v_all), v_all))
+    if part2:
+        coef_base = 20000.0 / cap
+        expansion_cost = LinExpr(
+            np.concatenate([200.0 + coef_base, 400.0 + coef_base, 1000.0 + coef_base]).tolist(),
+            t[0].tolist() + t[1].tolist() + t[2].tolist(),
+        )
+    else:
+        expansion_cost = LinExpr(
+            np.concatenate([DELTA + 200.0 * cap, np.full(n_fac, float(ALPHA))]).tolist(),
+            z_list + x_list,
+        )
+    m.setObjective(expansion_cost + facility_cost + equip_cost, GRB.MINIMIZE)
+    m.update()
+
+    # ---------- Dictionary views keyed like build_model ----------
+    x_d, u_d = dict(zip(fac_ids, x_list)), dict(zip(fac_ids, u.tolist()))
+    z_d, t1, t2, t3 = {}, {}, {}, {}
+    y, v, y_site_d, v_site_d = {}, {}, {}, {}
+    if part2:
+        t1, t2, t3 = (dict(zip(fac_ids, tk.tolist())) for tk in t)
+        ys, vs = y_site.tolist(), v_site.tolist()
+        for k, i in enumerate(I):
+            span = range(site_offset[k], site_offset[k + 1])
+            for si, s in enumerate(sizes):
+                for l, g in enumerate(span):
+                    y_site_d[i, l, s] = ys[g][si]
+                    v_site_d[i, l, s] = vs[g][si]
+                y[i, s] = LinExpr([1.0] * len(span), [ys[g][si] for g in span])
+                v[i, s] = LinExpr([1.0] * len(span), [vs[g][si] for g in span])
+    else:
+        z_d = dict(zip(fac_ids, z_list))
+        ys, vs = y_zip.tolist(), v_zip.tolist()
+        for k, i in enumerate(I):
+            for si, s in enumerate(sizes):
+                y[i, s] = ys[k][si]
+                v[i, s] = vs[k][si]
+
+    variables = {"x": x_d, "u": u_d, "z": z_d, "t1": t1, "t2": t2, "t3": t3,
+                 "y": y, "v": v, "y_site": y_site_d, "v_site": v_site_d}
+    return m, variables, (expansion_cost, facility_cost, equip_cost)
+
+
+'''
+Build and solve the model with both builders and check the objectives agree
+'''
+def compare_builders(zipcodes: Zipcodes, part2=False):
+    results = {}
+    for name, builder in (("loop", build_model), ("matrix", build_model_matrix)):
+        start = time.perf_counter()
+        m, _, _ = builder(zipcodes, part2)
+        build_time = time.perf_counter() - start
+        m.Params.MIPGap = 0.0
+        m.optimize()
+        results[name] = {
+            "build_time": build_time,
+            "solve_time": m.Runtime,
+            "objective": m.ObjVal if m.SolCount > 0 else None,
+            "num_vars": m.NumVars,
+            "num_constrs": m.NumConstrs + m.NumGenConstrs,
+        }
+
+    loop, matrix = results["loop"]["objective"], results["matrix"]["objective"]
+    match = loop is not None and matrix is not None and abs(loop - matrix) <= 1e-6 * max(1.0, abs(loop))
+    print(cf.bold(cf.seaGreen(f"===== BUILDER COMPARISON ({'Part 2' if part2 else 'Part 1'}) =====")))
+    for name, r in results.items():
+        objective = "n/a" if r["objective"] is None else f"${r['objective']:,.0f}"
+        print(cf.yellow(f"  {name:<8}") + cf.bold(
+            f"build {r['build_time']:.2f}s  solve {r['solve_time']:.2f}s  "
+            f"vars {r['num_vars']}  constrs {r['num_constrs']}  objective {objective}"))
+    print(cf.yellow(f"  {'match':<8}") + cf.bold(str(match)))
+    return match, results
+
+
+'''
+Solve Part 1 with the indicator and the big-M trigger formulations to proven
+optimality, recording node count, solve time and the incumbent/bound timeline
+'''
+def benchmark_trigger(zipcodes: Zipcodes, time_limit=None, builder=build_model):
+    results = {}
+    for trigger in ("indicator", "bigm"):
+        m, _, _ = builder(zipcodes, part2=False, trigger=trigger)
+        m.Params.MIPGap = 0.0
+        if time_limit is not None:
+            m.Params.TimeLimit = time_limit
+        timeline = []
+
+        def callback(model, where):
+            if where == GRB.Callback.MIP:
+                best = model.cbGet(GRB.Callback.MIP_OBJBST)
+                bound = model.cbGet(GRB.Callback.MIP_OBJBND)
+                gap = abs(best - bound) / max(abs(best), 1e-10) if best < GRB.INFINITY else None
+                point = (model.cbGet(GRB.Callback.RUNTIME), best, bound, gap)
+                if not timeline or timeline[-1][1:] != point[1:]:
+                    timeline.append(point)
+
+        m.optimize(callback)
+        results[trigger] = {
+            "status": m.Status,
+            "objective": m.ObjVal if m.SolCount > 0 else None,
+            "bound": m.ObjBound,
+            "nodes": m.NodeCount,
+            "solve_time": m.Runtime,
+            "root_relaxation_gap": timeline[0][3] if timeline else None,
+            "timeline": [{"time": t, "incumbent": b, "bound": d, "gap": g} for t, b, d, g in timeline],
+        }
+
+    indicator, bigm = results["indicator"]["objective"], results["bigm"]["objective"]
+    match = indicator is not None and bigm is not None and abs(indicator - bigm) <= 1e-6 * max(1.0, abs(indicator))
+    print(cf.bold(cf.seaGreen("===== PART 1 TRIGGER BENCHMARK =====")))
+    for name, r in results.items():
+        objective = "n/a" if r["objective"] is None else f"${r['objective']:,.0f}"
+        print(cf.yellow(f"  {name:<10}") + cf.bold(
+            f"nodes {r['nodes']:.0f}  solve {r['solve_time']:.2f}s  objective {objective}"))
+        for point in r["timeline"]:
+            gap = "-" if point["gap"] is None else f"{100 * point['gap']:.2f}%"
+            print(cf.seaGreen(f"      t={point['time']:.2f}s gap {gap}"))
+    print(cf.yellow(f"  {'match':<10}") + cf.bold(str(match)))
+    return match, results
+
+
+'''
+Solve Part 2 with pairwise and with clique-aggregated conflict rows to proven
+optimality, recording conflict row counts, root bound, node count and times
+'''
+def benchmark_conflicts(zipcodes: Zipcodes, time_limit=None, builder=build_model):
+    # conflicts are found once so the build times compare the rows alone
+    conflict_index = ConflictIndex(zipcodes)
+    conflict_index.precompute(zipcodes.get_complete_data(), DIST_LIMIT)
+    results = {}
+    for conflicts in ("pairwise", "clique"):
+        start = time.perf_counter()
+        m, _, _ = builder(zipcodes, part2=True, conflict_index=conflict_index, conflicts=conflicts)
+        build_time = time.perf_counter() - start
+        m.Params.MIPGap = 0.0
+        if time_limit is not None:
+            m.Params.TimeLimit = time_limit
+        root = {}
+
+        def callback(model, where):
+            if where == GRB.Callback.MIP and "bound" not in root:
+                root["bound"] = model.cbGet(GRB.Callback.MIP_OBJBND)
+
+        m.optimize(callback)
+        counts = model_counts(m)["constraints"]
+        results[conflicts] = {
+            "conflict_rows": {name: counts.get(name, 0) for name in ("site_conflict", "facility_conflict", "site_clique")},
+            "num_constrs": m.NumConstrs,
+            "build_time": build_time,
+            "status": m.Status,
+            "objective": m.ObjVal if m.SolCount > 0 else None,
+            "root_bound": root.get("bound"),
+            "nodes": m.NodeCount,
+            "solve_time": m.Runtime,
+        }
+
+    pairwise, clique = results["pairwise"]["objective"], results["clique"]["objective"]
+    match = pairwise is not None and clique is not None and abs(pairwise - clique) <= 1e-6 * max(1.0, abs(pairwise))
+    print(cf.bold(cf.seaGreen("===== PART 2 CONFLICT ROWS BENCHMARK =====")))
+    for name, r in results.items():
+        objective = "n/a" if r["objective"] is None else f"${r['objective']:,.0f}"
+        rows = sum(r["conflict_rows"].values())
+        print(cf.yellow(f"  {name:<10}") + cf.bold(
+            f"conflict rows {rows}  constrs {r['num_constrs']}  build {r['build_time']:.2f}s  "
+            f"solve {r['solve_time']:.2f}s  nodes {r['nodes']:.0f}  objective {objective}"))
+    print(cf.yellow(f"  {'match':<10}") + cf.bold(str(match)))
+    return match, results
+
+
+'''
+Print the optimization summary for one part
+'''
+def print_summary(objective, part2, status="OPTIMAL", bound=None, gap=None):
+    if part2:
+        print(cf.bold(cf.seaGreen("=== Part 2 Optimization summary ===")))
+    else:
+        print(cf.bold(cf.seaGreen("\n=== Part 1 Optimization summary ===")))
+    print(cf.seaGreen("Status: " + cf.bold(cf.yellow(status))))
+    print(cf.seaGreen("Objective value: " + cf.bold(cf.yellow(f"${objective:,.0f}"))))
+    if status != "OPTIMAL" and bound is not None and gap is not None:
+        print(cf.seaGreen("Best bound: " + cf.bold(cf.yellow(f"${bound:,.0f}")) +
+                          "  gap " + cf.bold(cf.yellow(f"{100 * gap:.2f}%"))))
+    print("\n")
+
+
+'''
+Render the result plots for a solved model. The solution is snapshotted in
+bulk first; with a renderer the figures are drawn in the background.
+'''
+def plot_results(zipcodes: Zipcodes, m, variables, costs, bin_size, part2, renderer=None):
+    plot_snapshot(utils.solution_snapshot(zipcodes, m, variables, costs, FACILITY_TYPES, part2), bin_size, renderer)
+
+
+def plot_snapshot(snapshot, bin_size, renderer=None):
+    if renderer is not None:
+        renderer.submit(snapshot, bin_size)
+    else:
+        for plot in utils.PLOTS:
+            plot(snapshot, bin_size)
+
+
+'''
+Build and solve one part. With time_limit (seconds), deadline (a
+time.perf_counter() value covering the conflict, build and warm start time as
+well) and/or mip_gap the solve may stop early, and the best plan found is
+reported and plotted even when it is not proven optimal. A warm-started solve
+reports the heuristic bound when it is tighter than the solver's. With
+incumbent_dir, every improved incumbent is written there while solving, and the
+final plan as part{1,2}_best.json.
+'''
+def optimize(zipcodes: Zipcodes, bin_size, plot_on, part2=False, builder=build_model, warm_start=False,
+             report=None, renderer=None, time_limit=None, mip_gap=None, incumbent_dir=None, deadline=None,
+             **build_options):
+    report = report or RunReport()
+    part = 2 if part2 else 1
+    if part2 and build_options.get("conflict_index") is None:
+        # Distance conflicts are found up front so their cost shows separately from the build,
+        # and stored per dataset and radius so later runs load them instead
+        with report.phase("conflicts", part):
+            conflict_index = ConflictIndex(zipcodes)
+            zips = build_options.get("zips")
+            n_site, n_facility, path, cached = conflict_index.precompute_cached(
+                zipcodes.get_complete_data() if zips is None else zips, resolve_params(build_options.get("params"))[4])
+        report.part(part)["conflict_pairs"] = {"site": n_site, "facility": n_facility, "artifact": path,
+                                               "cached": cached}
+        build_options["conflict_index"] = conflict_index
+
+    with report.phase("build", part):
+        m, variables, costs = builder(zipcodes, part2, **build_options)
+    report.record_model(part, m)
+    plan = None
+    if warm_start:
+        # Seed the solver with the greedy plan
+        import heuristic
+        with report.phase("heuristic", part):
+            plan = heuristic.solve(zipcodes, part2, params=build_options.get("params"), zips=build_options.get("zips"))
+            heuristic.apply_mip_start(variables, plan, part2)
+
     # ---------- Optimize ----------
-    m.optimize()
+    if deadline is not None:
+        remaining = deadline - time.perf_counter()
+        time_limit = remaining if time_limit is None else min(time_limit, remaining)
+    if time_limit is not None:
+        # a spent budget still gets a moment, in which Gurobi evaluates the MIP start
+        m.Params.TimeLimit = max(time_limit, 0.01)
+    if mip_gap is not None:
+        m.Params.MIPGap = mip_gap
+    with report.phase("solve", part):
+        m.optimize(report.incumbent_callback(part, m, incumbent_dir))
+    report.record_solve(part, m)
     status = m.Status
 
-    if status == GRB.OPTIMAL:
-        if part2:
-            print(cf.bold(cf.seaGreen("=== Part 2 Optimization summary ===")))
-        else:
-            print(cf.bold(cf.seaGreen("\n=== Part 1 Optimization summary ===")))
-        print(cf.seaGreen("Status: " + cf.bold(cf.yellow("OPTIMAL"))))
-        print(cf.seaGreen("Objective value: " + cf.bold(cf.yellow(f"${m.ObjVal:,.0f}"))))
-        print("\n")
+    if m.SolCount > 0:
+        # a time-limited solve keeps its best incumbent
+        solve = report.part(part)["solve"]
+        if plan is not None and (solve["bound"] is None or plan["bound"] > solve["bound"]):
+            # the solver stopped before proving a bound as tight as the heuristic one
+            solve["bound"], solve["bound_source"] = plan["bound"], "heuristic"
+            solve["mip_gap"] = abs(m.ObjVal - plan["bound"]) / abs(m.ObjVal) if m.ObjVal != 0 else None
+        print_summary(m.ObjVal, part2, status_name(status), solve["bound"], solve["mip_gap"])
+        if incumbent_dir is not None:
+            all_vars = m.getVars()
+            solve["plan_path"] = write_plan(os.path.join(incumbent_dir, f"part{part}_best.json"),
+                                            m.getAttr("VarName", all_vars), m.getAttr("X", all_vars), part=part,
+                                            status=solve["status_name"], objective=m.ObjVal,
+                                            bound=solve["bound"], mip_gap=solve["mip_gap"])
         if plot_on:
-            utils.plot_x_expansion(x, F, bin_size, part2)
-            utils.plot_u_expansion(u, bin_size, part2)
-            utils.plot_cost_breakdown(m, expansion_cost, facility_cost, equip_cost, part2)
-            utils.plot_added_capacity_by_zip(zipcodes, x, y, FACILITY_TYPES, part2)
+            with report.phase("plot", part):
+                plot_results(zipcodes, m, variables, costs, bin_size, part2, renderer)
     else:
         print(cf.orange("No feasible or optimal solution found."))
+    return report
 
-if __name__ == "__main__":
-    in_path = sys.argv[1] 
-    bin_size = int(sys.argv[2])
-    plot_on = sys.argv[3].lower() == "true"
+
+'''
+Solve the model restricted to a single zipcode. Every constraint involves only
+one zipcode's facilities and sites, so these subproblems are independent.
+Model counts and solver statistics come back with the solution for the run report.
+'''
+def solve_zipcode(zipcodes: Zipcodes, key, part2=False, threads=0, params=None):
+    start = time.perf_counter()
+    m, _, costs = build_model(zipcodes, part2, zips=[key], params=params)
+    build_time = time.perf_counter() - start
+    m.Params.Threads = threads
+    m.optimize()
+    stats = {"build_time": build_time, "model": model_counts(m), "solve": solve_stats(m)}
+    if m.Status != GRB.OPTIMAL:
+        return {"zipcode": key, "status": m.Status, "objective": None, "costs": None, "solution": {}, **stats}
+    return {
+        "zipcode": key,
+        "status": m.Status,
+        "objective": m.ObjVal,
+        "costs": [c.getValue() for c in costs],
+        "solution": {var.VarName: var.X for var in m.getVars()},
+        **stats,
+    }
+
+
+def _solve_zipcode_entry(args):
+    key, entry, part2, params = args
+    return solve_zipcode(Zipcodes({key: entry}), key, part2, threads=1, params=params)
+
+
+'''
+Solve one subproblem per zipcode across a process pool and combine the results
+'''
+def optimize_decomposed(zipcodes: Zipcodes, part2=False, processes=None, zips=None, params=None):
+    from tqdm import tqdm
+    keys = sorted(zipcodes.get_complete_data() if zips is None else zips)
+    tasks = [(key, zipcodes.data[key], part2, params) for key in keys]
+    chunksize = max(1, len(tasks) // (4 * (processes or os.cpu_count() or 1)))
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        results = list(tqdm(pool.map(_solve_zipcode_entry, tasks, chunksize=chunksize), total=len(tasks)))
+
+    per_zip = {r["zipcode"]: r for r in results}
+    infeasible = [k for k, r in per_zip.items() if r["objective"] is None]
+    solution = {}
+    for r in results:
+        solution.update(r["solution"])
+    objective = None if infeasible else sum(r["objective"] for r in results)
+    return {
+        "objective": objective,
+        "costs": None if infeasible else [sum(r["costs"][k] for r in results) for k in range(3)],
+        "solution": solution,
+        "per_zip": per_zip,
+        "infeasible": infeasible,
+    }
+
+
+'''
+time.perf_counter() deadlines for Part 1 and Part 2 of a time_limit budget
+starting now: Part 1 gets half of it, Part 2 whatever is left
+'''
+def part_deadlines(time_limit):
+    if time_limit is None:
+        return None, None
+    start = time.perf_counter()
+    return start + time_limit / 2, start + time_limit
+
+
+'''
+Command line entry: DATA_PATH BIN_SIZE PLOT_ON [MODE] [TIME_LIMIT] [MIP_GAP]
+'''
+def main(argv):
+    in_path = argv[0] 
+    bin_size = int(argv[1])
+    # "preview" renders the plots at a lower resolution
+    plot_on = argv[2].lower() in ("true", "preview")
+    plot_dpi = utils.PREVIEW_DPI if argv[2].lower() == "preview" else utils.FULL_DPI
+    mode = argv[3].lower() if len(argv) > 3 else "monolithic"
+    # "anytime" stops at the wall-clock budget or the target gap, whichever comes first
+    # an empty TIME_LIMIT or MIP_GAP keeps the default
+    time_limit = float(argv[4]) if len(argv) > 4 and argv[4] else (ANYTIME_TIME_LIMIT if mode == "anytime" else None)
+    mip_gap = float(argv[5]) if len(argv) > 5 and argv[5] else (ANYTIME_MIP_GAP if mode == "anytime" else None)
+    if mode in UNLIMITED_MODES and (time_limit is not None or mip_gap is not None):
+        print(f"Error: TIME_LIMIT and MIP_GAP are not supported in {mode} mode.")
+        sys.exit(1)
+
+    report = RunReport(in_path, mode)
+    # Plot workers start now and draw each part's figures while the next part solves
+    renderer = utils.PlotRenderer(dpi=plot_dpi) if plot_on else None
 
     # Fetch data
     print(cf.bold(cf.seaGreen(f"Got zipcode data from: {cf.yellow(in_path)}")))
-    with open(in_path, "r") as f:
-        data = json.load(f)
-    zipcodes = Zipcodes(data)
-
-    # Part 1 optimization
-    optimize(zipcodes, bin_size, plot_on, part2=False)
-    # Part 2 optimization
-    optimize(zipcodes, bin_size, plot_on, part2=True)
+    with report.phase("load"):
+        zipcodes = Zipcodes.load(in_path)
+
+    if mode == "compare":
+        # Check the matrix builder against the loop builder
+        compare_builders(zipcodes, part2=False)
+        compare_builders(zipcodes, part2=True)
+    elif mode == "trigger-bench":
+        # Indicator vs big-M Part 1 trigger formulation
+        match, results = benchmark_trigger(zipcodes)
+        os.makedirs("./outputs", exist_ok=True)
+        with open(os.path.join("./outputs", "trigger_benchmark.json"), "w") as f:
+            json.dump(results, f, indent=2)
+    elif mode == "conflict-bench":
+        # Pairwise vs clique-aggregated Part 2 conflict rows
+        match, results = benchmark_conflicts(zipcodes)
+        os.makedirs("./outputs", exist_ok=True)
+        with open(os.path.join("./outputs", "conflict_benchmark.json"), "w") as f:
+            json.dump(results, f, indent=2)
+    elif mode == "session":
+        # One shared model for both parts, Part 2 warm-started from Part 1
+        from session import SolverSession
+        session = SolverSession(zipcodes, report=report)
+        deadlines = part_deadlines(time_limit)
+        for part2 in (False, True):
+            if part2:
+                result = session.solve_part2(deadline=deadlines[1], mip_gap=mip_gap)
+            else:
+                result = session.solve_part1(deadline=deadlines[0], mip_gap=mip_gap)
+            if result["objective"] is not None:
+                solve = report.part(result["part"])["solve"]
+                print_summary(result["objective"], part2, solve["status_name"], solve["bound"], solve["mip_gap"])
+                if plot_on:
+                    with report.phase("plot", 2 if part2 else 1):
+                        plot_results(zipcodes, session.m, session.variables(), session.costs(), bin_size, part2,
+                                     renderer)
+            else:
+                print(cf.orange("No feasible or optimal solution found."))
+        session.print_timings()
+    elif mode == "decomposed":
+        # Independent per-zipcode subproblems solved in parallel
+        for part2 in (False, True):
+            with report.phase("solve", 2 if part2 else 1):
+                result = optimize_decomposed(zipcodes, part2=part2)
+            report.record_decomposed(2 if part2 else 1, result)
+            if result["infeasible"]:
+                print(cf.orange(f"No feasible or optimal solution found for {len(result['infeasible'])} zipcodes."))
+            else:
+                print_summary(result["objective"], part2)
+                if plot_on:
+                    # the per-zipcode solutions combined, read by variable name
+                    with report.phase("plot", 2 if part2 else 1):
+                        plot_snapshot(utils.values_snapshot(zipcodes, result["solution"], result["costs"],
+                                                            FACILITY_TYPES, part2), bin_size, renderer)
+    else:
+        builder = build_model_matrix if mode == "matrix" else build_model
+        # "heuristic" seeds both parts with the greedy plan as a MIP start; "anytime"
+        # does too, so there is a plan to return however short the budget
+        warm_start = mode in ("heuristic", "anytime")
+        # Part 1 optimization ("bigm" swaps the indicator trigger for its big-M form)
+        trigger = "bigm" if mode == "bigm" else "indicator"
+        # "anytime" streams incumbents to disk; Part 1 gets half the budget and
+        # Part 2 whatever is left of it, each including its build
+        incumbent_dir = INCUMBENT_DIR if mode == "anytime" else None
+        deadlines = part_deadlines(time_limit)
+        optimize(zipcodes, bin_size, plot_on, part2=False, builder=builder, warm_start=warm_start, report=report,
+                 renderer=renderer, deadline=deadlines[0], mip_gap=mip_gap, incumbent_dir=incumbent_dir,
+                 trigger=trigger)
+        # Part 2 optimization
+        optimize(zipcodes, bin_size, plot_on, part2=True, builder=builder, warm_start=warm_start, report=report,
+                 renderer=renderer, deadline=deadlines[1], mip_gap=mip_gap, incumbent_dir=incumbent_dir)
+
+    if renderer is not None:
+        with report.phase("plot_wait"):
+            renderer.close()
+
+    report_path = report.save(os.path.join("./outputs", "run_report.json"))
+    print(cf.bold(cf.seaGreen(f"Saved run report to: {cf.yellow(report_path)}")))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
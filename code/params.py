@@ -0,0 +1,40 @@
+# ---------- Model constants ----------
+FACILITY_TYPES = {
+    "S": {"Cap": 100, "Cap05": 50,  "Cost": 65000},
+    "M": {"Cap": 200, "Cap05": 100, "Cost": 95000},
+    "L": {"Cap": 400, "Cap05": 200, "Cost": 115000},
+}
+ALPHA = 200
+BETA  = 100
+DELTA = 20000
+DIST_LIMIT = 0.06
+
+DEFAULT_PARAMS = {
+    "FACILITY_TYPES": FACILITY_TYPES,
+    "ALPHA": ALPHA,
+    "BETA": BETA,
+    "DELTA": DELTA,
+    "DIST_LIMIT": DIST_LIMIT,
+}
+
+
+'''
+Model constants with per-run overrides applied. FACILITY_TYPES overrides are
+merged per size, so {"FACILITY_TYPES": {"L": {"Cost": 90000}}} only changes
+the large-facility cost.
+'''
+def resolve_params(params=None):
+    params = params or {}
+    unknown = set(params) - set(DEFAULT_PARAMS)
+    if unknown:
+        raise ValueError(f"Unknown model parameters: {sorted(unknown)}")
+    facility_types = {s: dict(spec) for s, spec in FACILITY_TYPES.items()}
+    for s, spec in params.get("FACILITY_TYPES", {}).items():
+        facility_types.setdefault(s, {}).update(spec)
+    return (
+        facility_types,
+        params.get("ALPHA", ALPHA),
+        params.get("BETA", BETA),
+        params.get("DELTA", DELTA),
+        params.get("DIST_LIMIT", DIST_LIMIT),
+    )
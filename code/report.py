@@ -0,0 +1,221 @@
+import json
+import math
+import os
+import platform
+import resource
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+def peak_rss_mb():
+    '''
+    Peak resident set size of this process and of its finished children, in MB
+    '''
+    scale = 1 / 1024 ** 2 if sys.platform == "darwin" else 1 / 1024  # ru_maxrss is bytes on macOS, KB on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return {"self": own, "children": children}
+
+
+def _proc_status_mb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    return None
+
+
+def reset_peak_rss():
+    '''
+    Reset this process's peak RSS to its current RSS (Linux only), so that
+    window_rss_mb() covers only what runs from here on. False where the kernel
+    does not allow it.
+    '''
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def window_rss_mb():
+    '''
+    Current RSS and the peak RSS since the last reset_peak_rss(), in MB
+    '''
+    return {"current": _proc_status_mb("VmRSS"), "peak": _proc_status_mb("VmHWM")}
+
+
+'''
+Write a solution as its nonzero variable values by name, plus meta fields, to a
+temporary file first so readers never see a partial plan
+'''
+def write_plan(path, names, values, **meta):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    plan = {**meta, "values": {name: value for name, value in zip(names, values) if abs(value) > 1e-9}}
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(plan, f)
+    os.replace(tmp, path)
+    return path
+
+
+def _finite(value):
+    # Gurobi reports a missing bound as +-inf or +-1e100
+    return value if value is not None and math.isfinite(value) and abs(value) < 1e100 else None
+
+
+def _family(name):
+    return name.split("[", 1)[0]
+
+
+'''
+Variable and constraint counts of a Gurobi model grouped by name prefix,
+e.g. x, z, y_site or site_conflict
+'''
+def model_counts(m):
+    m.update()
+    variables = Counter(_family(name) for name in m.getAttr("VarName", m.getVars()))
+    constraints = Counter(_family(name) for name in m.getAttr("ConstrName", m.getConstrs()))
+    constraints.update(_family(c.GenConstrName) for c in m.getGenConstrs())
+    return {
+        "variables": dict(variables),
+        "constraints": dict(constraints),
+        "total_variables": m.NumVars,
+        "total_integer_variables": m.NumIntVars,
+        "total_constraints": m.NumConstrs + m.NumGenConstrs,
+        "nonzeros": m.NumNZs,
+    }
+
+
+def status_name(status):
+    from gurobipy import GRB
+    names = {getattr(GRB.Status, name): name for name in dir(GRB.Status) if name.isupper()}
+    return names.get(status, str(status))
+
+
+def solve_stats(m):
+    has_sol = m.SolCount > 0
+    is_mip = m.IsMIP == 1
+    return {
+        "status": m.Status,
+        "status_name": status_name(m.Status),
+        "objective": m.ObjVal if has_sol else None,
+        "bound": _finite(m.ObjBound) if has_sol and is_mip else None,
+        "mip_gap": _finite(m.MIPGap) if has_sol and is_mip else None,
+        "node_count": m.NodeCount if is_mip else None,
+        "simplex_iterations": m.IterCount,
+        "solution_count": m.SolCount,
+        "runtime": m.Runtime,
+    }
+
+
+class RunReport:
+    '''
+    Structured record of one optimize run: wall time per phase, model size by
+    family, solver statistics with the incumbent timeline, and peak RSS.
+    Written as JSON by save().
+    '''
+    def __init__(self, data_path=None, mode=None):
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self.meta = {"data_path": data_path, "mode": mode, "python": platform.python_version(),
+                     "argv": sys.argv, "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started))}
+        self.phases = []
+        self.parts = {}
+
+    @contextmanager
+    def phase(self, name, part=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append({"phase": name, "part": part, "seconds": time.perf_counter() - start})
+
+    def part(self, part):
+        return self.parts.setdefault(str(part), {"incumbents": []})
+
+    def incumbent_callback(self, part, m=None, out_dir=None):
+        '''
+        Gurobi callback recording (time, objective, bound) at every new incumbent.
+        With out_dir, each improved incumbent of m is also written there as
+        part{part}_incumbent.json, replacing the previous one.
+        '''
+        from gurobipy import GRB
+        incumbents = self.part(part)["incumbents"]
+        if out_dir is not None:
+            # variable names cannot be queried inside the callback
+            m.update()
+            all_vars = m.getVars()
+            names = m.getAttr("VarName", all_vars)
+            path = os.path.join(out_dir, f"part{part}_incumbent.json")
+
+        def callback(model, where):
+            if where == GRB.Callback.MIPSOL:
+                incumbent = {
+                    "time": model.cbGet(GRB.Callback.RUNTIME),
+                    "objective": model.cbGet(GRB.Callback.MIPSOL_OBJ),
+                    "bound": _finite(model.cbGet(GRB.Callback.MIPSOL_OBJBND)),
+                    "nodes": model.cbGet(GRB.Callback.MIPSOL_NODCNT),
+                }
+                if out_dir is not None and (not incumbents or incumbent["objective"] < incumbents[-1]["objective"]):
+                    write_plan(path, names, model.cbGetSolution(all_vars), part=part, **incumbent)
+                incumbents.append(incumbent)
+        return callback
+
+    def record_model(self, part, m):
+        self.part(part)["model"] = model_counts(m)
+
+    def record_solve(self, part, m):
+        self.part(part)["solve"] = solve_stats(m)
+
+    def record_decomposed(self, part, result):
+        '''
+        Model counts and solver statistics of a decomposed run, summed over the
+        per-zipcode subproblems. The status is OPTIMAL when every subproblem is,
+        otherwise the most common other status; status_counts has them all.
+        '''
+        per_zip = list(result["per_zip"].values())
+        model = {"variables": Counter(), "constraints": Counter()}
+        for r in per_zip:
+            model["variables"].update(r["model"]["variables"])
+            model["constraints"].update(r["model"]["constraints"])
+        model = {key: dict(counts) for key, counts in model.items()}
+        for key in ("total_variables", "total_integer_variables", "total_constraints", "nonzeros"):
+            model[key] = sum(r["model"][key] for r in per_zip)
+        model["subproblems"] = len(per_zip)
+        self.part(part)["model"] = model
+
+        statuses = Counter(r["solve"]["status_name"] for r in per_zip)
+        others = Counter({name: n for name, n in statuses.items() if name != "OPTIMAL"})
+        self.part(part)["solve"] = {
+            "status_name": others.most_common(1)[0][0] if others else "OPTIMAL",
+            "status_counts": dict(statuses),
+            "objective": result["objective"],
+            "infeasible": result["infeasible"],
+            "node_count": sum(r["solve"]["node_count"] or 0 for r in per_zip),
+            "simplex_iterations": sum(r["solve"]["simplex_iterations"] for r in per_zip),
+            "build_time": sum(r["build_time"] for r in per_zip),
+            "runtime": sum(r["solve"]["runtime"] for r in per_zip),
+        }
+
+    def to_dict(self):
+        totals = Counter()
+        for p in self.phases:
+            totals[p["phase"]] += p["seconds"]
+        return {
+            "meta": self.meta,
+            "wall_time": time.perf_counter() - self._t0,
+            "phase_totals": dict(totals),
+            "phases": self.phases,
+            "parts": self.parts,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        return path
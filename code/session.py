@@ -0,0 +1,415 @@
+import math
+import time
+from contextlib import nullcontext
+from gurobipy import Model, GRB, quicksum
+import colorful as cf
+from structs.zipcode import Zipcodes
+from conflicts import ConflictIndex
+from params import FACILITY_TYPES, ALPHA, BETA, DELTA, DIST_LIMIT
+
+cf.use_style('monokai')
+
+
+def _expansion_limit(cap, factor):
+    limit = min(factor * cap, 500.0)
+    if cap > limit:
+        limit = cap
+    return limit
+
+
+class SolverSession:
+    '''
+    One Gurobi model shared by Part 1 and Part 2. The expansion, 0–5 and
+    new-build variables with the coverage and consistency constraints are
+    built once; each part adds its own block on top and removes the previous
+    one. Part 2 is seeded with a MIP start projected from the Part 1 plan.
+    With a RunReport, the builds and solves are recorded as its phases and
+    each solve's model counts and statistics under its part. conflicts picks
+    the Part 2 conflict rows, as in optimize.build_model.
+    '''
+    def __init__(self, zipcodes: Zipcodes, zips=None, report=None, conflicts="pairwise"):
+        start = time.perf_counter()
+        self.report = report
+        self.conflict_mode = conflicts
+        self.zipcodes = zipcodes
+        self.I = list(zipcodes.get_complete_data() if zips is None else zips)
+        self.F = zipcodes.get_facilities()
+        self.m = Model("childcare_deserts")
+        self.m.Params.OutputFlag = 0
+        m, I, F = self.m, self.I, self.F
+        with self._phase("build"):
+            self._build_shared()
+        self.facility_cost = quicksum(FACILITY_TYPES[s]["Cost"] * self.y[i, s] for i in I for s in FACILITY_TYPES)
+        self.equip_cost = BETA * (
+            quicksum(self.u[f] for i in I for f in F[i]) +
+            quicksum(self.v[i, s] for i in I for s in FACILITY_TYPES)
+        )
+        self.block = None
+        self.part2 = None
+        self.expansion_cost = None
+        self.z, self.t1, self.t2, self.t3 = {}, {}, {}, {}
+        self.y_site, self.v_site = {}, {}
+        self.part1_solution = None
+        self.stats = {"shared_build_time": time.perf_counter() - start}
+
+    def _phase(self, name, part=None):
+        return nullcontext() if self.report is None else self.report.phase(name, part)
+
+    def _build_shared(self):
+        m, I, F, zipcodes = self.m, self.I, self.F, self.zipcodes
+
+        # ---------- Shared decision variables ----------
+        self.x, self.u, self.y, self.v = {}, {}, {}, {}
+        for i in I:
+            for f in F[i]:
+                self.x[f] = m.addVar(lb=0.0, vtype=GRB.INTEGER, name=f"x[{f}]")
+                self.u[f] = m.addVar(lb=0.0, vtype=GRB.INTEGER, name=f"u[{f}]")
+            for s in FACILITY_TYPES:
+                self.y[i, s] = m.addVar(lb=0, vtype=GRB.INTEGER, name=f"y[{i},{s}]")
+                self.v[i, s] = m.addVar(lb=0.0, vtype=GRB.INTEGER, name=f"v[{i},{s}]")
+        m.update()
+
+        # ---------- Shared constraints ----------
+        x, u, y, v = self.x, self.u, self.y, self.v
+        for i in I:
+            m.addConstr(
+                zipcodes.get_children_cap_for_zipcode(i) +
+                quicksum(x[f] for f in F[i]) +
+                quicksum(FACILITY_TYPES[s]["Cap"] * y[i, s] for s in FACILITY_TYPES)
+                >= zipcodes.get_theta_for_zipcode(i) * zipcodes.get_children_population_for_zipcode(i),
+                name=f"coverage[{i}]"
+            )
+            m.addConstr(
+                zipcodes.get_infant_cap_for_zipcode(i) +
+                quicksum(u[f] for f in F[i]) +
+                quicksum(v[i, s] for s in FACILITY_TYPES)
+                >= (2/3) * zipcodes.get_infant_population_for_zipcode(i),
+                name=f"infant_coverage[{i}]"
+            )
+            for f in F[i]:
+                m.addConstr(u[f] <= x[f], name=f"infant_consistency[{f}]")
+            for s in FACILITY_TYPES:
+                m.addConstr(v[i, s] <= FACILITY_TYPES[s]["Cap05"] * y[i, s], name=f"build_consistency[{i},{s}]")
+        m.update()
+
+    def _cap(self, i, f):
+        return self.zipcodes.get_children_cap_for_facility(i, f)
+
+    def _clear_block(self):
+        if self.block is None:
+            return
+        self.m.remove(self.block["genconstrs"])
+        self.m.remove(self.block["constrs"])
+        self.m.remove(self.block["vars"])
+        self.m.update()
+        self.block = None
+        self.z, self.t1, self.t2, self.t3 = {}, {}, {}, {}
+        self.y_site, self.v_site = {}, {}
+
+    def _build_part1(self):
+        m, I, F, x = self.m, self.I, self.F, self.x
+        block = {"vars": [], "constrs": [], "genconstrs": []}
+        for i in I:
+            for f in F[i]:
+                cap = self._cap(i, f)
+                x[f].UB = _expansion_limit(cap, 2.2) - cap
+                self.z[f] = m.addVar(vtype=GRB.BINARY, name=f"z[{f}]")
+                block["vars"].append(self.z[f])
+        m.update()
+        for i in I:
+            for f in F[i]:
+                cap = self._cap(i, f)
+                block["genconstrs"].append(m.addGenConstrIndicator(self.z[f], True,  x[f] >= cap,    name=f"trigger_on[{f}]"))
+                block["genconstrs"].append(m.addGenConstrIndicator(self.z[f], False, x[f] <= cap - 1e-3, name=f"trigger_off[{f}]"))
+        self.expansion_cost = quicksum(
+            (DELTA + 200.0 * self._cap(i, f)) * self.z[f] + ALPHA * x[f]
+            for i in I for f in F[i]
+        )
+        return block
+
+    def _build_part2(self):
+        m, I, F, x = self.m, self.I, self.F, self.x
+        block = {"vars": [], "constrs": [], "genconstrs": []}
+        for i in I:
+            for f in F[i]:
+                cap = self._cap(i, f)
+                x[f].UB = _expansion_limit(cap, 1.2) - cap
+                self.t1[f] = m.addVar(lb=0.0, ub=0.10 * cap, vtype=GRB.INTEGER, name=f"t1[{f}]")
+                self.t2[f] = m.addVar(lb=0.0, ub=0.05 * cap, vtype=GRB.INTEGER, name=f"t2[{f}]")
+                self.t3[f] = m.addVar(lb=0.0, ub=0.05 * cap, vtype=GRB.INTEGER, name=f"t3[{f}]")
+                block["vars"] += [self.t1[f], self.t2[f], self.t3[f]]
+            for l in range(self.zipcodes.get_site_count(i)):
+                for s in FACILITY_TYPES:
+                    self.y_site[i, l, s] = m.addVar(vtype=GRB.BINARY, name=f"y_site[{i},{l},{s}]")
+                    self.v_site[i, l, s] = m.addVar(lb=0.0, vtype=GRB.INTEGER, name=f"v_site[{i},{l},{s}]")
+                    block["vars"] += [self.y_site[i, l, s], self.v_site[i, l, s]]
+        m.update()
+
+        constrs = block["constrs"]
+        conflict_index = ConflictIndex(self.zipcodes)
+        self.conflicts = {}
+        for i in I:
+            for f in F[i]:
+                constrs.append(m.addConstr(x[f] == self.t1[f] + self.t2[f] + self.t3[f], name=f"tier_split[{f}]"))
+            n_sites = self.zipcodes.get_site_count(i)
+            # new builds are placed on potential sites
+            for s in FACILITY_TYPES:
+                constrs.append(m.addConstr(self.y[i, s] == quicksum(self.y_site[i, l, s] for l in range(n_sites)),
+                                           name=f"site_placement[{i},{s}]"))
+                constrs.append(m.addConstr(self.v[i, s] == quicksum(self.v_site[i, l, s] for l in range(n_sites)),
+                                           name=f"site_infant_placement[{i},{s}]"))
+            for l in range(n_sites):
+                constrs.append(m.addConstr(quicksum(self.y_site[i, l, s] for s in FACILITY_TYPES) <= 1,
+                                           name=f"one_size[{i},{l}]"))
+            site_pairs, facility_pairs = conflict_index.conflicts(i, DIST_LIMIT)
+            self.conflicts[i] = site_pairs
+            if self.conflict_mode == "clique":
+                # one row per maximal clique of mutually close sites
+                for k, clique in enumerate(conflict_index.cliques(i, DIST_LIMIT)):
+                    constrs.append(m.addConstr(
+                        quicksum(self.y_site[i, l, s] for l in clique for s in FACILITY_TYPES) <= 1,
+                        name=f"site_clique[{i},{k}]"
+                    ))
+                continue
+            for a, b in site_pairs:
+                constrs.append(m.addConstr(
+                    quicksum(self.y_site[i, a, s] for s in FACILITY_TYPES) +
+                    quicksum(self.y_site[i, b, s] for s in FACILITY_TYPES) <= 1,
+                    name=f"site_conflict[{i},{a},{b}]"
+                ))
+            for l, f in facility_pairs:
+                constrs.append(m.addConstr(quicksum(self.y_site[i, l, s] for s in FACILITY_TYPES) <= 1,
+                                           name=f"facility_conflict[{i},{l},{f}]"))
+
+        expansion_cost_terms = []
+        for i in I:
+            for f in F[i]:
+                coef_base = 20000.0 / self._cap(i, f)
+                expansion_cost_terms.append((200.0 + coef_base) * self.t1[f])
+                expansion_cost_terms.append((400.0 + coef_base) * self.t2[f])
+                expansion_cost_terms.append((1000.0 + coef_base) * self.t3[f])
+        self.expansion_cost = quicksum(expansion_cost_terms)
+        return block
+
+    def _seed_part2(self):
+        '''
+        Complete MIP start from the Part 1 plan: expansions clipped to the Part 2
+        limits and split over the tiers, and the Part 1 new-build counts placed
+        on non-conflicting sites, largest facilities first. Coverage lost to the
+        clipping or to conflicting sites is restored with more tier slots,
+        cheapest first, then with large builds on free sites; the 0–5 slots go
+        to the new builds first, then to the expansions. Zipcodes the projection
+        cannot cover are seeded from the greedy heuristic instead. Returns the
+        number of zipcodes seeded each way.
+        '''
+        x1, y1 = self.part1_solution["x"], self.part1_solution["y"]
+        order = sorted(FACILITY_TYPES, key=lambda s: -FACILITY_TYPES[s]["Cap"])
+        zipcodes = self.zipcodes
+        fallback = []
+        for i in self.I:
+            # expansions: Part 1 amounts clipped and split over the tiers
+            tiers = {}
+            for f in self.F[i]:
+                cap = self._cap(i, f)
+                limits = [math.floor(share * cap + 1e-9) for share in (0.10, 0.05, 0.05)]
+                room = math.floor(self.x[f].UB + 1e-9)
+                remaining = min(round(x1[f]), room)
+                amounts = []
+                for limit in limits:
+                    amounts.append(max(0, min(remaining, limit)))
+                    remaining -= amounts[-1]
+                tiers[f] = (amounts, limits, room)
+
+            # new builds: Part 1 counts on non-conflicting sites
+            neighbours = {}
+            for a, b in self.conflicts[i]:
+                neighbours.setdefault(a, set()).add(b)
+                neighbours.setdefault(b, set()).add(a)
+            builds, blocked = {}, set()
+            free = lambda l: l not in builds and l not in blocked
+            counts = {s: round(y1[i, s]) for s in FACILITY_TYPES}
+            n_sites = zipcodes.get_site_count(i)
+            for l in range(n_sites):
+                size = next((s for s in order if counts[s] > 0), None)
+                if size is not None and free(l):
+                    builds[l] = size
+                    counts[size] -= 1
+                    blocked |= neighbours.get(l, set())
+
+            # restore the children coverage
+            need = zipcodes.get_theta_for_zipcode(i) * zipcodes.get_children_population_for_zipcode(i) \
+                - zipcodes.get_children_cap_for_zipcode(i) - sum(sum(a) for a, _, _ in tiers.values()) \
+                - sum(FACILITY_TYPES[s]["Cap"] for s in builds.values())
+            slots = sorted((rate + 20000.0 / self._cap(i, f), f, k)
+                           for f in self.F[i] for k, rate in enumerate((200.0, 400.0, 1000.0)))
+            for _, f, k in slots:
+                if need <= 1e-9:
+                    break
+                amounts, limits, room = tiers[f]
+                add = max(0, min(limits[k] - amounts[k], room - sum(amounts), math.ceil(need - 1e-9)))
+                amounts[k] += add
+                need -= add
+            for l in range(n_sites):
+                if need <= 1e-9:
+                    break
+                if free(l):
+                    builds[l] = order[0]
+                    blocked |= neighbours.get(l, set())
+                    need -= FACILITY_TYPES[order[0]]["Cap"]
+
+            # 0–5 slots: new builds first, then expansions, then more large builds
+            need_infant = (2/3) * zipcodes.get_infant_population_for_zipcode(i) - zipcodes.get_infant_cap_for_zipcode(i)
+            infant = {}
+            for l, s in builds.items():
+                infant[l] = max(0, min(FACILITY_TYPES[s]["Cap05"], math.ceil(need_infant - 1e-9)))
+                need_infant -= infant[l]
+            u = {}
+            for f, (amounts, _, _) in tiers.items():
+                u[f] = max(0, min(sum(amounts), math.ceil(need_infant - 1e-9)))
+                need_infant -= u[f]
+            for l in range(n_sites):
+                if need_infant <= 1e-9:
+                    break
+                if free(l):
+                    builds[l] = order[0]
+                    blocked |= neighbours.get(l, set())
+                    infant[l] = min(FACILITY_TYPES[order[0]]["Cap05"], math.ceil(need_infant - 1e-9))
+                    need_infant -= infant[l]
+
+            if need > 1e-9 or need_infant > 1e-9:
+                fallback.append(i)
+                continue
+            for f, (amounts, _, _) in tiers.items():
+                for t, amount in zip((self.t1, self.t2, self.t3), amounts):
+                    t[f].Start = amount
+                self.x[f].Start = sum(amounts)
+                self.u[f].Start = u[f]
+            for l in range(n_sites):
+                for s in FACILITY_TYPES:
+                    self.y_site[i, l, s].Start = int(builds.get(l) == s)
+                    self.v_site[i, l, s].Start = infant[l] if builds.get(l) == s else 0
+            for s in FACILITY_TYPES:
+                self.y[i, s].Start = sum(1 for b in builds.values() if b == s)
+                self.v[i, s].Start = sum(infant[l] for l, b in builds.items() if b == s)
+
+        if fallback:
+            import heuristic
+            plan = heuristic.solve(zipcodes, part2=True, zips=fallback)
+            heuristic.apply_mip_start(self.variables(), plan, part2=True)
+            for i in fallback:
+                if not plan["plans"][i]["feasible"]:
+                    continue
+                n_sites = zipcodes.get_site_count(i)
+                for s in FACILITY_TYPES:
+                    self.y[i, s].Start = sum(self.y_site[i, l, s].Start for l in range(n_sites))
+                    self.v[i, s].Start = sum(self.v_site[i, l, s].Start for l in range(n_sites))
+        return {"projected": len(self.I) - len(fallback), "heuristic": len(fallback)}
+
+    def _start_objective(self):
+        objective = self.m.getObjective()
+        return objective.getConstant() + sum(objective.getCoeff(k) * objective.getVar(k).Start
+                                             for k in range(objective.size()))
+
+    def _solve(self, part2, build_time, seed=None, deadline=None, mip_gap=None):
+        m = self.m
+        part = 2 if part2 else 1
+        m.setObjective(self.expansion_cost + self.facility_cost + self.equip_cost, GRB.MINIMIZE)
+        m.update()
+        # Gurobi accepted the start when its first incumbent has the start's objective
+        start_objective = None if seed is None else self._start_objective()
+        # the model is shared, so a limit set for one part is reset for the next;
+        # a spent budget still gets a moment, in which Gurobi evaluates the MIP start
+        m.Params.TimeLimit = GRB.INFINITY if deadline is None else max(deadline - time.perf_counter(), 0.01)
+        m.Params.MIPGap = 1e-4 if mip_gap is None else mip_gap  # Gurobi's default gap
+        first_incumbent = {}
+        if self.report is not None:
+            self.report.record_model(part, m)
+            record_incumbent = self.report.incumbent_callback(part)
+
+        def callback(model, where):
+            if where == GRB.Callback.MIPSOL and "time" not in first_incumbent:
+                first_incumbent["time"] = model.cbGet(GRB.Callback.RUNTIME)
+                first_incumbent["objective"] = model.cbGet(GRB.Callback.MIPSOL_OBJ)
+            if self.report is not None:
+                record_incumbent(model, where)
+
+        with self._phase("solve", part):
+            m.optimize(callback)
+        if self.report is not None:
+            self.report.record_solve(part, m)
+        if "time" not in first_incumbent and m.SolCount > 0:
+            first_incumbent["time"] = m.Runtime
+        result = {
+            "part": 2 if part2 else 1,
+            "status": m.Status,
+            "objective": m.ObjVal if m.SolCount > 0 else None,
+            "build_time": build_time,
+            "solve_time": m.Runtime,
+            "time_to_first_incumbent": first_incumbent.get("time"),
+            "mip_start": start_objective is not None and "objective" in first_incumbent and
+                         abs(first_incumbent["objective"] - start_objective) <= 1e-6 * max(1.0, abs(start_objective)),
+            "seed": seed,
+        }
+        if self.report is not None and seed is not None:
+            self.report.part(part)["mip_start"] = {"accepted": result["mip_start"], **seed}
+        self.stats[f"part{result['part']}"] = result
+        return result
+
+    def solve_part1(self, deadline=None, mip_gap=None):
+        start = time.perf_counter()
+        with self._phase("build", 1):
+            self._clear_block()
+            self.block = self._build_part1()
+            self.m.update()
+        self.part2 = False
+        result = self._solve(False, time.perf_counter() - start, deadline=deadline, mip_gap=mip_gap)
+        if self.m.SolCount > 0:
+            self.part1_solution = {
+                "x": {f: var.X for f, var in self.x.items()},
+                "u": {f: var.X for f, var in self.u.items()},
+                "y": {k: var.X for k, var in self.y.items()},
+            }
+        return result
+
+    def solve_part2(self, warm_start=True, deadline=None, mip_gap=None):
+        start = time.perf_counter()
+        with self._phase("build", 2):
+            self._clear_block()
+            for var in self.m.getVars():
+                var.Start = GRB.UNDEFINED
+            self.block = self._build_part2()
+            self.m.update()
+        seed = None
+        if warm_start and self.part1_solution is not None:
+            with self._phase("warm_start", 2):
+                seed = self._seed_part2()
+        self.part2 = True
+        return self._solve(True, time.perf_counter() - start, seed=seed, deadline=deadline, mip_gap=mip_gap)
+
+    def variables(self):
+        '''
+        Variable dictionaries keyed like optimize.build_model, for plotting
+        '''
+        return {"x": self.x, "u": self.u, "z": self.z, "t1": self.t1, "t2": self.t2, "t3": self.t3,
+                "y": self.y, "v": self.v, "y_site": self.y_site, "v_site": self.v_site}
+
+    def costs(self):
+        return self.expansion_cost, self.facility_cost, self.equip_cost
+
+    def print_timings(self):
+        print(cf.bold(cf.seaGreen("===== SESSION TIMINGS =====")))
+        print(cf.yellow(f"  {'shared build':<24}") + cf.bold(f"{self.stats['shared_build_time']:.2f}s"))
+        for part in ("part1", "part2"):
+            if part not in self.stats:
+                continue
+            r = self.stats[part]
+            first = "n/a" if r["time_to_first_incumbent"] is None else f"{r['time_to_first_incumbent']:.2f}s"
+            print(cf.yellow(f"  {part + ' block build':<24}") + cf.bold(f"{r['build_time']:.2f}s"))
+            seed = r["seed"]
+            note = ""
+            if seed is not None:
+                note = f"  (MIP start from Part 1, {seed['heuristic']} zipcodes from the heuristic"
+                note = cf.seaGreen(note + ")") if r["mip_start"] else cf.orange(note + ", rejected)")
+            print(cf.yellow(f"  {part + ' first incumbent':<24}") + cf.bold(first) + note)
+            print(cf.yellow(f"  {part + ' solve':<24}") + cf.bold(f"{r['solve_time']:.2f}s"))
+        print(cf.bold(cf.seaGreen("===========================")))
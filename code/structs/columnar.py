@@ -0,0 +1,195 @@
+from collections.abc import MutableMapping
+import json
+import numbers
+import os
+import numpy as np
+
+FORMAT_VERSION = 1
+NESTED_TABLES = {"childcare_dict": "facilities", "potential_locations": "sites"}
+
+
+'''
+Encode one column of Python scalars as NumPy arrays. Mixed int/float columns
+keep an int mask so values round-trip with their JSON type; anything that is
+not a plain bool/number/string column is stored as JSON text.
+'''
+def _encode_column(values):
+    if all(isinstance(v, (bool, np.bool_)) for v in values) and values:
+        return "bool", {"values": np.array(values, dtype=bool)}
+    if all(isinstance(v, numbers.Real) and not isinstance(v, (bool, np.bool_)) for v in values):
+        is_int = np.array([isinstance(v, numbers.Integral) for v in values], dtype=bool)
+        if is_int.all() and values:
+            return "int", {"values": np.array(values, dtype=np.int64)}
+        if not is_int.any():
+            return "float", {"values": np.array(values, dtype=np.float64)}
+        return "number", {"values": np.array(values, dtype=np.float64), "isint": is_int}
+    if all(isinstance(v, str) for v in values):
+        return "str", {"values": np.array(values, dtype=str)}
+    encoded = [json.dumps(v, default=lambda o: o.item()) for v in values]
+    return "json", {"values": np.array(encoded, dtype=str)}
+
+
+'''
+Decode a slice of an encoded column back into Python scalars
+'''
+def _decode_column(kind, arrays, start=None, stop=None):
+    values = arrays["values"][start:stop]
+    if kind == "number":
+        isint = arrays["isint"][start:stop]
+        return [int(v) if k else v for v, k in zip(values.tolist(), isint.tolist())]
+    if kind == "json":
+        return [json.loads(v) for v in values.tolist()]
+    return values.tolist()
+
+
+def _save_table(path, name, rows, fields, extra=None):
+    table_dir = os.path.join(path, name)
+    os.makedirs(table_dir, exist_ok=True)
+    columns = {}
+    for field, values in {**(extra or {}), **{f: [r[f] for r in rows] for f in fields}}.items():
+        kind, arrays = _encode_column(values)
+        column_id = f"c{len(columns)}"
+        for suffix, arr in arrays.items():
+            np.save(os.path.join(table_dir, f"{column_id}.{suffix}.npy"), arr, allow_pickle=False)
+        columns[field] = {"id": column_id, "kind": kind, "arrays": list(arrays)}
+    return {"fields": fields, "columns": columns}
+
+
+'''
+Write a zipcode dataset as a directory of .npy columns plus a JSON manifest.
+Facilities and sites are stored as flat tables with per-zipcode offsets.
+'''
+def save_columnar(data, path):
+    keys = list(data)
+    entry_fields = list(data[keys[0]]) if keys else []
+    scalar_fields = [f for f in entry_fields if f not in NESTED_TABLES]
+    for key in keys:
+        if list(data[key]) != entry_fields:
+            raise ValueError(f"Zipcode {key} has fields {list(data[key])}, expected {entry_fields}")
+
+    os.makedirs(path, exist_ok=True)
+    manifest = {"version": FORMAT_VERSION, "entry_fields": entry_fields, "tables": {}}
+    zip_rows = [data[key] for key in keys]
+    manifest["tables"]["zips"] = _save_table(path, "zips", zip_rows, scalar_fields, {"_key": keys})
+
+    for field, table in NESTED_TABLES.items():
+        if field not in entry_fields:
+            continue
+        rows, row_keys, counts = [], [], []
+        for key in keys:
+            nested = data[key][field]
+            if isinstance(nested, dict):
+                row_keys += list(nested)
+                rows += list(nested.values())
+            else:
+                rows += list(nested)
+            counts.append(len(nested))
+        fields = list(rows[0]) if rows else []
+        for row in rows:
+            if list(row) != fields:
+                raise ValueError(f"Inconsistent {field} record fields: {list(row)}, expected {fields}")
+        extra = {"_key": row_keys} if field == "childcare_dict" else {}
+        manifest["tables"][table] = _save_table(path, table, rows, fields, extra)
+        offsets = np.concatenate([[0], np.cumsum(counts, dtype=np.int64)]).astype(np.int64)
+        np.save(os.path.join(path, table, "offsets.npy"), offsets, allow_pickle=False)
+
+    with open(os.path.join(path, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+class ColumnarDataset:
+    '''
+    Read-only view over a dataset written by save_columnar. Column arrays are
+    memory-mapped; per-zipcode dictionaries are only built on request.
+    '''
+    def __init__(self, path, mmap_mode="r"):
+        with open(os.path.join(path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported columnar dataset version: {self.manifest.get('version')}")
+        self.path = path
+        self.tables = {}
+        self.offsets = {}
+        for name, table in self.manifest["tables"].items():
+            columns = {}
+            for field, column in table["columns"].items():
+                arrays = {
+                    suffix: np.load(os.path.join(path, name, f"{column['id']}.{suffix}.npy"),
+                                    mmap_mode=mmap_mode, allow_pickle=False)
+                    for suffix in column["arrays"]
+                }
+                columns[field] = (column["kind"], arrays)
+            self.tables[name] = columns
+            if name != "zips":
+                self.offsets[name] = np.load(os.path.join(path, name, "offsets.npy"), mmap_mode=mmap_mode)
+        self.keys = _decode_column(*self.tables["zips"]["_key"])
+        self.index = {key: k for k, key in enumerate(self.keys)}
+
+    def has_column(self, table, field):
+        return field in self.tables.get(table, {})
+
+    def column(self, table, field):
+        kind, arrays = self.tables[table][field]
+        if kind in ("str", "json"):
+            return _decode_column(kind, arrays)
+        return arrays["values"]
+
+    def _rows(self, table, k):
+        start, stop = int(self.offsets[table][k]), int(self.offsets[table][k + 1])
+        fields = self.manifest["tables"][table]["fields"]
+        columns = [_decode_column(*self.tables[table][f], start, stop) for f in fields]
+        rows = [dict(zip(fields, values)) for values in zip(*columns)] if fields else [{} for _ in range(stop - start)]
+        return rows, start, stop
+
+    def entry(self, key):
+        k = self.index[key]
+        entry = {}
+        for field in self.manifest["entry_fields"]:
+            table = NESTED_TABLES.get(field)
+            if table is None:
+                entry[field] = _decode_column(*self.tables["zips"][field], k, k + 1)[0]
+            elif table == "facilities":
+                rows, start, stop = self._rows(table, k)
+                entry[field] = dict(zip(_decode_column(*self.tables[table]["_key"], start, stop), rows))
+            else:
+                entry[field] = self._rows(table, k)[0]
+        return entry
+
+
+class LazyEntries(MutableMapping):
+    '''
+    Dictionary of zipcode entries backed by a ColumnarDataset. Entries are
+    materialized on first access and then behave like the JSON-loaded dicts.
+    '''
+    def __init__(self, dataset: ColumnarDataset):
+        self.dataset = dataset
+        self._keys = list(dataset.keys)
+        self._cache = {}
+
+    def __getitem__(self, key):
+        if key not in self._cache:
+            if key not in self.dataset.index:
+                raise KeyError(key)
+            self._cache[key] = self.dataset.entry(key)
+        return self._cache[key]
+
+    def __setitem__(self, key, value):
+        if key not in self._cache and key not in self.dataset.index:
+            self._keys.append(key)
+        self._cache[key] = value
+
+    def __delitem__(self, key):
+        raise TypeError("Zipcode entries cannot be removed")
+
+    def __contains__(self, key):
+        return key in self._cache or key in self.dataset.index
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+
+def load_columnar(path, mmap_mode="r"):
+    return ColumnarDataset(path, mmap_mode)
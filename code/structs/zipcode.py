@@ -1,12 +1,25 @@
 from collections import defaultdict
 import json
+import os
 import colorful as cf
 import math
+import numpy as np
+from structs.columnar import LazyEntries, load_columnar, save_columnar
+
+ZIP_FIELDS = ("avg_individual_income", "employment_rate", "population0_5", "population0_12")
+FACILITY_FIELDS = ("total_capacity", "infant_capacity", "latitude", "longitude")
+SITE_FIELDS = ("latitude", "longitude")
 
 class Zipcodes:
+    EMPLOYMENT_THRESH = 0.60
+    INCOME_THRESH = 60000.0
+
     def __init__(self, data=None):
         self.complete_data = set()
         self.missing_data = set()
+        self.columnar = None
+        self._arrays = None
+        self._columnar_dirty = False
 
         if data is None:
             self.data = {}
@@ -29,6 +42,7 @@ class Zipcodes:
             flag = 1
         data['flag'] = flag
         self.data[key] = data
+        self._invalidate_arrays()
         if flag == 1:
             self.missing_data.add(key)
         else:
@@ -44,42 +58,154 @@ class Zipcodes:
         return self.complete_data
     
     def get_facilities(self):
+        arrays = self.get_arrays()
+        offsets, facility_keys = arrays["facility_offsets"].tolist(), arrays["facility_keys"]
         facilities = {}
         for key in self.complete_data:
-            facilities[key] = self.data[key]['childcare_dict']
+            k = arrays["index"][key]
+            facilities[key] = facility_keys[offsets[k]:offsets[k + 1]]
         return facilities
     
+    def _invalidate_arrays(self):
+        self._arrays = None
+        self._columnar_dirty = True
+
+    def _zip_columns(self, keys):
+        if self.columnar is not None and not self._columnar_dirty:
+            # Read straight from the memory-mapped tables
+            dataset = self.columnar
+            return (
+                {field: np.asarray(dataset.column("zips", field)) for field in ZIP_FIELDS},
+                {field: np.asarray(dataset.column("facilities", field)) for field in FACILITY_FIELDS},
+                {field: np.asarray(dataset.column("sites", field)) for field in SITE_FIELDS},
+                np.asarray(dataset.column("facilities", "_key")).tolist(),
+                np.asarray(dataset.offsets["facilities"]),
+                np.asarray(dataset.offsets["sites"]),
+            )
+        entries = [self.data[key] for key in keys]
+        columns = {field: np.array([entry[field] for entry in entries]) for field in ZIP_FIELDS}
+        facility_keys = [f for entry in entries for f in entry['childcare_dict']]
+        records = [r for entry in entries for r in entry['childcare_dict'].values()]
+        sites = [loc for entry in entries for loc in entry['potential_locations']]
+        facility_columns = {field: np.array([r[field] for r in records]) if records else np.zeros(0)
+                            for field in FACILITY_FIELDS}
+        site_columns = {field: np.array([loc[field] for loc in sites], dtype=float) for field in SITE_FIELDS}
+        facility_offsets = np.concatenate([[0], np.cumsum([len(entry['childcare_dict']) for entry in entries])])
+        site_offsets = np.concatenate([[0], np.cumsum([len(entry['potential_locations']) for entry in entries])])
+        return (columns, facility_columns, site_columns, facility_keys,
+                facility_offsets.astype(np.int64), site_offsets.astype(np.int64))
+
+    '''
+    Contiguous per-zipcode, per-facility and per-site arrays. Facilities of
+    zipcode k are rows facility_offsets[k]:facility_offsets[k + 1] of the
+    facility arrays, and likewise for sites. A columnar dataset is read from
+    its columns without building any per-zipcode dicts. Built once and
+    rebuilt after add_zipcode / modify_zipcode_values.
+    '''
+    def get_arrays(self):
+        if self._arrays is None:
+            keys = list(self.data)
+            columns, facilities, sites, facility_keys, offsets, site_offsets = self._zip_columns(keys)
+            children_cap, infant_cap = facilities["total_capacity"], facilities["infant_capacity"]
+            counts = np.diff(offsets)
+            zip_of_facility = np.repeat(np.arange(len(keys)), counts)
+            children_total = np.zeros(len(keys), dtype=children_cap.dtype)
+            np.add.at(children_total, zip_of_facility, children_cap)
+            infant_total = np.zeros(len(keys), dtype=infant_cap.dtype)
+            np.add.at(infant_total, zip_of_facility, infant_cap)
+            theta = self._theta(columns["employment_rate"], columns["avg_individual_income"])
+            self._arrays = {
+                "keys": keys,
+                "index": {key: k for k, key in enumerate(keys)},
+                "income": columns["avg_individual_income"],
+                "employment": columns["employment_rate"],
+                "population0_5": columns["population0_5"],
+                "population0_12": columns["population0_12"],
+                "theta": theta,
+                "children_cap": children_total,
+                "infant_cap": infant_total,
+                "facility_offsets": offsets,
+                "facility_keys": facility_keys,
+                "facility_index": {(keys[z], f): n for n, (z, f) in enumerate(zip(zip_of_facility.tolist(), facility_keys))},
+                "facility_children_cap": children_cap,
+                "facility_infant_cap": infant_cap,
+                "facility_latitude": facilities["latitude"],
+                "facility_longitude": facilities["longitude"],
+                "site_offsets": site_offsets,
+                "site_latitude": sites["latitude"],
+                "site_longitude": sites["longitude"],
+            }
+        return self._arrays
+
+    def _theta(self, employment, income):
+        return np.where((employment >= self.EMPLOYMENT_THRESH) | (income <= self.INCOME_THRESH), 0.5, 1.0 / 3.0)
+
+    '''
+    Change the theta thresholds. Only theta depends on them, so the other
+    arrays are kept, and unchanged thresholds leave everything as is.
+    '''
+    def set_theta_thresholds(self, employment=None, income=None):
+        employment = self.EMPLOYMENT_THRESH if employment is None else employment
+        income = self.INCOME_THRESH if income is None else income
+        if (employment, income) == (self.EMPLOYMENT_THRESH, self.INCOME_THRESH):
+            return
+        self.EMPLOYMENT_THRESH, self.INCOME_THRESH = employment, income
+        if self._arrays is not None:
+            self._arrays["theta"] = self._theta(self._arrays["employment"], self._arrays["income"])
+
+    def get_facility_ids(self, key):
+        arrays = self.get_arrays()
+        k = arrays["index"][key]
+        return arrays["facility_keys"][int(arrays["facility_offsets"][k]):int(arrays["facility_offsets"][k + 1])]
+
+    def get_site_count(self, key):
+        arrays = self.get_arrays()
+        k = arrays["index"][key]
+        return int(arrays["site_offsets"][k + 1] - arrays["site_offsets"][k])
+
+    '''
+    Latitude and longitude arrays of the zipcode's potential sites and existing
+    facilities, in potential_locations / childcare_dict order
+    '''
+    def get_site_coordinates(self, key):
+        arrays = self.get_arrays()
+        k = arrays["index"][key]
+        rows = slice(int(arrays["site_offsets"][k]), int(arrays["site_offsets"][k + 1]))
+        return arrays["site_latitude"][rows], arrays["site_longitude"][rows]
+
+    def get_facility_coordinates(self, key):
+        arrays = self.get_arrays()
+        k = arrays["index"][key]
+        rows = slice(int(arrays["facility_offsets"][k]), int(arrays["facility_offsets"][k + 1]))
+        return arrays["facility_latitude"][rows], arrays["facility_longitude"][rows]
+
     def get_children_cap_for_facility(self, key, facility):
-        return self.data[key]['childcare_dict'][facility]['total_capacity']
+        arrays = self.get_arrays()
+        return arrays["facility_children_cap"][arrays["facility_index"][key, facility]].item()
     
     def get_children_cap_for_zipcode(self, key):
-        total = 0
-        for f in self.data[key]['childcare_dict']:
-            total += self.data[key]['childcare_dict'][f]['total_capacity']
-        return total
+        arrays = self.get_arrays()
+        return arrays["children_cap"][arrays["index"][key]].item()
     
     def get_children_population_for_zipcode(self, key):
-        return self.data[key]['population0_12']
+        arrays = self.get_arrays()
+        return arrays["population0_12"][arrays["index"][key]].item()
 
     def get_infant_population_for_zipcode(self, key):
-        return self.data[key]['population0_5']
+        arrays = self.get_arrays()
+        return arrays["population0_5"][arrays["index"][key]].item()
     
     def get_infant_cap_for_zipcode(self, key):
-        total = 0
-        for f in self.data[key]['childcare_dict']:
-            total += self.data[key]['childcare_dict'][f]['infant_capacity']
-        return total
+        arrays = self.get_arrays()
+        return arrays["infant_cap"][arrays["index"][key]].item()
     
     def get_infant_cap_for_facility(self, key, facility):
-        return self.data[key]['childcare_dict'][facility]['infant_capacity']
+        arrays = self.get_arrays()
+        return arrays["facility_infant_cap"][arrays["facility_index"][key, facility]].item()
     
     def get_theta_for_zipcode(self, key):
-        EMPLOYMENT_THRESH = 0.60
-        INCOME_THRESH = 60000.0
-        if self.data[key]['employment_rate'] >= EMPLOYMENT_THRESH or self.data[key]['avg_individual_income'] <= INCOME_THRESH:
-            return 0.5
-        else:
-            return (1.0 / 3.0)
+        arrays = self.get_arrays()
+        return arrays["theta"][arrays["index"][key]].item()
 
     def get_missing_data_length(self):
         return len(self.missing_data)
@@ -114,6 +240,7 @@ class Zipcodes:
     def modify_zipcode_values(self, key, data):
         for value in data:
             self.data[key][value] = data[value]
+        self._invalidate_arrays()
         if self.zipcode_is_complete(key):
             self.data[key]['flag'] = 0
             self.missing_data.remove(key)
@@ -121,7 +248,33 @@ class Zipcodes:
     
     def save_data_to_path(self, path):
         with open(path, "w") as f:
-            json.dump(self.data, f, indent=2)
+            json.dump(dict(self.data), f, indent=2)
+
+    def save_columnar(self, path):
+        save_columnar(self.data, path)
+
+    def save(self, path):
+        if path.endswith(".json"):
+            self.save_data_to_path(path)
+        else:
+            self.save_columnar(path)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        if not os.path.isdir(path):
+            with open(path, "r") as f:
+                return cls(json.load(f))
+        dataset = load_columnar(path, mmap_mode)
+        zipcodes = cls()
+        zipcodes.data = LazyEntries(dataset)
+        zipcodes.columnar = dataset
+        flags = dataset.column("zips", "flag").tolist() if dataset.has_column("zips", "flag") else [0] * len(dataset.keys)
+        for key, flag in zip(dataset.keys, flags):
+            if flag:
+                zipcodes.missing_data.add(key)
+            else:
+                zipcodes.complete_data.add(key)
+        return zipcodes
 
     def _haversine_miles(self, lat1, lon1, lat2, lon2):
         R = 3958.8 
@@ -0,0 +1,181 @@
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import colorful as cf
+from structs.zipcode import Zipcodes
+from conflicts import ConflictIndex
+from backends import build_linear_model, solve
+
+cf.use_style('monokai')
+
+THETA_KEYS = ("EMPLOYMENT_THRESH", "INCOME_THRESH")
+SCALAR_KEYS = ("ALPHA", "BETA", "DELTA", "DIST_LIMIT") + THETA_KEYS
+RESULT_FIELDS = [
+    "scenario_id", "part", "backend", "dataset", *SCALAR_KEYS, "scenario", "status", "objective",
+    "expansion_cost", "facility_cost", "equip_cost",
+    "build_time", "solve_time", "mip_gap", "node_count", "error",
+]
+
+
+'''
+Expand a grid {name: [values, ...]} into one scenario per combination
+'''
+def expand_grid(grid):
+    names = list(grid)
+    return [dict(zip(names, combo)) for combo in itertools.product(*(grid[n] for n in names))]
+
+
+'''
+Read scenarios from JSON: either a list of scenarios, {"scenarios": [...]},
+or {"grid": {name: [values]}}. Each scenario overrides model constants
+(ALPHA, BETA, DELTA, DIST_LIMIT, FACILITY_TYPES) and theta thresholds
+(EMPLOYMENT_THRESH, INCOME_THRESH).
+'''
+def load_scenarios(path):
+    with open(path, "r") as f:
+        spec = json.load(f)
+    if isinstance(spec, list):
+        return spec
+    scenarios = list(spec.get("scenarios", []))
+    if "grid" in spec:
+        scenarios += expand_grid(spec["grid"])
+    return scenarios
+
+
+'''
+Absolute path and last modification time of a dataset file or columnar
+directory, so results of a rebuilt dataset get new scenario ids
+'''
+def dataset_stamp(data_path):
+    if os.path.isdir(data_path):
+        paths = [os.path.join(root, name) for root, _, names in os.walk(data_path) for name in names]
+    else:
+        paths = [data_path]
+    return {"path": os.path.abspath(data_path), "mtime": max(os.path.getmtime(p) for p in paths)}
+
+
+def scenario_id(scenario, part, backend="gurobi", dataset=None):
+    task = {"scenario": scenario, "part": part, "dataset": dataset}
+    if backend != "gurobi":
+        task["backend"] = backend
+    key = json.dumps(task, sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+
+# Per-worker dataset, loaded once by the pool initializer and reused for every solve
+_WORKER = {}
+
+
+def _init_worker(data_path, threads, backend, dataset):
+    zipcodes = Zipcodes.load(data_path)
+    zipcodes.get_arrays()
+    _WORKER["zipcodes"] = zipcodes
+    _WORKER["conflict_index"] = ConflictIndex(zipcodes)
+    _WORKER["threads"] = threads
+    _WORKER["backend"] = backend
+    _WORKER["dataset"] = dataset
+
+
+def solve_scenario(scenario, part):
+    row = {"scenario_id": scenario_id(scenario, part, _WORKER["backend"], _WORKER["dataset"]), "part": part,
+           "backend": _WORKER["backend"], "dataset": json.dumps(_WORKER["dataset"], sort_keys=True),
+           "scenario": json.dumps(scenario, sort_keys=True)}
+    row.update({k: scenario.get(k, "") for k in SCALAR_KEYS})
+    try:
+        zipcodes = _WORKER["zipcodes"]
+        # a no-op when the previous scenario used the same thresholds
+        zipcodes.set_theta_thresholds(
+            scenario.get("EMPLOYMENT_THRESH", Zipcodes.EMPLOYMENT_THRESH),
+            scenario.get("INCOME_THRESH", Zipcodes.INCOME_THRESH),
+        )
+        model_params = {k: v for k, v in scenario.items() if k not in THETA_KEYS}
+        start = time.perf_counter()
+        model = build_linear_model(zipcodes, part2=(part == 2), params=model_params,
+                                   conflict_index=_WORKER["conflict_index"])
+        row["build_time"] = time.perf_counter() - start
+        result = solve(model, _WORKER["backend"], threads=_WORKER["threads"])
+        row["status"] = result["status"]
+        row["solve_time"] = result["runtime"]
+        row["node_count"] = result["nodes"]
+        if result["objective"] is not None:
+            row["objective"] = result["objective"]
+            row["mip_gap"] = result["gap"]
+            row["expansion_cost"], row["facility_cost"], row["equip_cost"] = result["costs"]
+    except Exception as e:
+        row["status"] = "error"
+        row["error"] = repr(e)
+    return row
+
+
+'''
+Rows of a results table that completed without an error on this dataset, for
+resuming a sweep
+'''
+def completed_rows(out_path, dataset):
+    if not os.path.exists(out_path):
+        return []
+    dataset = json.dumps(dataset, sort_keys=True)
+    with open(out_path, newline="") as f:
+        return [row for row in csv.DictReader(f) if row.get("status") != "error" and row.get("dataset") == dataset]
+
+
+'''
+Solve every (scenario, part) pair on a process pool and stream one row per
+solve into out_path as results arrive. With resume, the table is first
+rewritten without its errored rows and the rows of an earlier dataset, so every
+scenario_id appears once, and only the solves without a completed row run.
+'''
+def run_sweep(data_path, scenarios, out_path, parts=(1, 2), processes=None, threads=1, resume=False, backend="gurobi"):
+    dataset = dataset_stamp(data_path)
+    tasks = [(scenario, part) for scenario in scenarios for part in parts]
+    kept = completed_rows(out_path, dataset) if resume else []
+    done = {row["scenario_id"] for row in kept}
+    n_tasks = len(tasks)
+    tasks = [(scenario, part) for scenario, part in tasks if scenario_id(scenario, part, backend, dataset) not in done]
+    print(cf.bold(cf.seaGreen(f"Running {cf.yellow(len(tasks))} solves ({cf.yellow(n_tasks - len(tasks))} already done)")))
+
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    # the kept rows go to a temporary file first, so an interrupted rewrite loses nothing
+    tmp = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        writer.writerows(kept)
+    os.replace(tmp, out_path)
+    with open(out_path, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                 initargs=(data_path, threads, backend, dataset)) as pool:
+            futures = [pool.submit(solve_scenario, scenario, part) for scenario, part in tasks]
+            for n, future in enumerate(as_completed(futures), start=1):
+                row = future.result()
+                writer.writerow(row)
+                f.flush()
+                objective = row.get("objective")
+                shown = "n/a" if objective in (None, "") else f"${objective:,.0f}"
+                print(cf.seaGreen(f"[{n}/{len(tasks)}] {row['scenario_id']} part {row['part']}: ") + cf.bold(cf.yellow(shown)))
+    return out_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve the childcare model over a grid of scenarios")
+    parser.add_argument("data_path")
+    parser.add_argument("scenarios", help="JSON file with a scenario list or a parameter grid")
+    parser.add_argument("out_path", help="CSV results table")
+    parser.add_argument("--parts", type=int, nargs="+", default=[1, 2], choices=[1, 2])
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--threads", type=int, default=1, help="Solver threads per solve")
+    parser.add_argument("--backend", default="gurobi", choices=["gurobi", "highs"],
+                        help="Solver backend (highs needs no license, so every core can run a solve)")
+    parser.add_argument("--resume", action="store_true", help="Skip scenarios already in out_path")
+    args = parser.parse_args()
+
+    scenarios = load_scenarios(args.scenarios)
+    run_sweep(args.data_path, scenarios, args.out_path, tuple(args.parts), args.processes, args.threads, args.resume,
+              args.backend)
+    print(cf.bold(cf.seaGreen(f"Saved results to: {cf.yellow(args.out_path)}")))
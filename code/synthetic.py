@@ -0,0 +1,111 @@
+import argparse
+import os
+import colorful as cf
+import numpy as np
+import pandas as pd
+
+cf.use_style('monokai')
+
+# ZIP range and rough bounding box (lat_min, lat_max, lon_min, lon_max) per state
+STATES = {
+    "NY": {"zips": (10001, 14925), "box": (40.5, 45.0, -79.7, -71.9)},
+    "NJ": {"zips": (7001, 8989), "box": (38.9, 41.3, -75.5, -73.9)},
+    "PA": {"zips": (15001, 19640), "box": (39.7, 42.2, -80.5, -74.7)},
+    "CT": {"zips": (6001, 6928), "box": (41.0, 42.0, -73.7, -71.8)},
+    "MA": {"zips": (1001, 2791), "box": (41.2, 42.9, -73.5, -69.9)},
+}
+
+
+'''
+Distinct zipcodes spread evenly over the states' ZIP ranges
+'''
+def synthetic_zips(n_zips, states, rng):
+    per_state = np.diff(np.linspace(0, n_zips, len(states) + 1).round().astype(int))
+    zips, state_of = [], []
+    for k, (state, n) in enumerate(zip(states, per_state)):
+        lo, hi = STATES[state]["zips"]
+        if n > hi - lo + 1:
+            raise ValueError(f"{state} has only {hi - lo + 1} ZIPs, asked for {n}")
+        zips.append(np.sort(rng.choice(np.arange(lo, hi + 1), size=n, replace=False)))
+        state_of.append(np.full(n, k))
+    return np.concatenate(zips), np.concatenate(state_of)
+
+
+'''
+Write the five input CSVs (same files and columns as ./data) for a synthetic
+multi-state instance. Facility and site counts per ZIP are Poisson around the
+given means; a fraction of ZIPs is left out of the income, employment and
+population tables, like the real files that need the Census fetch.
+'''
+def generate(out_dir, n_zips=2000, facilities_per_zip=8.0, sites_per_zip=6.0, states=("NY",), seed=0,
+             missing_rate=0.02):
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    zips, state_of = synthetic_zips(n_zips, states, rng)
+    boxes = np.array([STATES[s]["box"] for s in states])[state_of]
+    center_lat = rng.uniform(boxes[:, 0], boxes[:, 1])
+    center_lon = rng.uniform(boxes[:, 2], boxes[:, 3])
+    zip_str = np.char.zfill(zips.astype(str), 5)
+
+    # Existing facilities
+    n_fac = rng.poisson(facilities_per_zip, n_zips)
+    fac_zip = np.repeat(np.arange(n_zips), n_fac)
+    total = len(fac_zip)
+    capacity = np.maximum(1, rng.lognormal(np.log(60), 0.8, total).round()).astype(int)
+    infant = np.where(rng.random(total) < 0.4, (capacity * rng.uniform(0, 0.5, total)).round(), 0).astype(int)
+    facility_zip = zip_str[fac_zip].astype(object)
+    plus4 = rng.random(total) < 0.1
+    facility_zip[plus4] = [f"{z}-{rng.integers(1000, 9999)}" for z in facility_zip[plus4]]
+    pd.DataFrame({
+        "facility_id": np.arange(total) + 100000,
+        "facility_name": [f"Facility {k}" for k in range(total)],
+        "zip_code": facility_zip,
+        "total_capacity": capacity,
+        "infant_capacity": np.where(rng.random(total) < 0.05, np.nan, infant),
+        # a True/False column with blanks, which a chunked read must not turn into text
+        "accepts_subsidy": np.where(rng.random(total) < 0.05, None, rng.random(total) < 0.6),
+        "latitude": center_lat[fac_zip] + rng.normal(0, 0.004, total),
+        "longitude": center_lon[fac_zip] + rng.normal(0, 0.004, total),
+    }).to_csv(os.path.join(out_dir, "child_care_regulated.csv"), index=False)
+
+    # Potential locations
+    n_site = 2 + rng.poisson(max(sites_per_zip - 2, 0), n_zips)
+    site_zip = np.repeat(np.arange(n_zips), n_site)
+    pd.DataFrame({
+        "zipcode": zips[site_zip],
+        "latitude": center_lat[site_zip] + rng.normal(0, 0.004, len(site_zip)),
+        "longitude": center_lon[site_zip] + rng.normal(0, 0.004, len(site_zip)),
+    }).to_csv(os.path.join(out_dir, "potential_locations.csv"), index=False)
+
+    # Demographics scaled to the existing capacity so most ZIPs are feasible
+    zip_cap = np.bincount(fac_zip, weights=np.minimum(capacity, 250), minlength=n_zips) + 50
+    children = zip_cap * rng.uniform(1.0, 2.2, n_zips)
+    under5 = (children * rng.uniform(0.2, 0.35, n_zips)).round().astype(int)
+    age5_9 = (children * rng.uniform(0.3, 0.4, n_zips)).round().astype(int)
+    age10_14 = ((children - under5 - age5_9).clip(0) * 5 / 3).round().astype(int)
+    keep = lambda: rng.random(n_zips) >= missing_rate
+    k = keep()
+    pd.DataFrame({"ZIP code": zips[k], "average income": rng.lognormal(np.log(55000), 0.4, n_zips)[k].round(2)}) \
+        .to_csv(os.path.join(out_dir, "avg_individual_income.csv"), index=False)
+    k = keep()
+    pd.DataFrame({"zipcode": zip_str[k], "employment rate": rng.uniform(0.4, 0.8, n_zips)[k].round(3)}) \
+        .to_csv(os.path.join(out_dir, "employment_rate.csv"), index=False)
+    k = keep()
+    pd.DataFrame({"zipcode": zip_str[k], "-5": under5[k], "5-9": age5_9[k], "10-14": age10_14[k]}) \
+        .to_csv(os.path.join(out_dir, "population.csv"), index=False)
+    return {"zips": n_zips, "facilities": int(total), "sites": int(len(site_zip))}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic childcare input CSVs")
+    parser.add_argument("out_dir")
+    parser.add_argument("--zips", type=int, default=2000)
+    parser.add_argument("--facilities", type=float, default=8.0, help="Mean facilities per ZIP")
+    parser.add_argument("--sites", type=float, default=6.0, help="Mean potential sites per ZIP")
+    parser.add_argument("--states", nargs="+", default=["NY"], choices=list(STATES))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    counts = generate(args.out_dir, args.zips, args.facilities, args.sites, tuple(args.states), args.seed)
+    print(cf.bold(cf.seaGreen(f"Wrote {cf.yellow(counts['zips'])} ZIPs, {cf.yellow(counts['facilities'])} facilities, "
+                              f"{cf.yellow(counts['sites'])} sites to: {cf.yellow(args.out_dir)}")))
@@ -1,10 +1,15 @@
-import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
 import numpy as np
 import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import colorful as cf
 
+# pandas, matplotlib and seaborn are imported inside the functions that use them,
+# so importing utils for normalize_zip or the plot settings stays cheap
+
+FULL_DPI = 300
+PREVIEW_DPI = 100
+
 '''
 Ensure zipcode is 5 digits, trim to 5 if longer than 5
 '''
@@ -23,84 +28,171 @@ def normalize_zip(z):
 
 
 '''
-Load data path and make dataframe
+Vectorized normalize_zip over a whole column using pandas string ops
+'''
+def normalize_zip_series(values):
+    s = values.astype(str).str.strip().str[:5]
+    short = s.str.isdigit() & (s.str.len() < 5)
+    s = s.where(~short, s.str.zfill(5))
+    return s.mask(s == "")
+
+
+'''
+Load data path and make dataframe. The zipcode column is always read as a
+string; usecols and dtype restrict and type the remaining columns.
 '''
-def load_csv(path, zip_col):
-    df = pd.read_csv(path)
-    df = df.copy()
-    df[zip_col] = df[zip_col].map(normalize_zip)
+def load_csv(path, zip_col, usecols=None, dtype=None):
+    if usecols is not None and zip_col not in usecols:
+        usecols = [zip_col] + list(usecols)
+    import pandas as pd
+    dtype = {**(dtype or {}), zip_col: str}
+    df = pd.read_csv(path, usecols=usecols, dtype=dtype)
+    df[zip_col] = normalize_zip_series(df[zip_col])
     df = df.dropna(subset=[zip_col])
     return df
 
 
 '''
-Plot distribution for average expansion in zipcode
+load_csv in chunks of chunk_rows rows. Pass the dtypes from infer_csv_dtypes so
+every chunk gets the column types a whole-file read would give. Object columns
+are not forced on read_csv, which would keep their raw text ('True' for a
+bool); each chunk parses them as usual and they are cast to object afterwards.
 '''
-def plot_x_expansion(x, F, bin_size, part2, save_dir="./outputs"):
-    avg_expansions = []
-    zero_count = 0
-
-    for i in F:
-        expansions = [x[f].X for f in F[i]]
-        if all(abs(val) < 1e-6 for val in expansions): 
-            zero_count += 1
-        else:
-            avg_expansion = sum(expansions) / len(expansions)
-            if avg_expansion > 1e-6:
-                avg_expansions.append(avg_expansion)
-
-    max_val = max(avg_expansions) if avg_expansions else 0
-    bins = np.arange(1, max_val + bin_size, bin_size)  
-    labels = [f"{int(b)}–{int(b + bin_size - 1)}" for b in bins[:-1]]
+def iter_csv(path, zip_col, chunk_rows, usecols=None, dtype=None):
+    if usecols is not None and zip_col not in usecols:
+        usecols = [zip_col] + list(usecols)
+    import pandas as pd
+    objects = [col for col, dt in (dtype or {}).items() if dt == object and col != zip_col]
+    dtype = {**{col: dt for col, dt in (dtype or {}).items() if col not in objects}, zip_col: str}
+    with pd.read_csv(path, usecols=usecols, dtype=dtype, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            chunk[zip_col] = normalize_zip_series(chunk[zip_col])
+            if objects:
+                chunk[objects] = chunk[objects].astype(object)
+            yield chunk.dropna(subset=[zip_col])
 
-    df = pd.DataFrame({"avg_expansion": avg_expansions})
-    df["bin"] = pd.cut(df["avg_expansion"], bins=bins, labels=labels, include_lowest=True)
-    grouped = df["bin"].value_counts().sort_index()
-    grouped = pd.concat([pd.Series({"0": zero_count}), grouped])
 
-    plt.figure(figsize=(10, 7))
-    sns.barplot(x=grouped.index, y=grouped.values, color="seagreen")
-    plt.title("Average Expansion per Zipcode", fontsize=15, fontweight="bold")
-    plt.xlabel("Average Expansion Range (slots)", fontsize=12)
-    plt.ylabel("Number of Zipcodes", fontsize=12)
-    plt.xticks(rotation=45, ha="right")
+def _merge_dtypes(a, b):
+    if a == b:
+        return a
+    if a.kind in "iuf" and b.kind in "iuf":
+        return np.result_type(a, b)
+    return np.dtype(object)
 
-    for idx, value in enumerate(grouped.values):
-        plt.text(idx, value + max(grouped.values) * 0.01, str(int(value)),
-                 ha='center', va='bottom', fontsize=10, color='black', fontweight='medium')
 
-    plt.tight_layout()
-    os.makedirs(save_dir, exist_ok=True)
+'''
+Column dtypes of a whole-file pd.read_csv, found in one chunked pass: a column
+that parses as int in one chunk and float in another is float, any other mix
+(such as bool and blank) is object
+'''
+def infer_csv_dtypes(path, zip_col, chunk_rows, usecols=None):
+    if usecols is not None and zip_col not in usecols:
+        usecols = [zip_col] + list(usecols)
+    import pandas as pd
+    dtypes = {}
+    # rows without a zipcode are dropped later but still count here, as in a full read
+    with pd.read_csv(path, usecols=usecols, dtype={zip_col: str}, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            for col, dt in chunk.dtypes.items():
+                if col != zip_col:
+                    dtypes[col] = _merge_dtypes(dtypes[col], dt) if col in dtypes else dt
+    return dtypes
+
+
+'''
+Pull everything the result plots need out of a solved model in a few bulk
+attribute queries, as plain NumPy arrays that are cheap to send to workers
+'''
+def solution_snapshot(zipcodes, m, variables, costs, FACILITY_TYPES, part2):
+    builds = variables["y_site"] if part2 else variables["y"]
+
+    def values(name, keys):
+        return np.array(m.getAttr("X", [variables[name][key] for key in keys])) if keys else np.zeros(0)
+
+    return _snapshot(zipcodes, variables["x"], list(builds), values, [c.getValue() for c in costs],
+                     FACILITY_TYPES, part2)
+
+
+'''
+The same arrays from a solution given as {variable name: value}, such as the
+combined per-zipcode solves of optimize.optimize_decomposed
+'''
+def values_snapshot(zipcodes, solution, costs, FACILITY_TYPES, part2):
+    zips = zipcodes.get_complete_data()
+    facilities = {f for i in zips for f in zipcodes.get_facility_ids(i) if f"x[{f}]" in solution}
     if part2:
-        save_path = os.path.join(save_dir, "avg_expansion_2.png")
+        build_keys = [(i, l, s) for i in zips for l in range(zipcodes.get_site_count(i))
+                      for s in FACILITY_TYPES]
     else:
-        save_path = os.path.join(save_dir, "avg_expansion_1.png")
-    plt.savefig(save_path, dpi=300)
-    plt.close()
+        build_keys = [(i, s) for i in zips for s in FACILITY_TYPES]
+
+    def values(name, keys):
+        # facilities are keyed by name, builds by (zipcode, [site,] size); unsolved ones count as 0
+        names = [f"{name}[{','.join(map(str, key))}]" if isinstance(key, tuple) else f"{name}[{key}]" for key in keys]
+        return np.array([solution.get(n, 0.0) for n in names], dtype=float)
+
+    return _snapshot(zipcodes, facilities, build_keys, values, costs, FACILITY_TYPES, part2)
 
 
 '''
-Plot distribution for average age 0 - 5 expansion in zipcode
+Snapshot arrays for the facilities and build keys of a solution, with
+values(variable family, keys) reading the solution values
 '''
-def plot_u_expansion(u, bin_size, part2, save_dir="./outputs"):
-    u_values = [var.X for var in u.values()]
-    zero_count = sum(1 for val in u_values if abs(val) < 1e-6)
-    u_values = [val for val in u_values if val > 1e-6]
+def _snapshot(zipcodes, facilities, build_keys, values, costs, FACILITY_TYPES, part2):
+    zip_list = sorted(zipcodes.get_complete_data())
+    fac_keys, fac_zip = [], []
+    for k, i in enumerate(zip_list):
+        for f in zipcodes.get_facility_ids(i):
+            if f in facilities:
+                fac_keys.append(f)
+                fac_zip.append(k)
+    zip_pos = {i: k for k, i in enumerate(zip_list)}
+
+    # New slots per zipcode, from per-site builds in Part 2 and per-zipcode builds in Part 1
+    build_keys = [key for key in build_keys if key[0] in zip_pos]
+    build_vals = values("y_site" if part2 else "y", build_keys)
+    build_zip = np.array([zip_pos[key[0]] for key in build_keys], dtype=np.int64)
+    build_cap = np.array([FACILITY_TYPES[key[-1]]["Cap"] for key in build_keys], dtype=float)
+
+    return {
+        "part2": part2,
+        "zips": np.array(zip_list),
+        "facility_zip": np.array(fac_zip, dtype=np.int64),
+        "x": values("x", fac_keys),
+        "u": values("u", fac_keys),
+        "new_slots": np.bincount(build_zip, weights=build_vals * build_cap, minlength=len(zip_list)),
+        "costs": np.array(costs, dtype=float),
+    }
 
-    max_val = max(u_values) if u_values else 0
+
+def _pyplot():
+    # Figures are only ever written to files, so never start a GUI backend
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    return plt, sns
+
+
+def _binned_counts(values, zero_count, bin_size):
+    import pandas as pd
+    max_val = max(values) if len(values) else 0
     bins = np.arange(1, max_val + bin_size, bin_size)  # start from 1
     labels = [f"{int(b)}–{int(b + bin_size - 1)}" for b in bins[:-1]]
 
-    df = pd.DataFrame({"u_value": u_values})
-    df["bin"] = pd.cut(df["u_value"], bins=bins, labels=labels, include_lowest=True)
+    df = pd.DataFrame({"value": values})
+    df["bin"] = pd.cut(df["value"], bins=bins, labels=labels, include_lowest=True)
     grouped = df["bin"].value_counts().sort_index()
-    grouped = pd.concat([pd.Series({"0": zero_count}), grouped])
+    return pd.concat([pd.Series({"0": zero_count}), grouped])
+
 
+def _bar_counts(grouped, title, xlabel, ylabel, save_path, dpi):
+    plt, sns = _pyplot()
     plt.figure(figsize=(10, 7))
     sns.barplot(x=grouped.index, y=grouped.values, color="seagreen")
-    plt.title("0–5 Expansion Slots per Facility", fontsize=15, fontweight="bold")
-    plt.xlabel("0–5 Expansion Range (slots)", fontsize=12)
-    plt.ylabel("Number of Facilities", fontsize=12)
+    plt.title(title, fontsize=15, fontweight="bold")
+    plt.xlabel(xlabel, fontsize=12)
+    plt.ylabel(ylabel, fontsize=12)
     plt.xticks(rotation=45, ha="right")
 
     for idx, value in enumerate(grouped.values):
@@ -108,28 +200,55 @@ def plot_u_expansion(u, bin_size, part2, save_dir="./outputs"):
                  ha='center', va='bottom', fontsize=10, color='black', fontweight='medium')
 
     plt.tight_layout()
-    os.makedirs(save_dir, exist_ok=True)
-    if part2:
-        save_path = os.path.join(save_dir, "u_expansion_2.png")
-    else:
-        save_path = os.path.join(save_dir, "u_expansion_1.png")
-    plt.savefig(save_path, dpi=300)
+    plt.savefig(save_path, dpi=dpi)
     plt.close()
 
 
+'''
+Plot distribution for average expansion in zipcode
+'''
+def plot_x_expansion(snapshot, bin_size, save_dir="./outputs", dpi=FULL_DPI):
+    n_zips = len(snapshot["zips"])
+    counts = np.bincount(snapshot["facility_zip"], minlength=n_zips)
+    sums = np.bincount(snapshot["facility_zip"], weights=snapshot["x"], minlength=n_zips)
+    nonzero = np.bincount(snapshot["facility_zip"], weights=np.abs(snapshot["x"]) >= 1e-6, minlength=n_zips)
+    # zipcodes without facilities or without any expansion count as 0
+    zero_count = int(np.sum(nonzero == 0))
+    avg = sums[nonzero > 0] / counts[nonzero > 0]
+    avg_expansions = avg[avg > 1e-6]
+
+    os.makedirs(save_dir, exist_ok=True)
+    save_path = os.path.join(save_dir, f"avg_expansion_{2 if snapshot['part2'] else 1}.png")
+    _bar_counts(_binned_counts(avg_expansions, zero_count, bin_size), "Average Expansion per Zipcode",
+                "Average Expansion Range (slots)", "Number of Zipcodes", save_path, dpi)
+
+
+'''
+Plot distribution for average age 0 - 5 expansion in zipcode
+'''
+def plot_u_expansion(snapshot, bin_size, save_dir="./outputs", dpi=FULL_DPI):
+    u_values = snapshot["u"]
+    zero_count = int(np.sum(np.abs(u_values) < 1e-6))
+    u_values = u_values[u_values > 1e-6]
+
+    os.makedirs(save_dir, exist_ok=True)
+    save_path = os.path.join(save_dir, f"u_expansion_{2 if snapshot['part2'] else 1}.png")
+    _bar_counts(_binned_counts(u_values, zero_count, bin_size), "0–5 Expansion Slots per Facility",
+                "0–5 Expansion Range (slots)", "Number of Facilities", save_path, dpi)
+
+
 '''
 Cost breakdown for the optimal budget
 '''
-def plot_cost_breakdown(m, expansion_cost, new_build_cost, equip_cost, part2, save_dir="./outputs"):
-    import os
+def plot_cost_breakdown(snapshot, bin_size=None, save_dir="./outputs", dpi=FULL_DPI):
     import pandas as pd
-    import seaborn as sns
-    import matplotlib.pyplot as plt
+    plt, sns = _pyplot()
+    part2 = snapshot["part2"]
 
     os.makedirs(save_dir, exist_ok=True)
     df = pd.DataFrame({
         "Category": ["Expansion", "New Builds", "Equipment"],
-        "Cost": [expansion_cost.getValue(), new_build_cost.getValue(), equip_cost.getValue()]
+        "Cost": snapshot["costs"],
     })
 
     plt.figure(figsize=(10, 7))
@@ -149,45 +268,19 @@ def plot_cost_breakdown(m, expansion_cost, new_build_cost, equip_cost, part2, sa
 
     plt.tight_layout(pad=2)
     save_path = os.path.join(save_dir, f"cost_breakdown_{'part2' if part2 else 'part1'}.png")
-    plt.savefig(save_path, dpi=300)
+    plt.savefig(save_path, dpi=dpi)
     plt.close()
 
 
 """
 Plot newly added and expanded slots by ZIP code.
 """
-def plot_added_capacity_by_zip(zipcodes, x, y, FACILITY_TYPES, part2):
-    if part2:
-        save_path="./outputs/added_capacity_by_zip_2.png"
-    else:
-        save_path="./outputs/added_capacity_by_zip_1.png"
-    zip_list = sorted(list(zipcodes.get_complete_data()))
-    expanded_slots, new_slots = [], []
-
-    for i in zip_list:
-        exp_sum = 0.0
-        for f in zipcodes.data[i]["childcare_dict"]:
-            val = x.get(f, 0)
-            try:
-                exp_sum += float(val.X)
-            except AttributeError:
-                exp_sum += float(val)
-        expanded_slots.append(exp_sum)
-
-        new_sum = 0.0
-        for s in ["S", "M", "L"]:
-            key = (i, s)
-            if key in y:
-                val = y[key]
-                try:
-                    numeric_val = float(val.X)
-                except AttributeError:
-                    try:
-                        numeric_val = float(val.getValue()) 
-                    except Exception:
-                        numeric_val = 0.0
-                new_sum += numeric_val * FACILITY_TYPES[s]["Cap"]
-        new_slots.append(new_sum)
+def plot_added_capacity_by_zip(snapshot, bin_size=None, save_dir="./outputs", dpi=FULL_DPI):
+    plt, _ = _pyplot()
+    save_path = os.path.join(save_dir, f"added_capacity_by_zip_{2 if snapshot['part2'] else 1}.png")
+    zip_list = snapshot["zips"]
+    expanded_slots = np.bincount(snapshot["facility_zip"], weights=snapshot["x"], minlength=len(zip_list))
+    new_slots = snapshot["new_slots"]
 
     indices = np.arange(len(zip_list))
     bar_width = 0.4
@@ -204,6 +297,45 @@ def plot_added_capacity_by_zip(zipcodes, x, y, FACILITY_TYPES, part2):
     plt.legend()
     plt.grid(axis="y", linestyle="--", alpha=0.7)
     plt.tight_layout()
-    plt.savefig(save_path, dpi=300)
+    os.makedirs(save_dir, exist_ok=True)
+    plt.savefig(save_path, dpi=dpi)
     plt.close()
 
+
+PLOTS = (plot_x_expansion, plot_u_expansion, plot_cost_breakdown, plot_added_capacity_by_zip)
+
+
+def _warm_up():
+    _pyplot()
+
+
+def _render(plot, snapshot, bin_size, save_dir, dpi):
+    plot(snapshot, bin_size, save_dir=save_dir, dpi=dpi)
+    return plot.__name__
+
+
+class PlotRenderer:
+    '''
+    Renders the result figures in background worker processes. submit()
+    returns as soon as the figures are queued, so the next solve can start
+    while they are drawn; close() waits for them and re-raises any failure.
+    '''
+    def __init__(self, processes=None, dpi=FULL_DPI, save_dir="./outputs"):
+        self.dpi = dpi
+        self.save_dir = save_dir
+        self.futures = []
+        processes = processes or min(len(PLOTS), os.cpu_count() or 1)
+        self.pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+        # start the workers and import matplotlib in them right away
+        for _ in range(processes):
+            self.pool.submit(_warm_up)
+
+    def submit(self, snapshot, bin_size):
+        for plot in PLOTS:
+            self.futures.append(self.pool.submit(_render, plot, snapshot, bin_size, self.save_dir, self.dpi))
+
+    def close(self):
+        try:
+            return [future.result() for future in self.futures]
+        finally:
+            self.pool.shutdown()
@@ -4,5 +4,18 @@ set -e
 # Run optimization based on data path
 BIN_SIZE=20
 DATA_PATH="./outputs/zipcodes_filled_1.json"
+# true: plots at 300 dpi | preview: plots at 100 dpi | false: no plots
 PLOT_ON=false
-python ./code/optimize.py "$DATA_PATH" $BIN_SIZE $PLOT_ON
\ No newline at end of file
+# monolithic: one model for the whole state | matrix: same model built with the matrix API
+# decomposed: one model per zipcode, solved in parallel | compare: check matrix vs loop builder
+# session: one shared model for both parts, Part 2 warm-started from Part 1
+# bigm: Part 1 trigger as tight big-M rows | trigger-bench: indicator vs big-M benchmark
+# conflict-bench: Part 2 with pairwise vs clique conflict rows
+# heuristic: monolithic, warm-started from the greedy plan in code/heuristic.py
+# anytime: stop at TIME_LIMIT seconds or MIP_GAP, streaming incumbents to ./outputs/incumbents
+MODE=monolithic
+# Solve budget for both parts in seconds and target gap; empty runs to optimality (anytime: 600 and 0.01)
+TIME_LIMIT=
+MIP_GAP=
+python ./code/cli.py optimize "$DATA_PATH" --bin-size $BIN_SIZE --plot $PLOT_ON --mode $MODE \
+    ${TIME_LIMIT:+--time-limit $TIME_LIMIT} ${MIP_GAP:+--mip-gap $MIP_GAP}
\ No newline at end of file
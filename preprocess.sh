@@ -6,6 +6,7 @@ set -e
 
 # Create dataset
 OUT_PATH="./outputs/zipcodes_partial.json"
-python ./code/create_zipcodes.py "$OUT_PATH"
+python ./code/cli.py build "$OUT_PATH"
 OUT_PATH2="./outputs/zipcodes_filled_1.json"
-python ./code/fetch_data_api.py "$OUT_PATH" "$OUT_PATH2"
\ No newline at end of file
+COLUMNAR_PATH="./outputs/zipcodes_filled_1.columnar"
+python ./code/cli.py fetch "$OUT_PATH" "$OUT_PATH2" "$COLUMNAR_PATH"
\ No newline at end of file
@@ -6,12 +6,13 @@ set -e
 
 # Create dataset
 OUT_PATH="./outputs/zipcodes_partial.json"
-python ./code/create_zipcodes.py "$OUT_PATH"
+python ./code/cli.py build "$OUT_PATH"
 OUT_PATH2="./outputs/zipcodes_filled_1.json"
-python ./code/fetch_data_api.py "$OUT_PATH" "$OUT_PATH2"
+COLUMNAR_PATH="./outputs/zipcodes_filled_1.columnar"
+python ./code/cli.py fetch "$OUT_PATH" "$OUT_PATH2" "$COLUMNAR_PATH"
 
 # Run Optimization
 BIN_SIZE=20
 DATA_PATH="./outputs/zipcodes_partial.json"
 PLOT_ON=false
-python ./code/optimize.py "$DATA_PATH" $BIN_SIZE $PLOT_ON
\ No newline at end of file
+python ./code/cli.py optimize "$DATA_PATH" --bin-size $BIN_SIZE --plot $PLOT_ON
\ No newline at end of file